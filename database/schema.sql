@@ -30,7 +30,11 @@ CREATE TABLE IF NOT EXISTS fingerprints (
     finger_name VARCHAR(50) NOT NULL COMMENT 'Tên ngón tay: Thumb, Index, Middle, Ring, Pinky, etc',
     hand ENUM('Left', 'Right') NOT NULL COMMENT 'Tay trái hay tay phải',
     minutiae_data JSON COMMENT 'Minutiae features (endings, bifurcations)',
-    binary_image_data LONGBLOB COMMENT 'Binary image for feature extraction',
+    binary_image_data LONGBLOB COMMENT 'Binary image for feature extraction (database/ma_hoa_anh.py: packbits)',
+    feature_data LONGBLOB COMMENT 'SIFT/ORB descriptors (so_khop_van_tay.ma_hoa_mo_ta)',
+    lbp_data MEDIUMBLOB COMMENT 'LBP histogram descriptor',
+    ridge_data MEDIUMBLOB COMMENT 'Ridge orientation field descriptor',
+    frequency_data MEDIUMBLOB COMMENT 'Frequency domain descriptor',
     quality_score FLOAT,
     captured_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     status ENUM('approved', 'pending', 'rejected') DEFAULT 'approved',
@@ -77,4 +81,5 @@ INSERT INTO system_settings (setting_key, setting_value, setting_type, descripti
 ('histogram_threshold', '50', 'float', 'Ngưỡng cho Histogram Matching'),
 ('feature_threshold', '50', 'float', 'Ngưỡng cho Feature Matching'),
 ('max_results', '5', 'int', 'Số lượng kết quả tối đa trả về'),
-('default_matching_method', 'comprehensive', 'string', 'Phương pháp so khớp mặc định');
+('default_matching_method', 'comprehensive', 'string', 'Phương pháp so khớp mặc định'),
+('identification_workers', '0', 'int', 'Số tiến trình so khớp minutiae 1:N song song (0 = theo số CPU, 1 = tuần tự)');
@@ -0,0 +1,92 @@
+-- Schema SQLite cho hệ thống nhận dạng vân tay (tương đương schema.sql của MySQL)
+-- Được tạo tự động bởi src/database/sqlite_manager.py khi mở file database mới
+
+-- Table người dùng
+CREATE TABLE IF NOT EXISTS users (
+    user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    username TEXT NOT NULL UNIQUE COLLATE NOCASE,
+    full_name TEXT NOT NULL,
+    email TEXT,
+    phone TEXT,
+    address TEXT,
+    date_of_birth DATE,
+    gender TEXT CHECK (gender IN ('Nam', 'Nữ', 'Khác')),
+    identification_number TEXT,
+    position TEXT,
+    department TEXT,
+    created_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    status TEXT DEFAULT 'active' CHECK (status IN ('active', 'inactive')),
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_identification ON users (identification_number);
+
+-- ON UPDATE CURRENT_TIMESTAMP của MySQL
+CREATE TRIGGER IF NOT EXISTS users_updated_at AFTER UPDATE ON users
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE users SET updated_at = datetime('now', 'localtime') WHERE user_id = NEW.user_id;
+END;
+
+-- Table vân tay
+CREATE TABLE IF NOT EXISTS fingerprints (
+    fingerprint_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER NOT NULL REFERENCES users (user_id) ON DELETE CASCADE,
+    finger_name TEXT NOT NULL COLLATE NOCASE,          -- Tên ngón tay: Thumb, Index, Middle, Ring, Pinky, etc
+    hand TEXT NOT NULL CHECK (hand IN ('Left', 'Right')),
+    minutiae_data TEXT,                                -- Minutiae features (JSON)
+    binary_image_data BLOB,                            -- database/ma_hoa_anh.py: packbits
+    feature_data BLOB,                                 -- SIFT/ORB descriptors
+    lbp_data BLOB,                                     -- LBP histogram descriptor
+    ridge_data BLOB,                                   -- Ridge orientation field descriptor
+    frequency_data BLOB,                               -- Frequency domain descriptor
+    quality_score REAL,
+    captured_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    status TEXT DEFAULT 'approved' CHECK (status IN ('approved', 'pending', 'rejected')),
+    notes TEXT,
+    UNIQUE (user_id, finger_name, hand)
+);
+CREATE INDEX IF NOT EXISTS idx_fingerprints_finger_hand ON fingerprints (finger_name, hand);
+
+-- Table lịch sử so khớp
+CREATE TABLE IF NOT EXISTS matching_history (
+    match_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id INTEGER REFERENCES users (user_id) ON DELETE SET NULL,
+    fingerprint_id INTEGER REFERENCES fingerprints (fingerprint_id) ON DELETE SET NULL,
+    query_image_path TEXT,
+    matching_method TEXT,
+    similarity_score REAL,
+    is_match BOOLEAN,
+    matched_at TIMESTAMP DEFAULT (datetime('now', 'localtime')),
+    notes TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_matching_history_user_id ON matching_history (user_id);
+CREATE INDEX IF NOT EXISTS idx_matching_history_matched_at ON matching_history (matched_at);
+
+-- Table cấu hình hệ thống
+CREATE TABLE IF NOT EXISTS system_settings (
+    setting_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    setting_key TEXT NOT NULL UNIQUE,
+    setting_value TEXT,
+    setting_type TEXT,
+    description TEXT,
+    updated_at TIMESTAMP DEFAULT (datetime('now', 'localtime'))
+);
+
+CREATE TRIGGER IF NOT EXISTS system_settings_updated_at AFTER UPDATE ON system_settings
+FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at
+BEGIN
+    UPDATE system_settings SET updated_at = datetime('now', 'localtime') WHERE setting_id = NEW.setting_id;
+END;
+
+-- Một số cài đặt mặc định (bỏ qua nếu đã có)
+INSERT OR IGNORE INTO system_settings (setting_key, setting_value, setting_type, description) VALUES
+('matching_threshold', '70', 'float', 'Ngưỡng điểm tương đồng để coi là khớp (0-100)'),
+('template_matching_threshold', '50', 'float', 'Ngưỡng cho Template Matching'),
+('ssim_threshold', '50', 'float', 'Ngưỡng cho SSIM'),
+('contour_threshold', '50', 'float', 'Ngưỡng cho Contour Matching'),
+('histogram_threshold', '50', 'float', 'Ngưỡng cho Histogram Matching'),
+('feature_threshold', '50', 'float', 'Ngưỡng cho Feature Matching'),
+('max_results', '5', 'int', 'Số lượng kết quả tối đa trả về'),
+('default_matching_method', 'comprehensive', 'string', 'Phương pháp so khớp mặc định'),
+('identification_workers', '0', 'int', 'Số tiến trình so khớp minutiae 1:N song song (0 = theo số CPU, 1 = tuần tự)');
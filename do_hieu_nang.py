@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Script đo hiệu năng - so sánh các bản tối ưu với bản gốc
+Kiểm tra kết quả giống hệt nhau và in ra tốc độ tăng
+"""
+
+import contextlib
+import glob
+import io
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline
+from lam_manh.lam_manh_anh import (
+    lam_manh_zhang_suen_optimize, lam_manh_zhang_suen_tung_pixel
+)
+from so_khop.so_khop_van_tay import so_khop_minutiae, so_khop_minutiae_tung_cap
+from tien_xu_ly.tang_cuong import ap_dung_gabor_filter
+from trich_dac_trung.trich_dac_trung_chi_tiet import (
+    phan_loai_minutiae, phan_loai_minutiae_tung_pixel, trich_minutiae_chi_tiet,
+    trich_lbp_features, trich_lbp_features_tung_pixel,
+    trich_ridge_orientation_field, trich_ridge_orientation_field_tung_khoi
+)
+
+# Bản gốc của một số thuật toán rất chậm, chỉ đo trên ảnh nhỏ
+KICH_THUOC_TOI_DA_BAN_CHAM = 300 * 300
+
+# Gabor theo_huong được coi là tương đương toan_anh khi tỷ lệ điểm trắng sau
+# nhị phân hóa lệch không quá 10 điểm phần trăm và số minutiae không ít hơn
+# một nửa (nhiều hơn là bình thường: toan_anh làm mất vân ở vùng ảnh mờ)
+LECH_NHI_PHAN_TOI_DA = 0.10
+TY_LE_MINUTIAE_TOI_THIEU = 0.5
+
+
+def _do_thoi_gian(ham, *args, so_lan=3):
+    """Chạy hàm nhiều lần (ẩn log), trả về (kết quả, thời gian tốt nhất tính bằng giây)"""
+    tot_nhat = float('inf')
+    ket_qua = None
+    for _ in range(so_lan):
+        with contextlib.redirect_stdout(io.StringIO()):
+            bat_dau = time.perf_counter()
+            ket_qua = ham(*args)
+            tot_nhat = min(tot_nhat, time.perf_counter() - bat_dau)
+    return ket_qua, tot_nhat
+
+
+def _in_ket_qua(ten, giong_nhau, t_cu, t_moi):
+    """In một dòng kết quả đo"""
+    trang_thai = "GIỐNG" if giong_nhau else "KHÁC"
+    print(f"  {ten:<32} {trang_thai:<6} cũ: {t_cu * 1000:9.2f} ms  "
+          f"mới: {t_moi * 1000:8.2f} ms  x{t_cu / max(t_moi, 1e-9):.1f}")
+    return giong_nhau
+
+
+def do_phan_loai_minutiae(danh_sach_anh):
+    """So sánh phan_loai_minutiae (bảng tra) với bản duyệt từng pixel"""
+    print("Phân loại minutiae (Crossing Number + Neighbor Count):")
+    tat_ca_giong = True
+    for ten, anh in danh_sach_anh:
+        cu, t_cu = _do_thoi_gian(phan_loai_minutiae_tung_pixel, anh, so_lan=1)
+        moi, t_moi = _do_thoi_gian(phan_loai_minutiae, anh)
+        tat_ca_giong &= _in_ket_qua(ten, cu == moi, t_cu, t_moi)
+    return tat_ca_giong
+
+
+def do_lam_manh_zhang_suen(danh_sach_anh):
+    """So sánh Zhang-Suen bảng tra với bản duyệt từng pixel"""
+    print("Làm mảnh Zhang-Suen:")
+    tat_ca_giong = True
+    for ten, anh in danh_sach_anh:
+        if anh.size > KICH_THUOC_TOI_DA_BAN_CHAM:
+            continue
+        anh_nhi_phan = np.where(anh > 127, 255, 0).astype(np.uint8)
+        cu, t_cu = _do_thoi_gian(lam_manh_zhang_suen_tung_pixel, anh_nhi_phan, so_lan=1)
+        moi, t_moi = _do_thoi_gian(lam_manh_zhang_suen_optimize, anh_nhi_phan)
+        tat_ca_giong &= _in_ket_qua(ten, np.array_equal(cu, moi), t_cu, t_moi)
+    return tat_ca_giong
+
+
+def do_trich_lbp(danh_sach_anh):
+    """So sánh LBP trên ảnh dịch chuyển với bản duyệt từng pixel"""
+    print("Trích LBP (radius=1, n_points=8):")
+    tat_ca_giong = True
+    for ten, anh in danh_sach_anh:
+        if anh.size > KICH_THUOC_TOI_DA_BAN_CHAM:
+            continue
+        cu, t_cu = _do_thoi_gian(trich_lbp_features_tung_pixel, anh, so_lan=1)
+        moi, t_moi = _do_thoi_gian(trich_lbp_features, anh)
+        giong_nhau = (np.array_equal(cu['lbp_image'], moi['lbp_image']) and
+                      cu['lbp_histogram'] == moi['lbp_histogram'])
+        tat_ca_giong &= _in_ket_qua(ten, giong_nhau, t_cu, t_moi)
+    return tat_ca_giong
+
+
+def do_ridge_orientation(danh_sach_anh):
+    """So sánh orientation field theo mảng khối với bản duyệt từng khối"""
+    print("Ridge Orientation Field (block_size=16):")
+    tat_ca_giong = True
+    for ten, anh in danh_sach_anh:
+        cu, t_cu = _do_thoi_gian(trich_ridge_orientation_field_tung_khoi, anh)
+        moi, t_moi = _do_thoi_gian(trich_ridge_orientation_field, anh)
+        giong_nhau = (np.allclose(cu['orientation_field'], moi['orientation_field']) and
+                      np.allclose(cu['consistency_values'], moi['consistency_values']))
+        tat_ca_giong &= _in_ket_qua(ten, giong_nhau, t_cu, t_moi)
+    return tat_ca_giong
+
+
+def do_so_khop_minutiae(danh_sach_anh, so_minutiae=150):
+    """So sánh so khớp minutiae bằng ma trận điểm với bản duyệt từng cặp"""
+    print(f"So khớp minutiae (tối đa {so_minutiae} điểm mỗi ảnh):")
+    tap_minutiae = []
+    for ten, anh in danh_sach_anh:
+        with contextlib.redirect_stdout(io.StringIO()):
+            minutiae = trich_minutiae_chi_tiet(anh)
+        # Bản gốc O(n*m) lời gọi Python nên chỉ lấy một phần minutiae
+        tap_minutiae.append((ten, {loai: minutiae[loai][:so_minutiae // 2]
+                                   for loai in ('endings', 'bifurcations')}))
+    
+    tat_ca_giong = True
+    truy_van = tap_minutiae[0][1]
+    for ten, minutiae in tap_minutiae:
+        cu, t_cu = _do_thoi_gian(so_khop_minutiae_tung_cap, truy_van, minutiae, so_lan=1)
+        moi, t_moi = _do_thoi_gian(so_khop_minutiae, truy_van, minutiae)
+        giong_nhau = (cu['match_count'] == moi['match_count'] and
+                      cu['similarity_score'] == moi['similarity_score'])
+        tat_ca_giong &= _in_ket_qua(ten, giong_nhau, t_cu, t_moi)
+    return tat_ca_giong
+
+
+def do_gabor_theo_huong(danh_sach_anh):
+    """So sánh Gabor theo_huong với toan_anh: thời gian tăng cường, ảnh nhị phân và minutiae"""
+    print("Gabor theo_huong (so với toan_anh, cả chuỗi xử lý tới minutiae):")
+    tat_ca_giong = True
+    for ten, anh in danh_sach_anh:
+        ket_qua = {}
+        for che_do in ('toan_anh', 'theo_huong'):
+            pipeline = FingerprintPipeline({'gabor_mode': che_do}, cache=False)
+            with contextlib.redirect_stdout(io.StringIO()):
+                kq = pipeline.run(anh, stages=('minutiae',))
+            _, thoi_gian = _do_thoi_gian(ap_dung_gabor_filter, kq['anh_loc'], 21, 6, che_do)
+            ket_qua[che_do] = (np.mean(kq['anh_nhi_phan'] > 0), len(kq['minutiae']['endings']),
+                               len(kq['minutiae']['bifurcations']), thoi_gian)
+        
+        (trang_cu, end_cu, bif_cu, t_cu), (trang_moi, end_moi, bif_moi, t_moi) = ket_qua.values()
+        tuong_duong = (abs(trang_moi - trang_cu) <= LECH_NHI_PHAN_TOI_DA and
+                       end_moi + bif_moi >= TY_LE_MINUTIAE_TOI_THIEU * (end_cu + bif_cu))
+        tat_ca_giong &= _in_ket_qua(ten, tuong_duong, t_cu, t_moi)
+        print(f"    điểm trắng {trang_cu:6.1%} -> {trang_moi:6.1%}  "
+              f"ending {end_cu} -> {end_moi}  bifurcation {bif_cu} -> {bif_moi}")
+    return tat_ca_giong
+
+
+def _tai_anh(thu_muc):
+    """Đọc các ảnh xám trong thư mục, thêm một ảnh tổng hợp 500x500"""
+    danh_sach = []
+    for duong_dan in sorted(glob.glob(os.path.join(thu_muc, '*.jpg'))):
+        anh = cv2.imread(duong_dan, cv2.IMREAD_GRAYSCALE)
+        if anh is not None:
+            danh_sach.append((os.path.basename(duong_dan), anh))
+
+    if danh_sach:
+        anh_lon = cv2.resize(danh_sach[0][1], (500, 500), interpolation=cv2.INTER_NEAREST)
+        danh_sach.append(("500x500 (phóng to)", anh_lon))
+    return danh_sach
+
+
+def main():
+    """Chạy tất cả các phép đo"""
+    goc = os.path.dirname(os.path.abspath(__file__))
+    anh_lam_manh = _tai_anh(os.path.join(goc, 'data', 'anh_lam_manh'))
+    anh_nhi_phan = _tai_anh(os.path.join(goc, 'data', 'anh_nhi_phan'))
+    anh_xam = _tai_anh(os.path.join(goc, 'data', 'anh_xam'))
+    anh_goc = _tai_anh(os.path.join(goc, 'data', 'anh_goc'))
+
+    if not anh_lam_manh or not anh_nhi_phan or not anh_xam or not anh_goc:
+        print("Không tìm thấy ảnh trong thư mục data/")
+        return False
+
+    ok = do_phan_loai_minutiae(anh_lam_manh)
+    ok &= do_lam_manh_zhang_suen(anh_nhi_phan)
+    ok &= do_trich_lbp(anh_nhi_phan)
+    ok &= do_ridge_orientation(anh_xam)
+    ok &= do_so_khop_minutiae(anh_lam_manh)
+    ok &= do_gabor_theo_huong(anh_goc)
+
+    print("\nKết quả:", "Tất cả giống bản gốc" if ok else "CÓ SAI KHÁC so với bản gốc")
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if main() else 1)
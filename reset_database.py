@@ -1,14 +1,39 @@
 #!/usr/bin/env python3
 """
 Script để reset database - xóa và tạo lại với schema mới
+
+    python reset_database.py                              # MySQL
+    python reset_database.py --sqlite data/xla_vantay.db  # file SQLite
 """
 
-import mysql.connector
+import argparse
 import os
 import sys
 
+def reset_sqlite_database(path):
+    """Xóa và tạo lại file database SQLite"""
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src'))
+    from database.sqlite_manager import SQLiteDatabaseManager
+    
+    print(f"Xóa database cũ {path} (nếu tồn tại)...")
+    # File WAL và shared memory đi kèm cũng phải xóa
+    for duong_dan in (path, path + '-wal', path + '-shm'):
+        if os.path.exists(duong_dan):
+            os.remove(duong_dan)
+    
+    print("Tạo database mới...")
+    db = SQLiteDatabaseManager(path)
+    if not db.connect():
+        return False
+    db.disconnect()
+    
+    print("Database đã được reset thành công!")
+    print("Bây giờ bạn có thể đăng ký người dùng mới với tất cả features")
+    return True
+
 def reset_database():
     """Xóa và tạo lại database"""
+    import mysql.connector
     try:
         # Kết nối MySQL
         print("🔌 Kết nối MySQL...")
@@ -79,6 +104,9 @@ def reset_database():
             pass
 
 if __name__ == '__main__':
-    success = reset_database()
+    parser = argparse.ArgumentParser(description="Xóa và tạo lại database")
+    parser.add_argument('--sqlite', metavar='PATH', help="Reset file SQLite thay cho database MySQL")
+    args = parser.parse_args()
+    success = reset_sqlite_database(args.sqlite) if args.sqlite else reset_database()
     sys.exit(0 if success else 1)
 
@@ -2,6 +2,7 @@
 Chương trình chính - Hệ thống nhận dạng vân tay
 """
 
+import argparse
 import sys
 import os
 
@@ -17,13 +18,18 @@ from giao_dien.giao_dien_chinh import tao_giao_dien
 
 def main():
     """Hàm main"""
+    parser = argparse.ArgumentParser(description="Hệ thống nhận dạng vân tay")
+    parser.add_argument('--sqlite', metavar='DUONG_DAN',
+                        help="Dùng database SQLite (file, tạo mới nếu chưa có) thay cho MySQL")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("HỆ THỐNG NHẬN DẠNG VÂN TAY")
     print("=" * 60)
     print("Bắt đầu khởi động giao diện...")
     
     try:
-        tao_giao_dien()
+        tao_giao_dien(args.sqlite)
     except Exception as e:
         print(f"Lỗi: {e}")
         import traceback
@@ -1,20 +1,63 @@
 """
 Module xử lý database MySQL cho hệ thống nhận dạng vân tay
+(SQLite cho máy không có database server: database.sqlite_manager)
 """
 
-import mysql.connector
-from mysql.connector import Error
 import json
 import os
+import threading
 import cv2
 import numpy as np
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import mysql.connector
+    from mysql.connector import Error, pooling
+except ImportError:
+    # Chỉ dùng được SQLiteDatabaseManager
+    mysql = None
+    
+    class Error(Exception):
+        """Thay cho mysql.connector.Error khi chưa cài mysql-connector-python"""
+
+
+# Mã lỗi mất kết nối (server khởi động lại, hết wait_timeout...): kết nối lại và thử lại một lần
+# (CR_SERVER_GONE_ERROR, CR_SERVER_LOST, CR_SERVER_LOST_EXTENDED)
+_LOST_CONNECTION_ERRORS = (2006, 2013, 2055)
+
 
 class DatabaseManager:
-    """Quản lý kết nối và các thao tác với database"""
+    """
+    Quản lý kết nối và các thao tác với database
+    
+    Các thao tác chỉ dùng _connection()/_run() và cursor kiểu mysql.connector
+    (tham số %s, dictionary=True); backend khác (SQLiteDatabaseManager) chỉ
+    cần thay phần kết nối và ERRORS.
+    """
     
-    def __init__(self, host='localhost', user='root', password='123456', database='xla_vantay'):
+    # Lỗi của thư viện database được bắt trong các thao tác
+    ERRORS = (Error,)
+    
+    # Các cột descriptor đã trích sẵn của bảng fingerprints (tự thêm vào database cũ)
+    DESCRIPTOR_COLUMNS = {
+        'feature_data': 'LONGBLOB',
+        'lbp_data': 'MEDIUMBLOB',
+        'ridge_data': 'MEDIUMBLOB',
+        'frequency_data': 'MEDIUMBLOB'
+    }
+    
+    # Cột dữ liệu cần cho từng phương pháp so khớp (ngoài thông tin vân tay/người dùng)
+    MATCHING_COLUMNS = {
+        'minutiae': 'minutiae_data',
+        'feature': 'feature_data',
+        'lbp': 'lbp_data',
+        'ridge': 'ridge_data',
+        'frequency': 'frequency_data'
+    }
+    
+    def __init__(self, host='localhost', user='root', password='123456', database='xla_vantay',
+                 pool_size=None):
         """
         Khởi tạo kết nối database
         
@@ -23,37 +66,194 @@ class DatabaseManager:
             user: Tên user MySQL
             password: Password MySQL
             database: Tên database
+            pool_size: Số kết nối trong pool (dùng từ nhiều luồng không phải chờ
+                nhau); None = một kết nối dùng chung, các luồng lần lượt dùng
         """
         self.host = host
         self.user = user
         self.password = password
         self.database = database
+        self.pool_size = pool_size
         self.connection = None
-        self.cursor = None
+        self._pool = None
+        self._pool_slots = None
+        # Khóa kết nối dùng chung (khi không có pool)
+        self._lock = threading.RLock()
+        # Kết nối và thông báo đang chờ của giao dịch đang mở trên từng luồng
+        self._local = threading.local()
+        
+        # Các hàm được gọi khi vân tay/người dùng thay đổi: callback(su_kien, id)
+        self._fingerprint_listeners = []
     
     def connect(self):
         """Kết nối tới database"""
         try:
-            self.connection = mysql.connector.connect(
-                host=self.host,
-                user=self.user,
-                password=self.password,
-                database=self.database
-            )
-            self.cursor = self.connection.cursor(dictionary=True)
+            self._open()
+            self._ensure_descriptor_columns()
             print("✓ Kết nối database thành công")
             return True
-        except Error as e:
+        except self.ERRORS as e:
             print(f"✗ Lỗi kết nối database: {e}")
             return False
     
+    def _open(self):
+        """Mở kết nối (hoặc pool kết nối) MySQL"""
+        if mysql is None:
+            raise Error("Chưa cài mysql-connector-python")
+        config = dict(host=self.host, user=self.user, password=self.password,
+                      database=self.database)
+        if self.pool_size:
+            self._pool = pooling.MySQLConnectionPool(
+                pool_name=f"xla_vantay_{id(self)}", pool_size=self.pool_size, **config
+            )
+            # Pool hết kết nối thì báo lỗi ngay, nên luồng phải chờ tới lượt
+            self._pool_slots = threading.BoundedSemaphore(self.pool_size)
+        else:
+            self.connection = mysql.connector.connect(**config)
+    
+    def _ensure_descriptor_columns(self):
+        """Thêm các cột descriptor còn thiếu vào bảng fingerprints (database tạo từ schema cũ)"""
+        query = """
+        SELECT COLUMN_NAME FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = %s AND TABLE_NAME = 'fingerprints'
+        """
+        result = self.fetch_query(query, (self.database,))
+        if not result:
+            return
+        
+        existing = {row['COLUMN_NAME'] for row in result}
+        for column, column_type in self.DESCRIPTOR_COLUMNS.items():
+            if column not in existing:
+                print(f"Thêm cột {column} vào bảng fingerprints")
+                self.execute_query(
+                    f"ALTER TABLE fingerprints ADD COLUMN {column} {column_type} AFTER binary_image_data"
+                )
+    
     def disconnect(self):
         """Ngắt kết nối database"""
-        if self.connection and self.connection.is_connected():
-            self.cursor.close()
+        if self._pool is not None:
+            # Kết nối trong pool được đóng khi pool bị hủy
+            self._pool = None
+            print("✓ Đã ngắt kết nối database")
+        elif self.connection and self.connection.is_connected():
             self.connection.close()
             print("✓ Đã ngắt kết nối database")
     
+    @contextmanager
+    def _connection(self):
+        """
+        Kết nối cho một thao tác: kết nối của giao dịch đang mở trên luồng này,
+        kết nối mượn từ pool (trả lại khi xong) hoặc kết nối dùng chung (giữ khóa)
+        """
+        conn = getattr(self._local, 'connection', None)
+        if conn is not None:
+            yield conn
+        elif self._pool is not None:
+            with self._pool_slots:
+                conn = self._pool.get_connection()
+                try:
+                    yield conn
+                finally:
+                    conn.close()
+        else:
+            with self._lock:
+                yield self.connection
+    
+    def _run(self, operation):
+        """
+        Chạy operation(conn) trên một kết nối
+        
+        Mất kết nối (ngoài giao dịch) thì kết nối lại rồi chạy lại một lần.
+        """
+        for attempt in range(2):
+            with self._connection() as conn:
+                try:
+                    return operation(conn)
+                except self.ERRORS as e:
+                    if (attempt or self.in_transaction()
+                            or getattr(e, 'errno', None) not in _LOST_CONNECTION_ERRORS):
+                        raise
+                    print(f"Mất kết nối database, đang kết nối lại: {e}")
+                    conn.reconnect(attempts=3, delay=1)
+    
+    def in_transaction(self):
+        """Luồng hiện tại có đang trong một giao dịch (transaction()) không"""
+        return getattr(self._local, 'connection', None) is not None
+    
+    @contextmanager
+    def transaction(self):
+        """
+        Giao dịch: mọi thao tác trong khối with chạy trên cùng một kết nối, được
+        commit khi khối kết thúc và rollback nếu có lỗi
+        
+        Trong giao dịch, execute_query và các hàm thêm/sửa/xóa ném lỗi ra thay vì
+        trả False để cả giao dịch bị hủy; thông báo thay đổi vân tay chỉ được gửi
+        sau khi commit. Giao dịch lồng nhau thuộc về giao dịch ngoài cùng.
+        
+        Ví dụ:
+            with db.transaction():
+                user_id = db.add_user(...)
+                db.add_fingerprint(user_id, ...)
+        """
+        if self.in_transaction():
+            yield self
+            return
+        
+        with self._connection() as conn:
+            if conn.in_transaction:
+                # Kết thúc giao dịch chỉ đọc còn mở (autocommit tắt) trước khi bắt đầu
+                conn.commit()
+            conn.start_transaction()
+            self._local.connection = conn
+            self._local.pending_events = []
+            try:
+                yield self
+                conn.commit()
+            except BaseException:
+                try:
+                    conn.rollback()
+                except self.ERRORS as e:
+                    print(f"Lỗi rollback: {e}")
+                raise
+            finally:
+                pending_events = self._local.pending_events
+                self._local.connection = None
+                self._local.pending_events = None
+        
+        for event, key in pending_events:
+            self._notify_fingerprint_change(event, key)
+    
+    def add_fingerprint_listener(self, callback):
+        """
+        Đăng ký hàm nhận thông báo khi dữ liệu vân tay thay đổi
+        
+        Args:
+            callback: Hàm callback(su_kien, id) với su_kien là một trong
+                'fingerprint_added', 'fingerprint_updated', 'fingerprint_deleted'
+                (id là fingerprint_id), 'fingerprints_added' (id là danh sách
+                fingerprint_id, từ add_fingerprints_bulk) hoặc 'user_updated',
+                'user_deleted' (id là user_id)
+        """
+        if callback not in self._fingerprint_listeners:
+            self._fingerprint_listeners.append(callback)
+    
+    def remove_fingerprint_listener(self, callback):
+        """Hủy đăng ký hàm nhận thông báo thay đổi vân tay"""
+        if callback in self._fingerprint_listeners:
+            self._fingerprint_listeners.remove(callback)
+    
+    def _notify_fingerprint_change(self, event, key):
+        """Gửi thông báo thay đổi tới các hàm đã đăng ký (trong giao dịch: sau khi commit)"""
+        pending_events = getattr(self._local, 'pending_events', None)
+        if pending_events is not None:
+            pending_events.append((event, key))
+            return
+        for callback in list(self._fingerprint_listeners):
+            try:
+                callback(event, key)
+            except Exception as e:
+                print(f"Lỗi xử lý thông báo {event} ({key}): {e}")
+    
     def execute_query(self, query, params=None):
         """
         Thực thi query
@@ -65,17 +265,43 @@ class DatabaseManager:
         Returns:
             Kết quả query
         """
+        return self._write(query, params) is not None
+    
+    def _write(self, query, params=None, many=False):
+        """
+        Thực thi câu lệnh ghi trên cursor riêng, commit ngay nếu không trong giao dịch
+        
+        many=True: params là danh sách tham số, chạy bằng executemany
+        
+        Returns:
+            lastrowid của câu lệnh (0 nếu không phải INSERT), None nếu lỗi
+        """
+        def operation(conn):
+            cursor = conn.cursor()
+            try:
+                if many:
+                    cursor.executemany(query, params)
+                elif params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                if not self.in_transaction():
+                    conn.commit()
+                return cursor.lastrowid or 0
+            except self.ERRORS:
+                if not self.in_transaction():
+                    conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            self.connection.commit()
-            return True
-        except Error as e:
+            return self._run(operation)
+        except self.ERRORS as e:
             print(f"Lỗi thực thi query: {e}")
-            self.connection.rollback()
-            return False
+            if self.in_transaction():
+                raise
+            return None
     
     def fetch_query(self, query, params=None):
         """
@@ -88,13 +314,20 @@ class DatabaseManager:
         Returns:
             Kết quả query
         """
+        def operation(conn):
+            cursor = conn.cursor(dictionary=True)
+            try:
+                if params:
+                    cursor.execute(query, params)
+                else:
+                    cursor.execute(query)
+                return cursor.fetchall()
+            finally:
+                cursor.close()
+        
         try:
-            if params:
-                self.cursor.execute(query, params)
-            else:
-                self.cursor.execute(query)
-            return self.cursor.fetchall()
-        except Error as e:
+            return self._run(operation)
+        except self.ERRORS as e:
             print(f"Lỗi lấy dữ liệu: {e}")
             return None
     
@@ -114,9 +347,102 @@ class DatabaseManager:
                  date_of_birth, gender, identification_number,
                  position, department, notes)
         
-        if self.execute_query(query, params):
-            return self.cursor.lastrowid
-        return None
+        return self._write(query, params) or None
+    
+    def _insert_many(self, query, rows, batch_size, lookup_ids):
+        """
+        Thêm nhiều bản ghi bằng executemany theo lô, mọi lô trong một giao dịch
+        
+        Mỗi lô có savepoint riêng: lô lỗi được rollback rồi ghi lại từng bản ghi
+        (mỗi bản ghi một savepoint), nên chỉ bản ghi lỗi bị bỏ và báo lỗi.
+        
+        Args:
+            query: Câu INSERT cho một bản ghi
+            rows: Danh sách tham số
+            batch_size: Số bản ghi mỗi lô
+            lookup_ids: Hàm (cursor, lô) -> danh sách ID theo thứ tự lô
+            
+        Returns:
+            list: ID theo thứ tự rows (None với bản ghi lỗi)
+        """
+        ids = [None] * len(rows)
+        with self.transaction():
+            conn = self._local.connection
+            for start in range(0, len(rows), batch_size):
+                batch = rows[start:start + batch_size]
+                cursor = conn.cursor()
+                try:
+                    cursor.execute("SAVEPOINT bulk_batch")
+                    try:
+                        cursor.executemany(query, batch)
+                        ids[start:start + len(batch)] = lookup_ids(cursor, batch)
+                        cursor.execute("RELEASE SAVEPOINT bulk_batch")
+                    except self.ERRORS:
+                        cursor.execute("ROLLBACK TO SAVEPOINT bulk_batch")
+                        cursor.execute("RELEASE SAVEPOINT bulk_batch")
+                        self._insert_rows(cursor, query, rows, start, len(batch), lookup_ids, ids)
+                finally:
+                    cursor.close()
+        return ids
+    
+    def _insert_rows(self, cursor, query, rows, start, count, lookup_ids, ids):
+        """Ghi lại từng bản ghi của một lô lỗi, bản ghi lỗi được rollback và báo lỗi"""
+        for i in range(start, start + count):
+            cursor.execute("SAVEPOINT bulk_row")
+            try:
+                cursor.execute(query, rows[i])
+                ids[i] = lookup_ids(cursor, [rows[i]])[0]
+                cursor.execute("RELEASE SAVEPOINT bulk_row")
+            except self.ERRORS as e:
+                print(f"Lỗi bản ghi {i + 1}: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT bulk_row")
+                cursor.execute("RELEASE SAVEPOINT bulk_row")
+    
+    def add_users_bulk(self, users, batch_size=500):
+        """
+        Thêm nhiều người dùng (executemany theo lô trong một giao dịch)
+        
+        Args:
+            users: Danh sách dict có các tham số của add_user (username, full_name bắt buộc)
+            batch_size: Số người dùng mỗi lô
+            
+        Returns:
+            list: user_id theo thứ tự users (None nếu lô chứa người dùng đó bị lỗi)
+        """
+        columns = ('username', 'full_name', 'email', 'phone', 'address',
+                   'date_of_birth', 'gender', 'identification_number',
+                   'position', 'department', 'notes')
+        query = f"""
+        INSERT INTO users ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        """
+        rows = [tuple(user.get(column) for column in columns) for user in users]
+        
+        def lookup_ids(cursor, batch):
+            # username là khóa duy nhất: lấy lại ID theo username (không phụ thuộc
+            # cách server cấp AUTO_INCREMENT cho câu INSERT nhiều dòng)
+            usernames = [row[0] for row in batch]
+            cursor.execute(
+                f"SELECT user_id, username FROM users WHERE username IN ({', '.join(['%s'] * len(batch))})",
+                usernames
+            )
+            user_ids = {username.lower(): user_id for user_id, username in cursor.fetchall()}
+            return [user_ids.get(username.lower()) for username in usernames]
+        
+        return self._insert_many(query, rows, batch_size, lookup_ids)
+    
+    def get_users_by_usernames(self, usernames):
+        """
+        Lấy nhiều người dùng theo username trong một truy vấn
+        
+        Returns:
+            dict: username -> bản ghi người dùng (chỉ các username đã có)
+        """
+        usernames = list(dict.fromkeys(usernames))
+        if not usernames:
+            return {}
+        query = f"SELECT * FROM users WHERE username IN ({', '.join(['%s'] * len(usernames))})"
+        return {user['username']: user for user in self.fetch_query(query, usernames) or []}
     
     def get_user_by_id(self, user_id):
         """Lấy thông tin người dùng theo ID"""
@@ -149,40 +475,108 @@ class DatabaseManager:
         values.append(user_id)
         
         query = f"UPDATE users SET {', '.join(fields)} WHERE user_id = %s"
-        return self.execute_query(query, values)
+        if self.execute_query(query, values):
+            self._notify_fingerprint_change('user_updated', user_id)
+            return True
+        return False
     
     def delete_user(self, user_id):
         """Xóa người dùng"""
         query = "DELETE FROM users WHERE user_id = %s"
-        return self.execute_query(query, (user_id,))
+        if self.execute_query(query, (user_id,)):
+            self._notify_fingerprint_change('user_deleted', user_id)
+            return True
+        return False
     
     # ==================== FINGERPRINT OPERATIONS ====================
     
     def add_fingerprint(self, user_id, finger_name, hand, 
                        minutiae_data=None, binary_image_data=None,
-                       quality_score=None):
-        """Thêm vân tay mới"""
+                       quality_score=None, feature_data=None, lbp_data=None,
+                       ridge_data=None, frequency_data=None):
+        """Thêm vân tay mới (các cột *_data là descriptor đã mã hóa, tuỳ chọn)"""
         query = """
         INSERT INTO fingerprints (user_id, finger_name, hand, 
-                                 minutiae_data, binary_image_data, quality_score)
-        VALUES (%s, %s, %s, %s, %s, %s)
+                                 minutiae_data, binary_image_data, quality_score,
+                                 feature_data, lbp_data, ridge_data, frequency_data)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
         """
         
         # Chuẩn bị dữ liệu JSON
         minutiae_json = json.dumps(minutiae_data) if minutiae_data else None
         
         params = (user_id, finger_name, hand, 
-                 minutiae_json, binary_image_data, quality_score)
+                 minutiae_json, binary_image_data, quality_score,
+                 feature_data, lbp_data, ridge_data, frequency_data)
         
-        if self.execute_query(query, params):
-            return self.cursor.lastrowid
+        fingerprint_id = self._write(query, params)
+        if fingerprint_id:
+            self._notify_fingerprint_change('fingerprint_added', fingerprint_id)
+            return fingerprint_id
         return None
     
+    def add_fingerprints_bulk(self, fingerprints, batch_size=500):
+        """
+        Thêm nhiều vân tay (executemany theo lô trong một giao dịch)
+        
+        Args:
+            fingerprints: Danh sách dict có các tham số của add_fingerprint
+                (user_id, finger_name, hand bắt buộc)
+            batch_size: Số vân tay mỗi lô
+            
+        Returns:
+            list: fingerprint_id theo thứ tự fingerprints (None nếu lô chứa vân tay đó bị lỗi)
+        """
+        columns = ('user_id', 'finger_name', 'hand', 'minutiae_data', 'binary_image_data',
+                   'quality_score', 'feature_data', 'lbp_data', 'ridge_data', 'frequency_data')
+        query = f"""
+        INSERT INTO fingerprints ({', '.join(columns)})
+        VALUES ({', '.join(['%s'] * len(columns))})
+        """
+        rows = []
+        for fp in fingerprints:
+            row = dict(fp)
+            row['minutiae_data'] = json.dumps(fp['minutiae_data']) if fp.get('minutiae_data') else None
+            rows.append(tuple(row.get(column) for column in columns))
+        
+        def lookup_ids(cursor, batch):
+            # (user_id, finger_name, hand) là khóa duy nhất
+            user_ids = list({row[0] for row in batch})
+            cursor.execute(
+                f"SELECT fingerprint_id, user_id, finger_name, hand FROM fingerprints "
+                f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})",
+                user_ids
+            )
+            fingerprint_ids = {(user_id, finger_name.lower(), hand.lower()): fingerprint_id
+                               for fingerprint_id, user_id, finger_name, hand in cursor.fetchall()}
+            return [fingerprint_ids.get((row[0], row[1].lower(), row[2].lower())) for row in batch]
+        
+        ids = self._insert_many(query, rows, batch_size, lookup_ids)
+        added = [fingerprint_id for fingerprint_id in ids if fingerprint_id]
+        if added:
+            self._notify_fingerprint_change('fingerprints_added', added)
+        return ids
+    
     def get_fingerprints_by_user(self, user_id):
         """Lấy tất cả vân tay của một người dùng"""
         query = "SELECT * FROM fingerprints WHERE user_id = %s ORDER BY captured_at DESC"
         return self.fetch_query(query, (user_id,))
     
+    def get_fingerprint_ids_by_users(self, user_ids):
+        """
+        Lấy ID vân tay đã có của nhiều người dùng trong một truy vấn (không lấy dữ liệu vân tay)
+        
+        Returns:
+            dict: (user_id, finger_name, hand) -> fingerprint_id, finger_name và hand viết thường
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        if not user_ids:
+            return {}
+        query = (f"SELECT fingerprint_id, user_id, finger_name, hand FROM fingerprints "
+                 f"WHERE user_id IN ({', '.join(['%s'] * len(user_ids))})")
+        return {(row['user_id'], row['finger_name'].lower(), row['hand'].lower()): row['fingerprint_id']
+                for row in self.fetch_query(query, user_ids) or []}
+    
     def get_fingerprint_by_id(self, fingerprint_id):
         """Lấy thông tin vân tay theo ID"""
         query = "SELECT * FROM fingerprints WHERE fingerprint_id = %s"
@@ -197,7 +591,7 @@ class DatabaseManager:
     def update_fingerprint(self, fingerprint_id, **kwargs):
         """Cập nhật thông tin vân tay"""
         allowed_fields = ['finger_name', 'hand', 'image_path', 'image_data',
-                         'minutiae_data', 'feature_data', 'lbp_data', 'ridge_data',
+                         'minutiae_data', 'binary_image_data', 'feature_data', 'lbp_data', 'ridge_data',
                          'frequency_data', 'quality_score', 'status', 'notes']
         
         fields = [f"{key} = %s" for key in kwargs.keys() if key in allowed_fields]
@@ -208,12 +602,18 @@ class DatabaseManager:
         values.append(fingerprint_id)
         
         query = f"UPDATE fingerprints SET {', '.join(fields)} WHERE fingerprint_id = %s"
-        return self.execute_query(query, values)
+        if self.execute_query(query, values):
+            self._notify_fingerprint_change('fingerprint_updated', fingerprint_id)
+            return True
+        return False
     
     def delete_fingerprint(self, fingerprint_id):
         """Xóa vân tay"""
         query = "DELETE FROM fingerprints WHERE fingerprint_id = %s"
-        return self.execute_query(query, (fingerprint_id,))
+        if self.execute_query(query, (fingerprint_id,)):
+            self._notify_fingerprint_change('fingerprint_deleted', fingerprint_id)
+            return True
+        return False
     
     # ==================== MATCHING OPERATIONS ====================
     
@@ -228,9 +628,27 @@ class DatabaseManager:
         params = (user_id, fingerprint_id, query_image_path,
                  matching_method, similarity_score, is_match, notes)
         
-        if self.execute_query(query, params):
-            return self.cursor.lastrowid
-        return None
+        return self._write(query, params) or None
+    
+    def add_matching_records_bulk(self, records):
+        """
+        Thêm nhiều bản ghi lịch sử so khớp bằng một executemany (dùng bởi MatchingHistoryWriter)
+        
+        Args:
+            records: Danh sách tuple (user_id, fingerprint_id, query_image_path,
+                matching_method, similarity_score, is_match, notes)
+            
+        Returns:
+            bool: Ghi thành công hay không
+        """
+        if not records:
+            return True
+        query = """
+        INSERT INTO matching_history (user_id, fingerprint_id, query_image_path,
+                                      matching_method, similarity_score, is_match, notes)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        """
+        return self._write(query, list(records), many=True) is not None
     
     def get_matching_history(self, user_id=None, limit=100):
         """Lấy lịch sử so khớp"""
@@ -288,17 +706,139 @@ class DatabaseManager:
         keyword_pattern = f"%{keyword}%"
         return self.fetch_query(query, (keyword_pattern, keyword_pattern, keyword_pattern))
     
-    def get_fingerprints_for_matching(self):
-        """Lấy danh sách vân tay để so khớp"""
-        query = """
-        SELECT f.*, u.username, u.full_name
+    def _matching_query(self, method=None):
+        """Câu truy vấn vân tay để so khớp, chỉ lấy các cột phương pháp cần (None = mọi cột)"""
+        if method is None:
+            columns = "f.*"
+        else:
+            if method not in self.MATCHING_COLUMNS:
+                raise ValueError(f"Phương pháp so khớp không hợp lệ: {method}")
+            column = self.MATCHING_COLUMNS[method]
+            columns = f"f.fingerprint_id, f.user_id, f.finger_name, f.{column}"
+            if column in self.DESCRIPTOR_COLUMNS:
+                # Ảnh nhị phân chỉ được gửi về khi vân tay chưa có descriptor
+                columns += (f", CASE WHEN f.{column} IS NULL"
+                            f" THEN f.binary_image_data END AS binary_image_data")
+        return f"""
+        SELECT {columns}, u.username, u.full_name
         FROM fingerprints f
         JOIN users u ON f.user_id = u.user_id
         WHERE f.status = 'approved' AND u.status = 'active'
         ORDER BY u.username, f.finger_name
         """
+    
+    def get_fingerprints_for_matching(self, method=None):
+        """
+        Lấy danh sách vân tay để so khớp
+        
+        Args:
+            method: Phương pháp so khớp ('minutiae', 'feature', 'lbp', 'ridge',
+                'frequency') để chỉ lấy các cột cần, None = mọi cột
+        """
+        return self.fetch_query(self._matching_query(method))
+    
+    def iter_fingerprints_for_matching(self, method=None, chunk_size=500):
+        """
+        Duyệt vân tay để so khớp theo từng lô, không tải cả bảng vào bộ nhớ
+        
+        Dùng cursor không đệm (dữ liệu được đọc dần từ server), bộ nhớ chỉ phụ
+        thuộc chunk_size. Kết nối được giữ tới khi duyệt xong: trong lúc duyệt
+        luồng này không được chạy truy vấn khác trên cùng kết nối (không dùng
+        pool hoặc đang trong giao dịch); dừng giữa chừng (break/close) thì phần
+        còn lại được bỏ qua.
+        
+        Args:
+            method: Như get_fingerprints_for_matching
+            chunk_size: Số bản ghi mỗi lần đọc
+            
+        Yields:
+            dict: Bản ghi vân tay kèm username, full_name
+        """
+        query = self._matching_query(method)
+        with self._connection() as conn:
+            try:
+                cursor = conn.cursor(dictionary=True, buffered=False)
+                cursor.execute(query)
+            except self.ERRORS as e:
+                print(f"Lỗi lấy dữ liệu: {e}")
+                return
+            
+            het = False
+            try:
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        het = True
+                        break
+                    yield from rows
+            except self.ERRORS as e:
+                print(f"Lỗi lấy dữ liệu: {e}")
+            finally:
+                try:
+                    if not het:
+                        conn.consume_results()
+                    cursor.close()
+                except self.ERRORS as e:
+                    print(f"Lỗi đóng cursor: {e}")
+    
+    def get_minutiae_templates(self, fingerprint_id=None, user_id=None):
+        """
+        Lấy minutiae của các vân tay dùng để so khớp (không lấy ảnh nhị phân)
+        
+        Args:
+            fingerprint_id: Chỉ lấy một vân tay (tuỳ chọn)
+            user_id: Chỉ lấy vân tay của một người dùng (tuỳ chọn)
+            
+        Returns:
+            Danh sách bản ghi gồm fingerprint_id, user_id, finger_name,
+            minutiae_data, username, full_name
+        """
+        query = """
+        SELECT f.fingerprint_id, f.user_id, f.finger_name, f.minutiae_data,
+               u.username, u.full_name
+        FROM fingerprints f
+        JOIN users u ON f.user_id = u.user_id
+        WHERE f.status = 'approved' AND u.status = 'active'
+        """
+        params = []
+        if fingerprint_id is not None:
+            query += " AND f.fingerprint_id = %s"
+            params.append(fingerprint_id)
+        if user_id is not None:
+            query += " AND f.user_id = %s"
+            params.append(user_id)
+        query += " ORDER BY u.username, f.finger_name"
+        return self.fetch_query(query, tuple(params) if params else None)
+    
+    def get_fingerprints_without_descriptors(self):
+        """Lấy các vân tay có ảnh nhị phân nhưng chưa có đủ descriptor"""
+        missing = " OR ".join(f"{column} IS NULL" for column in self.DESCRIPTOR_COLUMNS)
+        query = f"""
+        SELECT fingerprint_id, binary_image_data
+        FROM fingerprints
+        WHERE binary_image_data IS NOT NULL AND ({missing})
+        """
         return self.fetch_query(query)
     
+    def get_fingerprints_with_legacy_binary_image(self, format_tag, after_id=0, limit=200):
+        """
+        Lấy một lô vân tay có ảnh nhị phân chưa ở định dạng mới (không bắt đầu bằng format_tag)
+        
+        Args:
+            format_tag (bytes): Mã định dạng đầu dữ liệu (database.ma_hoa_anh.MA_DINH_DANG)
+            after_id: Chỉ lấy fingerprint_id lớn hơn (để đọc theo lô)
+            limit: Số vân tay tối đa
+        """
+        query = """
+        SELECT fingerprint_id, binary_image_data
+        FROM fingerprints
+        WHERE binary_image_data IS NOT NULL AND fingerprint_id > %s
+          AND SUBSTRING(binary_image_data, 1, %s) <> %s
+        ORDER BY fingerprint_id
+        LIMIT %s
+        """
+        return self.fetch_query(query, (after_id, len(format_tag), format_tag, limit))
+    
     def get_statistics(self):
         """Lấy thống kê hệ thống"""
         stats = {}
@@ -322,3 +862,21 @@ class DatabaseManager:
         stats['match_success_rate'] = (successful_matches / stats['total_matches'] * 100) if stats['total_matches'] > 0 else 0
         
         return stats
+
+
+def create_database_manager(sqlite_path=None, **kwargs):
+    """
+    Tạo database manager theo backend chọn lúc khởi động
+    
+    Args:
+        sqlite_path: Đường dẫn file SQLite; None = MySQL
+        **kwargs: Tham số của DatabaseManager (host, user, password, database, pool_size)
+            khi dùng MySQL
+        
+    Returns:
+        DatabaseManager hoặc SQLiteDatabaseManager (chưa kết nối)
+    """
+    if sqlite_path:
+        from database.sqlite_manager import SQLiteDatabaseManager
+        return SQLiteDatabaseManager(sqlite_path)
+    return DatabaseManager(**kwargs)
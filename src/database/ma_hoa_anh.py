@@ -0,0 +1,78 @@
+"""
+Module mã hóa ảnh nhị phân lưu trong cột fingerprints.binary_image_data
+
+Ảnh nhị phân (0/255) được lưu 1 bit/điểm ảnh: np.packbits + header kích
+thước. Giải mã chỉ là np.frombuffer (không sao chép) + np.unpackbits, nhanh
+hơn nhiều so với cv2.imdecode PNG khi tìm kiếm 1:N. Nén thêm bằng zlib (tuỳ
+chọn, nen=True) cho blob nhỏ khoảng một nửa nhưng giải mã chậm hơn vài lần.
+Dữ liệu PNG cũ (trước khi có định dạng này) vẫn đọc được.
+"""
+
+import struct
+import zlib
+
+import cv2
+import numpy as np
+
+
+# Header: mã định dạng, cờ, chiều cao, chiều rộng
+MA_DINH_DANG = b'VTB1'
+_HEADER = struct.Struct('<4sBII')
+_CO_ZLIB = 0x01
+
+
+def la_anh_nen_bit(du_lieu):
+    """Dữ liệu đã ở định dạng packbits chưa (False với PNG cũ)"""
+    return isinstance(du_lieu, (bytes, bytearray, memoryview)) and \
+        bytes(du_lieu[:len(MA_DINH_DANG)]) == MA_DINH_DANG
+
+
+def ma_hoa_anh_nhi_phan(anh, nen=False):
+    """
+    Mã hóa ảnh nhị phân để lưu database
+
+    Args:
+        anh (np.ndarray): Ảnh nhị phân 2 chiều (0 và 255)
+        nen (bool): Nén thêm bằng zlib (nhỏ hơn, giải mã chậm hơn)
+
+    Returns:
+        bytes: Dữ liệu packbits; ảnh không phải nhị phân được lưu PNG để không mất mát
+    """
+    anh = np.asarray(anh)
+    if anh.ndim != 2 or anh.dtype != np.uint8 or not np.isin(anh, (0, 255)).all():
+        _, png = cv2.imencode('.png', anh)
+        return png.tobytes()
+
+    du_lieu = np.packbits(anh > 0).tobytes()
+    co = 0
+    if nen:
+        da_nen = zlib.compress(du_lieu, 6)
+        # Ảnh nhiễu (hiếm) nén không nhỏ hơn thì giữ nguyên để giải mã nhanh hơn
+        if len(da_nen) < len(du_lieu):
+            du_lieu = da_nen
+            co |= _CO_ZLIB
+    return _HEADER.pack(MA_DINH_DANG, co, anh.shape[0], anh.shape[1]) + du_lieu
+
+
+def giai_ma_anh_nhi_phan(du_lieu):
+    """
+    Giải mã ảnh nhị phân lưu trong database
+
+    Args:
+        du_lieu (bytes): Dữ liệu packbits hoặc PNG cũ
+
+    Returns:
+        np.ndarray: Ảnh uint8 (0 và 255), None nếu không có dữ liệu
+    """
+    if not isinstance(du_lieu, (bytes, bytearray, memoryview)) or not du_lieu:
+        return None
+    if not la_anh_nen_bit(du_lieu):
+        return cv2.imdecode(np.frombuffer(du_lieu, np.uint8), cv2.IMREAD_GRAYSCALE)
+
+    _, co, cao, rong = _HEADER.unpack_from(du_lieu)
+    noi_dung = memoryview(du_lieu)[_HEADER.size:]
+    if co & _CO_ZLIB:
+        noi_dung = zlib.decompress(noi_dung)
+    anh = np.unpackbits(np.frombuffer(noi_dung, np.uint8), count=cao * rong).reshape(cao, rong)
+    anh *= 255
+    return anh
@@ -0,0 +1,144 @@
+"""
+Module ghi lịch sử so khớp (matching_history) ở luồng nền theo lô
+"""
+
+import atexit
+import threading
+import time
+from collections import deque
+
+
+class MatchingHistoryWriter:
+    """
+    Ghi lịch sử so khớp bất đồng bộ
+
+    record() chỉ đưa bản ghi vào hàng đợi (có giới hạn) rồi trả về ngay; một
+    luồng nền ghi các bản ghi theo lô bằng DatabaseManager.add_matching_records_bulk
+    khi đủ batch_size bản ghi hoặc bản ghi cũ nhất đã chờ flush_interval giây.
+    Hàng đợi đầy thì bản ghi mới bị bỏ và được đếm trong stats()['dropped'].
+    close() (tự gọi khi thoát chương trình) ghi hết hàng đợi trước khi dừng.
+    """
+
+    def __init__(self, db_manager, max_queue=10000, batch_size=200, flush_interval=1.0):
+        """
+        Args:
+            db_manager: Instance của DatabaseManager (dùng được từ luồng khác)
+            max_queue: Số bản ghi tối đa chờ ghi
+            batch_size: Số bản ghi mỗi lần ghi
+            flush_interval: Thời gian chờ tối đa (giây) của một bản ghi trước khi được ghi
+        """
+        self.db = db_manager
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # Hàng đợi (thời điểm nhận, tham số bản ghi)
+        self._queue = deque()
+        self._cond = threading.Condition()
+        self._pending = 0  # Đã nhận nhưng chưa ghi xong (trong hàng đợi + đang ghi)
+        self._flush_requested = False
+        self._closed = False
+        self._written = 0
+        self._dropped = 0
+        self._failed = 0
+
+        self._thread = threading.Thread(target=self._run, name='ghi_lich_su_so_khop', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, user_id, fingerprint_id, query_image_path,
+               matching_method, similarity_score, is_match, notes=None):
+        """
+        Đưa một bản ghi lịch sử so khớp vào hàng đợi (tham số như add_matching_record)
+
+        Returns:
+            bool: False nếu bản ghi bị bỏ (hàng đợi đầy hoặc đã đóng)
+        """
+        row = (user_id, fingerprint_id, query_image_path,
+               matching_method, similarity_score, is_match, notes)
+        with self._cond:
+            if self._closed or len(self._queue) >= self.max_queue:
+                self._dropped += 1
+                if self._dropped == 1 or self._dropped % 1000 == 0:
+                    print(f"Hàng đợi lịch sử so khớp đầy, đã bỏ {self._dropped} bản ghi")
+                return False
+            self._queue.append((time.monotonic(), row))
+            self._pending += 1
+            if len(self._queue) >= self.batch_size:
+                self._cond.notify_all()
+        return True
+
+    def _run(self):
+        """Luồng nền: chờ đủ lô / hết thời gian chờ rồi ghi"""
+        while True:
+            with self._cond:
+                while not self._closed:
+                    if self._queue:
+                        if self._flush_requested or len(self._queue) >= self.batch_size:
+                            break
+                        con_lai = self._queue[0][0] + self.flush_interval - time.monotonic()
+                        if con_lai <= 0:
+                            break
+                        self._cond.wait(con_lai)
+                    else:
+                        self._cond.wait()
+                if not self._queue:
+                    # Đã đóng và ghi hết
+                    return
+                batch = [self._queue.popleft()[1]
+                         for _ in range(min(len(self._queue), self.batch_size))]
+
+            try:
+                ok = self.db.add_matching_records_bulk(batch)
+            except Exception as e:
+                print(f"Lỗi ghi lịch sử so khớp: {e}")
+                ok = False
+
+            with self._cond:
+                if ok:
+                    self._written += len(batch)
+                else:
+                    self._failed += len(batch)
+                self._pending -= len(batch)
+                if self._pending == 0:
+                    self._flush_requested = False
+                self._cond.notify_all()
+
+    def flush(self, timeout=None):
+        """
+        Ghi ngay các bản ghi đang chờ và đợi ghi xong
+
+        Returns:
+            bool: False nếu hết timeout mà chưa ghi xong
+        """
+        with self._cond:
+            if self._pending == 0:
+                return True
+            self._flush_requested = True
+            self._cond.notify_all()
+            return self._cond.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self, timeout=None):
+        """Ngừng nhận bản ghi mới, ghi hết hàng đợi rồi dừng luồng nền"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout)
+        atexit.unregister(self.close)
+
+        stats = self.stats()
+        if stats['dropped'] or stats['failed'] or stats['queued']:
+            print(f"Lịch sử so khớp: đã ghi {stats['written']}, bỏ {stats['dropped']} "
+                  f"(hàng đợi đầy), lỗi {stats['failed']}, chưa ghi {stats['queued']}")
+
+    def stats(self):
+        """Số bản ghi đã ghi / bị bỏ do hàng đợi đầy / ghi lỗi / đang chờ"""
+        with self._cond:
+            return {
+                'written': self._written,
+                'dropped': self._dropped,
+                'failed': self._failed,
+                'queued': self._pending
+            }
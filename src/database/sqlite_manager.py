@@ -0,0 +1,198 @@
+"""
+Module database SQLite cho máy không có database server (kiosk, máy thử nghiệm)
+
+Cùng các thao tác với DatabaseManager (users, fingerprints, matching_history,
+system_settings) trên một file SQLite: chế độ WAL (đọc song song với ghi),
+đọc file qua memory map và câu lệnh đã biên dịch được giữ lại để dùng lại.
+"""
+
+import functools
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, datetime
+
+import numpy as np
+
+from database.database_manager import DatabaseManager
+
+
+# Schema tạo bảng (tương đương database/schema.sql của MySQL)
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))),
+                           'database', 'schema_sqlite.sql')
+
+# Ngày giờ lưu dạng 'YYYY-MM-DD HH:MM:SS', đọc ra datetime/date như mysql.connector
+sqlite3.register_adapter(datetime, lambda gia_tri: gia_tri.isoformat(' '))
+sqlite3.register_adapter(date, lambda gia_tri: gia_tri.isoformat())
+sqlite3.register_converter('TIMESTAMP', lambda gia_tri: datetime.fromisoformat(gia_tri.decode()))
+sqlite3.register_converter('DATE', lambda gia_tri: date.fromisoformat(gia_tri.decode()))
+sqlite3.register_converter('BOOLEAN', lambda gia_tri: bool(int(gia_tri)))
+
+# Điểm so khớp/descriptor kiểu số numpy lưu thành số, không thành BLOB
+for _kieu in (np.float16, np.float32, np.float64):
+    sqlite3.register_adapter(_kieu, float)
+for _kieu in (np.int8, np.int16, np.int32, np.int64, np.uint8, np.uint16, np.uint32, np.uint64):
+    sqlite3.register_adapter(_kieu, int)
+sqlite3.register_adapter(np.bool_, bool)
+
+
+@functools.lru_cache(maxsize=512)
+def _sql(query):
+    """Đổi tham số %s (mysql.connector) sang ? (sqlite3); cùng câu lệnh luôn cho cùng chuỗi"""
+    return query.replace('%s', '?')
+
+
+def _dong_dict(cursor, dong):
+    """row_factory trả về dict như cursor(dictionary=True) của mysql.connector"""
+    return {cot[0]: gia_tri for cot, gia_tri in zip(cursor.description, dong)}
+
+
+class _SQLiteCursor:
+    """Cursor sqlite3 dùng như cursor mysql.connector (tham số %s)"""
+
+    def __init__(self, connection, dictionary=False):
+        self._cursor = connection.cursor()
+        if dictionary:
+            self._cursor.row_factory = _dong_dict
+
+    def execute(self, query, params=None):
+        self._cursor.execute(_sql(query), params or ())
+
+    def executemany(self, query, rows):
+        self._cursor.executemany(_sql(query), rows)
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size):
+        return self._cursor.fetchmany(size)
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    def close(self):
+        self._cursor.close()
+
+
+class _SQLiteConnection:
+    """Kết nối sqlite3 dùng như kết nối mysql.connector (cho các thao tác của DatabaseManager)"""
+
+    def __init__(self, path, mmap_size):
+        # Giống MySQL autocommit tắt: câu lệnh ghi tự mở giao dịch, commit() kết thúc
+        self._conn = sqlite3.connect(
+            path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+            cached_statements=256, check_same_thread=False
+        )
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA synchronous = NORMAL")
+        self._conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA temp_store = MEMORY")
+
+    def cursor(self, dictionary=False, buffered=True):
+        # Cursor sqlite3 luôn đọc dần từng dòng nên buffered không cần
+        return _SQLiteCursor(self._conn, dictionary)
+
+    @property
+    def in_transaction(self):
+        return self._conn.in_transaction
+
+    def start_transaction(self):
+        # Giữ quyền ghi ngay từ đầu để giao dịch không bị lỗi "database is locked" giữa chừng
+        self._conn.execute("BEGIN IMMEDIATE")
+
+    def commit(self):
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def consume_results(self):
+        pass
+
+    def reconnect(self, attempts=1, delay=0):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def executescript(self, script):
+        self._conn.executescript(script)
+
+    def close(self):
+        self._conn.close()
+
+
+class SQLiteDatabaseManager(DatabaseManager):
+    """
+    Database trên một file SQLite, không cần database server
+
+    Mỗi luồng dùng một kết nối riêng tới cùng file (chế độ WAL cho phép đọc
+    trong lúc luồng khác ghi); transaction(), thêm hàng loạt và các thao tác
+    khác giống DatabaseManager.
+    """
+
+    ERRORS = (sqlite3.Error,)
+
+    def __init__(self, path=os.path.join('data', 'xla_vantay.db'), mmap_size=256 * 1024 * 1024):
+        """
+        Khởi tạo database SQLite
+
+        Args:
+            path: Đường dẫn file database (tạo mới nếu chưa có)
+            mmap_size: Số byte của file được đọc qua memory map
+        """
+        super().__init__(host=None, user=None, password=None, database=path)
+        self.mmap_size = mmap_size
+        self._connections = []
+        self._thread_connections = threading.local()
+
+    def _open(self):
+        """Mở file database, tạo bảng nếu chưa có"""
+        thu_muc = os.path.dirname(self.database)
+        if thu_muc:
+            os.makedirs(thu_muc, exist_ok=True)
+        self.connection = self._thread_connection()
+        with open(SCHEMA_FILE, encoding='utf-8') as f:
+            self.connection.executescript(f.read())
+
+    def _thread_connection(self):
+        """Kết nối của luồng hiện tại (mở khi dùng lần đầu)"""
+        conn = getattr(self._thread_connections, 'connection', None)
+        if conn is None:
+            conn = _SQLiteConnection(self.database, self.mmap_size)
+            self._thread_connections.connection = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _ensure_descriptor_columns(self):
+        """Thêm các cột descriptor còn thiếu vào bảng fingerprints (file tạo từ schema cũ)"""
+        existing = {row['name'] for row in self.fetch_query("PRAGMA table_info(fingerprints)") or []}
+        for column in self.DESCRIPTOR_COLUMNS:
+            if column not in existing:
+                print(f"Thêm cột {column} vào bảng fingerprints")
+                self.execute_query(f"ALTER TABLE fingerprints ADD COLUMN {column} BLOB")
+
+    def disconnect(self):
+        """Đóng mọi kết nối tới file database"""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        if not connections:
+            return
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                print(f"Lỗi đóng kết nối: {e}")
+        self._thread_connections = threading.local()
+        self.connection = None
+        print("✓ Đã ngắt kết nối database")
+
+    @contextmanager
+    def _connection(self):
+        """Kết nối của giao dịch đang mở trên luồng này, nếu không thì kết nối riêng của luồng"""
+        conn = getattr(self._local, 'connection', None)
+        yield conn if conn is not None else self._thread_connection()
@@ -4,28 +4,29 @@ Module xử lý sự kiện liên quan đến database
 
 import tkinter as tk
 from tkinter import filedialog, messagebox, ttk
-import cv2
-import numpy as np
 import os
 import sys
 
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from database.database_manager import DatabaseManager
+from database.database_manager import create_database_manager
+from database.ma_hoa_anh import ma_hoa_anh_nhi_phan
 from nhan_dang.fingerprint_recognition import FingerprintRecognition
 
 
 class DatabaseEventHandler:
     """Xử lý sự kiện liên quan đến database"""
     
-    def __init__(self, gui):
+    def __init__(self, gui, sqlite_path=None):
         """
         Khởi tạo handler database
         
         Args:
             gui: Reference tới GiaoDienChinh
+            sqlite_path: Đường dẫn file SQLite (None = kết nối MySQL)
         """
         self.gui = gui
+        self.sqlite_path = sqlite_path
         self.db = None
         self.recognition = None
         self.is_connected = False
@@ -38,14 +39,20 @@ class DatabaseEventHandler:
     def ket_noi_database(self, host='localhost', user='root', password='123456', database='xla_vantay'):
         """Kết nối tới database"""
         try:
-            self.db = DatabaseManager(host, user, password, database)
+            # Pool kết nối: tác vụ nền (tìm kiếm, đăng ký) và luồng giao diện
+            # truy vấn song song không phải chờ nhau (SQLite: mỗi luồng một kết nối)
+            self.db = create_database_manager(self.sqlite_path, host=host, user=user, password=password,
+                                              database=database, pool_size=4)
             if self.db.connect():
                 self.recognition = FingerprintRecognition(self.db)
+                # Lưu lịch sử so khớp không chặn lúc tìm kiếm
+                self.recognition.enable_async_history()
                 self.is_connected = True
                 messagebox.showinfo("Thành công", "Kết nối database thành công!")
                 return True
             else:
-                messagebox.showerror("Lỗi", "Không thể kết nối database.\nVui lòng kiểm tra cấu hình MySQL.")
+                cau_hinh = f"file SQLite {self.sqlite_path}" if self.sqlite_path else "cấu hình MySQL"
+                messagebox.showerror("Lỗi", f"Không thể kết nối database.\nVui lòng kiểm tra {cau_hinh}.")
                 return False
         except Exception as e:
             messagebox.showerror("Lỗi", f"Lỗi kết nối database: {str(e)}")
@@ -89,23 +96,31 @@ class DatabaseEventHandler:
             return None
     
     def luu_van_tay(self, user_id, finger_name, hand, 
-                    anh_xu_ly, minutiae_data=None, quality_score=None):
-        """Lưu vân tay vào database (lưu ảnh nhị phân để trích features khi cần)"""
+                    anh_xu_ly, minutiae_data=None, quality_score=None, mo_ta=None):
+        """
+        Lưu vân tay vào database (lưu ảnh nhị phân để trích features khi cần)
+        
+        mo_ta: descriptor đã trích sẵn theo phương pháp (từ FingerprintPipeline),
+        phương pháp nào thiếu sẽ được trích từ anh_xu_ly
+        """
         if not self.kiểm_tra_kết_nối():
             return None
         
         try:
-            # Encode ảnh nhị phân từ numpy array
+            # Encode ảnh nhị phân từ numpy array (1 bit/điểm ảnh, xem database.ma_hoa_anh)
             binary_image_data = None
             if anh_xu_ly is not None:
-                _, binary_image_data = cv2.imencode('.png', anh_xu_ly)
-                binary_image_data = binary_image_data.tobytes()
+                binary_image_data = ma_hoa_anh_nhi_phan(anh_xu_ly)
+            
+            # Trích sẵn descriptor để khi tìm kiếm không phải trích lại từ ảnh
+            descriptors = self.recognition.extract_descriptors(anh_xu_ly, mo_ta=mo_ta)
             
             fingerprint_id = self.db.add_fingerprint(
                 user_id, finger_name, hand,
                 minutiae_data=minutiae_data,
                 binary_image_data=binary_image_data,
-                quality_score=quality_score
+                quality_score=quality_score,
+                **descriptors
             )
             
             if fingerprint_id:
@@ -119,9 +134,18 @@ class DatabaseEventHandler:
             messagebox.showerror("Lỗi", f"Lỗi: {str(e)}")
             return None
     
-    def nhan_dang_van_tay(self, anh_manh, minutiae_data, matching_method='comprehensive', anh_xu_ly=None):
-        """Nhận dạng người dùng từ vân tay"""
-        if not self.kiểm_tra_kết_nối():
+    def nhan_dang_van_tay(self, anh_manh, minutiae_data, matching_method='comprehensive', anh_xu_ly=None,
+                          hien_loi=True):
+        """
+        Nhận dạng người dùng từ vân tay
+        
+        hien_loi=False dùng khi gọi từ luồng nền: không mở hộp thoại mà ném
+        lỗi ra cho nơi gọi (BoChayTacVu báo lỗi trên luồng Tk)
+        """
+        if not hien_loi:
+            if not self.is_connected or not self.db:
+                raise RuntimeError("Chưa kết nối database!")
+        elif not self.kiểm_tra_kết_nối():
             return []
         
         try:
@@ -129,6 +153,10 @@ class DatabaseEventHandler:
             threshold = float(self.db.get_setting('matching_threshold') or 70.0)
             self.recognition.set_threshold(threshold)
             
+            # Số tiến trình so khớp song song (chưa có cài đặt thì chạy tuần tự)
+            workers = int(self.db.get_setting('identification_workers') or 1)
+            self.recognition.set_worker_count(workers)
+            
             # Nhận dạng (truyền anh_xu_ly để trích features từ query)
             results = self.recognition.identify_user_from_image(
                 anh_manh, minutiae_data, matching_method, anh_xu_ly=anh_xu_ly
@@ -137,6 +165,8 @@ class DatabaseEventHandler:
             return results
         
         except Exception as e:
+            if not hien_loi:
+                raise
             messagebox.showerror("Lỗi", f"Lỗi nhận dạng: {str(e)}")
             return []
     
@@ -174,25 +204,24 @@ class DatabaseEventHandler:
             return []
     
     def cap_nhat_van_tay_match(self, fingerprint_id, query_image_path,
-                              matching_method, similarity_score, is_match):
-        """Lưu bản ghi so khớp vào database"""
+                              matching_method, similarity_score, is_match, user_id=None):
+        """Lưu bản ghi so khớp vào database (ghi ở luồng nền, xem MatchingHistoryWriter)"""
         if not self.kiểm_tra_kết_nối():
             return False
         
         try:
-            # Lấy thông tin fingerprint
-            fp = self.db.get_fingerprint_by_id(fingerprint_id)
-            if not fp:
-                return False
-            
-            user_id = fp['user_id']
+            # Kết quả nhận dạng đã có user_id thì không cần truy vấn lại vân tay
+            if user_id is None:
+                fp = self.db.get_fingerprint_by_id(fingerprint_id)
+                if not fp:
+                    return False
+                user_id = fp['user_id']
             
             # Lưu bản ghi
-            self.recognition.save_match_record(
+            return bool(self.recognition.save_match_record(
                 user_id, fingerprint_id, query_image_path,
                 matching_method, similarity_score, is_match
-            )
-            return True
+            ))
         
         except Exception as e:
             print(f"Lỗi: {str(e)}")
@@ -215,6 +244,8 @@ class DatabaseEventHandler:
             return []
         
         try:
+            # Bản ghi vừa so khớp có thể còn trong hàng đợi ghi
+            self.recognition.flush_history(timeout=2.0)
             return self.db.get_matching_history(user_id, limit)
         except Exception as e:
             print(f"Lỗi: {str(e)}")
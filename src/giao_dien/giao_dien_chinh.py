@@ -16,12 +16,18 @@ from giao_dien.xu_ly_su_kien import XuLySuKien
 from giao_dien.database_handler import DatabaseEventHandler
 from giao_dien.giao_dien_dang_ky import GiaoDienDangKy
 from giao_dien.giao_dien_tim_kiem import GiaoDienTimKiem
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline
 
 
 class GiaoDienChinh:
     """Lớp giao diện chính"""
     
-    def __init__(self, root):
+    def __init__(self, root, sqlite_path=None):
+        """
+        Args:
+            root: Cửa sổ Tk
+            sqlite_path: Dùng database SQLite ở đường dẫn này thay cho MySQL
+        """
         self.root = root
         self.root.title("Hệ thống nhận dạng vân tay - Fingerprint Recognition System")
         self.root.geometry("1600x950")
@@ -34,7 +40,13 @@ class GiaoDienChinh:
         self._tao_header()
         
         # Tạo database handler
-        self.db_handler = DatabaseEventHandler(self)
+        self.db_handler = DatabaseEventHandler(self, sqlite_path)
+        
+        # Chuỗi xử lý ảnh dùng chung cho so sánh, đăng ký và tìm kiếm
+        # (mẫu đăng ký và ảnh truy vấn được xử lý giống hệt nhau); kết quả
+        # từng bước được nhớ trên đĩa nên mở lại cùng ảnh không phải xử lý lại
+        thu_muc_goc = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        self.pipeline = FingerprintPipeline(cache_dir=os.path.join(thu_muc_goc, 'data', 'bo_nho_dem'))
         
         # Tạo xử lý sự kiện
         self.hien_thi_ket_qua = None
@@ -62,16 +74,28 @@ class GiaoDienChinh:
         tab_dang_ky = ttk.Frame(self.notebook_main)
         self.notebook_main.add(tab_dang_ky, text="Đăng Ký Người Dùng")
         
-        self.giao_dien_dang_ky = GiaoDienDangKy(tab_dang_ky, self.db_handler)
+        self.giao_dien_dang_ky = GiaoDienDangKy(tab_dang_ky, self.db_handler, self.pipeline)
         
         # Tab 3: Tìm kiếm/Nhận dạng
         tab_tim_kiem = ttk.Frame(self.notebook_main)
         self.notebook_main.add(tab_tim_kiem, text="Tìm Kiếm")
         
-        self.giao_dien_tim_kiem = GiaoDienTimKiem(tab_tim_kiem, self.db_handler)
+        self.giao_dien_tim_kiem = GiaoDienTimKiem(tab_tim_kiem, self.db_handler, self.pipeline)
         
         # Tạo menu bar
         self._tao_menu_bar()
+        
+        # Dừng các tác vụ nền khi đóng cửa sổ
+        self.root.protocol("WM_DELETE_WINDOW", self._dong)
+    
+    def _dong(self):
+        """Hủy các tác vụ nền rồi đóng cửa sổ"""
+        self.xu_ly_su_kien.tac_vu_nen.dong()
+        self.giao_dien_tim_kiem.tac_vu_nen.dong()
+        # Ghi hết lịch sử so khớp đang chờ
+        if self.db_handler.recognition is not None:
+            self.db_handler.recognition.close()
+        self.root.destroy()
     
     def _setup_style(self):
         """Cấu hình style toàn cục"""
@@ -185,6 +209,9 @@ class GiaoDienChinh:
         ttk.Button(proc_frame, text="So khớp tất cả", width=15,
                   command=self.xu_ly_su_kien.so_khop_tat_ca).pack(side=tk.LEFT, padx=3)
         
+        ttk.Button(proc_frame, text="Hủy xử lý", width=12,
+                  command=self.xu_ly_su_kien.huy_tac_vu).pack(side=tk.LEFT, padx=3)
+        
         ttk.Separator(proc_frame, orient=tk.VERTICAL).pack(side=tk.LEFT, fill=tk.Y, padx=15)
         
         ttk.Button(proc_frame, text="Xóa dữ liệu", width=13,
@@ -250,10 +277,15 @@ class GiaoDienChinh:
                           "- MySQL")
 
 
-def tao_giao_dien():
-    """Hàm chính để tạo giao diện"""
+def tao_giao_dien(sqlite_path=None):
+    """
+    Hàm chính để tạo giao diện
+    
+    Args:
+        sqlite_path: Đường dẫn file SQLite (None = MySQL)
+    """
     root = tk.Tk()
-    app = GiaoDienChinh(root)
+    app = GiaoDienChinh(root, sqlite_path)
     root.mainloop()
 
 
@@ -5,7 +5,6 @@ Module giao diện đăng ký người dùng mới
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import cv2
-import numpy as np
 from PIL import Image, ImageTk
 import os
 import sys
@@ -13,26 +12,24 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from tien_xu_ly.chuyen_xam import chuyen_nh_xam
-from tien_xu_ly.chuan_hoa import chuan_hoa_anh
-from tien_xu_ly.tang_cuong import ap_dung_gabor_filter
-from phan_doan.nhi_phan_hoa import nhi_phan_hoa_otsu
-from lam_manh.lam_manh_anh import lam_manh_scikit_image
-from trich_dac_trung.trich_dac_trung_chi_tiet import trich_minutiae_chi_tiet
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline
 
 
 class GiaoDienDangKy:
     """Giao diện đăng ký người dùng mới"""
     
-    def __init__(self, parent_frame, database_handler):
+    def __init__(self, parent_frame, database_handler, pipeline=None):
         """
         Khởi tạo giao diện đăng ký
         
         Args:
             parent_frame: Frame cha
             database_handler: Instance DatabaseEventHandler
+            pipeline: FingerprintPipeline dùng chung (mặc định tạo mới)
         """
         self.parent = parent_frame
         self.db_handler = database_handler
+        self.pipeline = pipeline or FingerprintPipeline()
         
         # Biến lưu trữ
         self.anh_duong_dan = None
@@ -274,90 +271,22 @@ class GiaoDienDangKy:
         try:
             self._cap_nhat_trang_thai("Đang xử lý ảnh...")
             
-            # Chuẩn hóa
-            self._cap_nhat_trang_thai("Đang chuẩn hóa...")
-            anh_chuan_hoa = chuan_hoa_anh(self.anh_xam)
+            # Cùng chuỗi xử lý với tìm kiếm: chuẩn hóa → lọc nhiễu → Gabor →
+            # Otsu → làm mảnh → minutiae, và descriptor từ ảnh nhị phân
+            kq = self.pipeline.run(self.anh_xam, ('nhi_phan_hoa', 'lam_manh', 'minutiae', 'mo_ta'))
             
-            # Tăng cường
-            self._cap_nhat_trang_thai("Đang tăng cường...")
-            anh_tang_cuong = ap_dung_gabor_filter(anh_chuan_hoa)
+            # Lưu ảnh nhị phân (ảnh tiền xử lý trước thinning, cho Feature/LBP/Ridge/Frequency)
+            self.anh_nhi_phan = kq['anh_nhi_phan']
+            self.anh_xu_ly = kq['anh_nhi_phan']
+            self.anh_manh = kq['anh_manh']
+            self.minutiae = kq['minutiae']
             
-            # Nhị phân hóa
-            self._cap_nhat_trang_thai("Đang nhị phân hóa...")
-            anh_nhi_phan, _ = nhi_phan_hoa_otsu(anh_tang_cuong)
-            
-            # Lưu ảnh nhị phân
-            self.anh_nhi_phan = anh_nhi_phan
-            
-            # Làm mảnh
-            self._cap_nhat_trang_thai("Đang làm mảnh ảnh...")
-            self.anh_manh = lam_manh_scikit_image(anh_nhi_phan)
-            
-            # Lưu ảnh tiền xử lý (cho Feature/LBP/Ridge/Frequency)
-            self.anh_xu_ly = anh_nhi_phan  # Ảnh nhị phân trước thinning
-            
-            # Trích tất cả đặc trưng từ ảnh tiền xử lý (anh_nhi_phan)
-            self._cap_nhat_trang_thai("Đang trích tất cả đặc trưng...")
-            
-            # Minutiae (từ ảnh làm mảnh)
-            self.minutiae = trich_minutiae_chi_tiet(self.anh_manh)
-            
-            # Feature (SIFT)
-            try:
-                sift = cv2.SIFT_create()
-                kp, des = sift.detectAndCompute(anh_nhi_phan, None)
-                self.feature_data = {
-                    'keypoints': [(int(k.pt[0]), int(k.pt[1]), float(k.size), float(k.angle)) for k in kp],
-                    'descriptors': des.tolist() if des is not None else []
-                }
-            except:
-                self.feature_data = None
-            
-            # LBP
-            try:
-                from skimage.feature import local_binary_pattern
-                lbp = local_binary_pattern(anh_nhi_phan, 8, 1)
-                hist, _ = np.histogram(lbp.ravel(), bins=256, range=(0, 256))
-                self.lbp_data = {
-                    'histogram': hist.tolist(),
-                    'shape': anh_nhi_phan.shape
-                }
-            except:
-                self.lbp_data = None
-            
-            # Ridge Orientation
-            try:
-                gy, gx = np.gradient(anh_nhi_phan.astype(float))
-                orientation = np.arctan2(gy, gx)
-                step = 10
-                sampled_orientation = orientation[::step, ::step]
-                self.ridge_data = {
-                    'orientation': sampled_orientation.tolist(),
-                    'step': step,
-                    'shape': anh_nhi_phan.shape
-                }
-            except:
-                self.ridge_data = None
-            
-            # Frequency Domain
-            try:
-                wavelengths = [5, 10, 15]
-                orientations = [0, 45, 90, 135]
-                responses = []
-                
-                for wl in wavelengths:
-                    for angle in orientations:
-                        kernel = cv2.getGaborKernel((21, 21), wl, np.radians(angle), 10, 0.5, 0)
-                        response = cv2.filter2D(anh_nhi_phan, -1, kernel)
-                        responses.append(float(np.mean(np.abs(response))))
-                
-                self.frequency_data = {
-                    'gabor_responses': responses,
-                    'wavelengths': wavelengths,
-                    'orientations': orientations
-                }
-            except:
-                self.frequency_data = None
+            # Descriptor đã trích (lưu thẳng vào database khi đăng ký)
+            mo_ta = kq['mo_ta']
+            self.feature_data = mo_ta.get('feature')
+            self.lbp_data = mo_ta.get('lbp')
+            self.ridge_data = mo_ta.get('ridge')
+            self.frequency_data = mo_ta.get('frequency')
             
             # Summary
             minutiae_count = len(self.minutiae.get('endings', [])) + len(self.minutiae.get('bifurcations', [])) if self.minutiae else 0
@@ -428,7 +357,9 @@ class GiaoDienDangKy:
                 hand=self.var_hand.get(),
                 anh_xu_ly=self.anh_nhi_phan,
                 minutiae_data=self.minutiae,
-                quality_score=85.0
+                quality_score=85.0,
+                mo_ta={'feature': self.feature_data, 'lbp': self.lbp_data,
+                       'ridge': self.ridge_data, 'frequency': self.frequency_data}
             )
             
             if not fingerprint_id:
@@ -12,26 +12,25 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from tien_xu_ly.chuyen_xam import chuyen_nh_xam
-from tien_xu_ly.chuan_hoa import chuan_hoa_anh
-from tien_xu_ly.tang_cuong import ap_dung_gabor_filter
-from phan_doan.nhi_phan_hoa import nhi_phan_hoa_otsu
-from lam_manh.lam_manh_anh import lam_manh_scikit_image
-from trich_dac_trung.trich_dac_trung_chi_tiet import trich_minutiae_chi_tiet
+from giao_dien.tac_vu_nen import BoChayTacVu
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline
 
 
 class GiaoDienTimKiem:
     """Giao diện tìm kiếm/nhận dạng người dùng"""
     
-    def __init__(self, parent_frame, database_handler):
+    def __init__(self, parent_frame, database_handler, pipeline=None):
         """
         Khởi tạo giao diện tìm kiếm
         
         Args:
             parent_frame: Frame cha
             database_handler: Instance DatabaseEventHandler
+            pipeline: FingerprintPipeline dùng chung (mặc định tạo mới)
         """
         self.parent = parent_frame
         self.db_handler = database_handler
+        self.pipeline = pipeline or FingerprintPipeline()
         
         # Biến lưu trữ
         self.anh_duong_dan = None
@@ -41,6 +40,9 @@ class GiaoDienTimKiem:
         self.anh_manh = None
         self.minutiae = None
         
+        # Xử lý ảnh và tìm kiếm 1:N chạy nền để cửa sổ không bị treo
+        self.tac_vu_nen = BoChayTacVu(parent_frame)
+        
         self._tao_giao_dien()
     
     def _tao_giao_dien(self):
@@ -85,6 +87,9 @@ class GiaoDienTimKiem:
         ttk.Button(button_frame, text="Tìm Kiếm",
                   command=self._tim_kiem).pack(side=tk.LEFT, padx=3, fill=tk.X, expand=True)
         
+        ttk.Button(button_frame, text="Hủy",
+                  command=self._huy_tim_kiem).pack(side=tk.LEFT, padx=3, fill=tk.X, expand=True)
+        
         ttk.Button(button_frame, text="Xóa",
                   command=self._xoa_ket_qua).pack(side=tk.LEFT, padx=3, fill=tk.X, expand=True)
         
@@ -152,6 +157,8 @@ class GiaoDienTimKiem:
             return
         
         try:
+            # Kết quả tìm kiếm của ảnh cũ không còn ý nghĩa
+            self.tac_vu_nen.huy('tim_kiem')
             self.anh_duong_dan = duong_dan
             
             # Đọc ảnh
@@ -199,6 +206,7 @@ class GiaoDienTimKiem:
     
     def _xoa_anh(self):
         """Xóa ảnh đã chọn"""
+        self.tac_vu_nen.huy('tim_kiem')
         self.anh_duong_dan = None
         self.anh_goc = None
         self.anh_xam = None
@@ -209,50 +217,41 @@ class GiaoDienTimKiem:
         self.canvas_image.delete("all")
         self._cap_nhat_trang_thai("Ảnh đã được xóa")
     
-    def _xu_ly_anh(self):
-        """Xử lý ảnh tự động"""
-        if self.anh_xam is None:
-            return False
+    def _xu_ly_anh(self, anh_xam, method, tac_vu):
+        """
+        Xử lý ảnh tự động (chạy trên luồng nền, không đụng tới widget)
         
-        try:
-            self._cap_nhat_trang_thai("Đang xử lý ảnh...")
-            
-            method = self.var_method.get()
-            
-            # Chuẩn hóa
-            anh_chuan_hoa = chuan_hoa_anh(self.anh_xam)
-            
-            # Tăng cường
-            anh_tang_cuong = ap_dung_gabor_filter(anh_chuan_hoa)
-            
-            # Nhị phân hóa
-            anh_nhi_phan, _ = nhi_phan_hoa_otsu(anh_tang_cuong)
-            
-            # Lưu ảnh tiền xử lý (trước khi làm mảnh)
-            self.anh_xu_ly = anh_nhi_phan.copy()
-            
-            # Làm mảnh
-            self.anh_manh = lam_manh_scikit_image(anh_nhi_phan)
-            
-            # Trích minutiae (chỉ cần cho minutiae/comprehensive methods)
-            if method in ['minutiae', 'comprehensive', 'feature']:
-                self.minutiae = trich_minutiae_chi_tiet(self.anh_manh)
-                minutiae_count = len(self.minutiae.get('endings', [])) + len(self.minutiae.get('bifurcations', []))
-                status_msg = f"Xử lý hoàn tất!\n  - Minutiae tìm thấy: {minutiae_count}"
-            else:
-                self.minutiae = None
-                status_msg = "Xử lý hoàn tát!"
+        Args:
+            anh_xam: Ảnh xám cần xử lý
+            method: Phương pháp so khớp (quyết định có trích minutiae hay không)
+            tac_vu: TacVu để báo tiến độ và kiểm tra hủy
             
-            self._cap_nhat_trang_thai(status_msg)
-            return True
-        
-        except Exception as e:
-            self._cap_nhat_trang_thai(f"Lỗi xử lý: {str(e)}")
-            messagebox.showerror("Lỗi", f"Lỗi xử lý ảnh: {str(e)}")
-            return False
+        Returns:
+            tuple: (ảnh tiền xử lý, ảnh làm mảnh, minutiae hoặc None, thông báo)
+        """
+        tac_vu.bao_tien_do("Đang xử lý ảnh...")
+        
+        # Cùng chuỗi xử lý với lúc đăng ký; minutiae chỉ cần cho minutiae/comprehensive methods
+        can_minutiae = method in ['minutiae', 'comprehensive', 'feature']
+        cac_buoc = ('nhi_phan_hoa', 'lam_manh') + (('minutiae',) if can_minutiae else ())
+        kq = self.pipeline.run(anh_xam, cac_buoc, check=tac_vu.kiem_tra_huy)
+        
+        # Ảnh tiền xử lý (trước khi làm mảnh) và ảnh làm mảnh
+        anh_xu_ly = kq['anh_nhi_phan']
+        anh_manh = kq['anh_manh']
+        
+        if can_minutiae:
+            minutiae = kq['minutiae']
+            minutiae_count = len(minutiae.get('endings', [])) + len(minutiae.get('bifurcations', []))
+            status_msg = f"Xử lý hoàn tất!\n  - Minutiae tìm thấy: {minutiae_count}"
+        else:
+            minutiae = None
+            status_msg = "Xử lý hoàn tát!"
+        
+        return anh_xu_ly, anh_manh, minutiae, status_msg
     
     def _tim_kiem(self):
-        """Tìm kiếm người dùng"""
+        """Tìm kiếm người dùng (xử lý ảnh và nhận dạng chạy nền)"""
         if self.anh_xam is None:
             messagebox.showwarning("Cảnh báo", "Vui lòng chọn ảnh vân tay!")
             return
@@ -261,35 +260,44 @@ class GiaoDienTimKiem:
         if not self.db_handler.kiểm_tra_kết_nối():
             return
         
-        try:
+        # Bấm lại khi đang tìm không tạo thêm lượt tìm
+        if self.tac_vu_nen.dang_chay('tim_kiem'):
+            self._cap_nhat_trang_thai("Đang tìm kiếm, vui lòng chờ...")
+            return
+        
+        # Nhận dạng
+        anh_xam = self.anh_xam
+        method = self.var_method.get()
+        method_display = {
+            'minutiae': 'Minutiae Matching',
+            'feature': 'Feature Matching',
+            'lbp': 'LBP Texture',
+            'ridge': 'Ridge Orientation',
+            'frequency': 'Frequency Domain'
+        }.get(method, method)
+        
+        def xu_ly(tac_vu):
             # Xử lý ảnh
-            if not self._xu_ly_anh():
-                return
-            
-            # Nhận dạng
-            method = self.var_method.get()
-            method_display = {
-                'minutiae': 'Minutiae Matching',
-                'feature': 'Feature Matching',
-                'lbp': 'LBP Texture',
-                'ridge': 'Ridge Orientation',
-                'frequency': 'Frequency Domain'
-            }.get(method, method)
-            
-            self._cap_nhat_trang_thai(f"Đang tìm kiếm trong database ({method_display})...")
+            anh_xu_ly, anh_manh, minutiae, status_msg = self._xu_ly_anh(anh_xam, method, tac_vu)
+            tac_vu.bao_tien_do(status_msg)
+            tac_vu.bao_tien_do(f"Đang tìm kiếm trong database ({method_display})...")
             
             results = self.db_handler.nhan_dang_van_tay(
-                self.anh_manh, self.minutiae, method, anh_xu_ly=self.anh_xu_ly
+                anh_manh, minutiae, method, anh_xu_ly=anh_xu_ly, hien_loi=False
             )
+            return anh_xu_ly, anh_manh, minutiae, results
+        
+        def khi_xong(ket_qua):
+            self.anh_xu_ly, self.anh_manh, self.minutiae, results = ket_qua
             
             # Xóa kết quả cũ
             self._xoa_ket_qua()
-            
+        
             # Hiển thị kết quả
             if results:
                 # Tìm kết quả có điểm cao nhất
                 best_score = max([r.get('similarity_score', 0) for r in results]) if results else 0
-                
+            
                 for i, result in enumerate(results):
                     score = result.get('similarity_score', 0)
                     # Tô màu xanh cho kết quả có điểm cao nhất, nếu điểm > 70 cũng tô
@@ -300,7 +308,7 @@ class GiaoDienTimKiem:
                         tag = ('best_match',)
                     elif is_match:
                         tag = ('match',)
-                    
+                
                     self.tree_result.insert(
                         "",
                         tk.END,
@@ -311,7 +319,7 @@ class GiaoDienTimKiem:
                         ),
                         tags=tag if tag else ()
                     )
-                    
+                
                     # Lưu matching history cho tất cả kết quả
                     if self.anh_duong_dan:
                         try:
@@ -320,25 +328,34 @@ class GiaoDienTimKiem:
                                 query_image_path=self.anh_duong_dan,
                                 matching_method=method,
                                 similarity_score=score,
-                                is_match=is_match
+                                is_match=is_match,
+                                user_id=result.get('user_id')
                             )
                         except Exception as e:
                             print(f"Lỗi lưu matching history: {e}")
-                
+            
                 # Cấu hình màu cho match
                 self.tree_result.tag_configure('match', background='lightgreen')
                 self.tree_result.tag_configure('best_match', background='lightgreen', foreground='darkgreen')
-                
+            
                 self._cap_nhat_trang_thai(
                     f"Tìm kiếm hoàn tất!\n"
                     f"  - Kết quả cao nhất: {best_score:.2f}%"
                 )
             else:
                 self._cap_nhat_trang_thai("Không tìm thấy kết quả")
-        
-        except Exception as e:
+    
+        def khi_loi(e):
             messagebox.showerror("Lỗi", f"Lỗi tìm kiếm: {str(e)}")
             self._cap_nhat_trang_thai(f"Lỗi: {str(e)}")
+        
+        self.tac_vu_nen.gui('tim_kiem', xu_ly, khi_xong=khi_xong, khi_loi=khi_loi,
+                            khi_tien_do=self._cap_nhat_trang_thai,
+                            khi_huy=lambda: self._cap_nhat_trang_thai("Đã hủy tìm kiếm"))
+    
+    def _huy_tim_kiem(self):
+        """Hủy lượt tìm kiếm đang chạy"""
+        self.tac_vu_nen.huy('tim_kiem')
     
     def _xoa_ket_qua(self):
         """Xóa kết quả tìm kiếm"""
@@ -0,0 +1,191 @@
+"""
+Module chạy tác vụ nền cho giao diện Tkinter
+Tác vụ nặng (tiền xử lý, làm mảnh, trích đặc trưng, so khớp, tìm kiếm 1:N)
+chạy trên luồng nền; tiến độ và kết quả được chuyển về luồng Tk qua hàng đợi
+được đọc định kỳ bằng widget.after, nên cửa sổ không bị treo
+"""
+
+import queue
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TacVuBiHuy(Exception):
+    """Ném ra trong hàm tác vụ khi tác vụ đã bị hủy"""
+
+
+class TacVu:
+    """
+    Một tác vụ đã gửi vào BoChayTacVu
+
+    Hàm tác vụ nhận đối tượng này để báo tiến độ (bao_tien_do) và kiểm tra
+    hủy giữa các bước (kiem_tra_huy).
+    """
+
+    def __init__(self, bo_chay, khoa):
+        self._bo_chay = bo_chay
+        self.khoa = khoa
+        self._huy = threading.Event()
+        self.future = None
+
+    @property
+    def da_huy(self):
+        """Tác vụ đã bị hủy chưa"""
+        return self._huy.is_set()
+
+    def huy(self):
+        """Yêu cầu hủy: tác vụ chưa chạy sẽ bị bỏ, tác vụ đang chạy dừng ở lần kiem_tra_huy kế tiếp"""
+        self._huy.set()
+        if self.future is not None:
+            self.future.cancel()
+
+    def kiem_tra_huy(self):
+        """Ném TacVuBiHuy nếu tác vụ đã bị hủy"""
+        if self._huy.is_set():
+            raise TacVuBiHuy(self.khoa)
+
+    def bao_tien_do(self, *args):
+        """Gọi khi_tien_do(*args) trên luồng Tk (bỏ qua nếu tác vụ đã bị hủy)"""
+        self.kiem_tra_huy()
+        self._bo_chay._gui_ve(self, 'tien_do', args)
+
+
+class BoChayTacVu:
+    """
+    Chạy tác vụ trên luồng nền, trả tiến độ/kết quả về luồng Tk
+
+    Các tác vụ chạy lần lượt theo thứ tự gửi (mặc định một luồng). Gửi lại một
+    khóa đang chờ hoặc đang chạy (ví dụ bấm nút nhiều lần) không tạo thêm tác
+    vụ mà trả về tác vụ hiện có.
+    """
+
+    # Chu kỳ đọc hàng đợi kết quả (ms)
+    CHU_KY_MS = 50
+
+    def __init__(self, widget, so_luong=1):
+        """
+        Khởi tạo bộ chạy tác vụ
+
+        Args:
+            widget: Widget Tk bất kỳ (dùng widget.after trên luồng Tk)
+            so_luong (int): Số luồng nền
+        """
+        self.widget = widget
+        self._executor = ThreadPoolExecutor(max_workers=so_luong, thread_name_prefix='tac_vu_nen')
+        self._hang_doi = queue.Queue()
+        self._tac_vu = {}  # khóa -> (TacVu, các callback)
+        self._lock = threading.Lock()
+        self._dang_doc = False
+
+    def gui(self, khoa, ham, khi_xong=None, khi_loi=None, khi_tien_do=None, khi_huy=None):
+        """
+        Gửi một tác vụ (gọi trên luồng Tk)
+
+        Args:
+            khoa: Khóa chống trùng (ví dụ ('lam_manh', 1))
+            ham: Hàm ham(tac_vu) chạy trên luồng nền, không được đụng tới widget
+            khi_xong: khi_xong(ket_qua) chạy trên luồng Tk khi tác vụ xong
+            khi_loi: khi_loi(exception) chạy trên luồng Tk khi tác vụ lỗi
+            khi_tien_do: khi_tien_do(*args) chạy trên luồng Tk cho mỗi lần báo tiến độ
+            khi_huy: khi_huy() chạy trên luồng Tk khi tác vụ bị hủy
+
+        Returns:
+            TacVu: Tác vụ mới, hoặc tác vụ cùng khóa đang chờ/chạy
+        """
+        with self._lock:
+            if khoa in self._tac_vu and not self._tac_vu[khoa][0].da_huy:
+                return self._tac_vu[khoa][0]
+            tac_vu = TacVu(self, khoa)
+            self._tac_vu[khoa] = (tac_vu, {'xong': khi_xong, 'loi': khi_loi,
+                                           'tien_do': khi_tien_do, 'huy': khi_huy})
+            tac_vu.future = self._executor.submit(self._chay, tac_vu, ham)
+
+        self._bat_dau_doc()
+        return tac_vu
+
+    def dang_chay(self, khoa):
+        """Có tác vụ với khóa này đang chờ hoặc đang chạy không"""
+        with self._lock:
+            return khoa in self._tac_vu and not self._tac_vu[khoa][0].da_huy
+
+    def huy(self, khoa):
+        """Hủy tác vụ theo khóa (nếu có)"""
+        with self._lock:
+            muc = self._tac_vu.get(khoa)
+        if muc is not None:
+            muc[0].huy()
+            # Tác vụ chưa chạy bị bỏ khỏi pool nên tự báo hủy về luồng Tk
+            if muc[0].future.cancelled():
+                self._gui_ve(muc[0], 'huy', ())
+
+    def huy_tat_ca(self):
+        """Hủy mọi tác vụ đang chờ/chạy"""
+        with self._lock:
+            cac_khoa = list(self._tac_vu)
+        for khoa in cac_khoa:
+            self.huy(khoa)
+
+    def dong(self):
+        """Hủy mọi tác vụ và dừng luồng nền (không chờ tác vụ đang chạy)"""
+        self.huy_tat_ca()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _chay(self, tac_vu, ham):
+        """Chạy trên luồng nền: gọi hàm tác vụ và đưa kết quả vào hàng đợi"""
+        try:
+            tac_vu.kiem_tra_huy()
+            ket_qua = ham(tac_vu)
+            tac_vu.kiem_tra_huy()
+            self._gui_ve(tac_vu, 'xong', (ket_qua,))
+        except TacVuBiHuy:
+            self._gui_ve(tac_vu, 'huy', ())
+        except Exception as e:
+            traceback.print_exc()
+            self._gui_ve(tac_vu, 'loi', (e,))
+
+    def _gui_ve(self, tac_vu, loai, args):
+        """Đưa một callback vào hàng đợi để luồng Tk gọi"""
+        self._hang_doi.put((tac_vu, loai, args))
+
+    def _bat_dau_doc(self):
+        """Bắt đầu đọc hàng đợi định kỳ trên luồng Tk (nếu chưa đọc)"""
+        if not self._dang_doc:
+            self._dang_doc = True
+            self.widget.after(self.CHU_KY_MS, self._doc_hang_doi)
+
+    def _doc_hang_doi(self):
+        """Chạy trên luồng Tk: gọi các callback đang chờ"""
+        while True:
+            try:
+                tac_vu, loai, args = self._hang_doi.get_nowait()
+            except queue.Empty:
+                break
+
+            with self._lock:
+                muc = self._tac_vu.get(tac_vu.khoa)
+                if muc is None or muc[0] is not tac_vu:
+                    continue
+                # Tác vụ đã kết thúc: khóa được giải phóng cho lần gửi sau
+                if loai != 'tien_do':
+                    del self._tac_vu[tac_vu.khoa]
+
+            # Tác vụ bị hủy trong lúc chạy chỉ còn gọi khi_huy
+            if tac_vu.da_huy and loai != 'huy':
+                if loai == 'tien_do':
+                    continue
+                loai, args = 'huy', ()
+
+            callback = muc[1][loai]
+            if callback is not None:
+                try:
+                    callback(*args)
+                except Exception:
+                    traceback.print_exc()
+
+        with self._lock:
+            con_tac_vu = bool(self._tac_vu)
+        if con_tac_vu or not self._hang_doi.empty():
+            self.widget.after(self.CHU_KY_MS, self._doc_hang_doi)
+        else:
+            self._dang_doc = False
@@ -14,18 +14,14 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from tien_xu_ly.chuyen_xam import chuyen_nh_xam, chuyen_xam_tu_mang
-from tien_xu_ly.chuan_hoa import chuan_hoa_anh
-from tien_xu_ly.loc_nhieu import loc_nhieu_bilateral
-from tien_xu_ly.tang_cuong import ap_dung_gabor_filter
-from phan_doan.nhi_phan_hoa import nhi_phan_hoa_otsu
-from lam_manh.lam_manh_anh import lam_manh_scikit_image, loc_nhieu_sau_lam_manh
-from trich_dac_trung.trich_dac_trung_chi_tiet import phan_loai_minutiae, trich_minutiae_chi_tiet, loc_nhieu_minutiae
+from trich_dac_trung.trich_dac_trung_chi_tiet import phan_loai_minutiae
 from trich_dac_trung.ve_dac_trung import ve_minutiae_tren_anh, ve_minutiae_chi_tiet
+from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh
+from giao_dien.tac_vu_nen import BoChayTacVu
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline
 from so_khop.so_khop_van_tay import (
     so_khop_minutiae, tinh_diem_tuong_dong_tien_tien, phan_loai_match,
-    so_khop_feature_matching,
-    so_khop_lbp_texture,
-    so_khop_ridge_orientation, so_khop_frequency_domain
+    MO_TA_THEO_PHUONG_PHAP, chay_cac_phuong_phap
 )
 
 
@@ -63,9 +59,84 @@ class XuLySuKien:
         # Theo dõi ảnh hiện tại đang xử lý (1 hoặc 2)
         self.anh_hien_tai = 1
         
+        # Descriptor đã trích của ảnh tiền xử lý: id(ảnh) -> (ảnh, gói đặc trưng, {phương pháp: descriptor})
+        self._mo_ta_anh = {}
+        
+        # So khớp tất cả: chạy các phương pháp đồng thời, bỏ phương pháp chưa xong sau thời hạn (giây)
+        self.thoi_han_so_khop_tat_ca = 30.0
+        
+        # Các bước xử lý nặng chạy nền, kết quả trả về luồng Tk
+        self.tac_vu_nen = BoChayTacVu(gui.root)
+        
+        # Chuỗi xử lý dùng chung với đăng ký/tìm kiếm; mỗi bước chạy tiếp từ
+        # kết quả đã nhớ của bước trước
+        self.pipeline = getattr(gui, 'pipeline', None) or FingerprintPipeline()
+        
         # Tạo các thư mục lưu trữ nếu chưa tồn tại
         self._tao_thu_muc_luu_tru()
     
+    def _lay_muc_mo_ta(self, anh):
+        """Mục (ảnh, gói đặc trưng, descriptor đã trích) của một ảnh tiền xử lý, tạo nếu chưa có"""
+        muc = self._mo_ta_anh.get(id(anh))
+        if muc is None or muc[0] is not anh:
+            # Chỉ giữ descriptor của hai ảnh đang dùng
+            for khoa, (anh_cu, _, _) in list(self._mo_ta_anh.items()):
+                if anh_cu is not self.anh_xu_ly and anh_cu is not self.anh_xu_ly_2:
+                    self._mo_ta_anh.pop(khoa, None)
+            muc = (anh, GoiDacTrungAnh(anh), {})
+            self._mo_ta_anh[id(anh)] = muc
+        return muc
+    
+    def _lay_mo_ta(self, anh, phuong_phap):
+        """
+        Descriptor của ảnh tiền xử lý cho một phương pháp ('feature', 'lbp', 'ridge', 'frequency')
+        Mỗi ảnh chỉ chuẩn hóa/biến đổi một lần và mỗi descriptor chỉ trích một lần,
+        dùng lại khi so khớp lại hoặc so khớp tất cả
+        """
+        _, goi, mo_ta = self._lay_muc_mo_ta(anh)
+        if phuong_phap not in mo_ta:
+            mo_ta[phuong_phap] = MO_TA_THEO_PHUONG_PHAP[phuong_phap].extract(goi)
+        return mo_ta[phuong_phap]
+    
+    def _so_khop_mo_ta(self, phuong_phap, anh1=None, anh2=None):
+        """So khớp hai ảnh tiền xử lý bằng descriptor đã trích, trả về (kết quả, mô tả 1, mô tả 2)"""
+        mo_ta1 = self._lay_mo_ta(self.anh_xu_ly if anh1 is None else anh1, phuong_phap)
+        mo_ta2 = self._lay_mo_ta(self.anh_xu_ly_2 if anh2 is None else anh2, phuong_phap)
+        return MO_TA_THEO_PHUONG_PHAP[phuong_phap].compare(mo_ta1, mo_ta2), mo_ta1, mo_ta2
+    
+    def _chay_nen(self, khoa, ham, khi_xong, tieu_de_loi, thong_bao):
+        """
+        Chạy một bước xử lý trên luồng nền
+        
+        Args:
+            khoa: Khóa tác vụ, bấm lại khi bước đang chạy sẽ không chạy thêm lần nữa
+            ham: ham(tac_vu) chạy nền, không được đụng tới widget
+            khi_xong: khi_xong(ket_qua) cập nhật giao diện trên luồng Tk
+            tieu_de_loi: Tiêu đề thông báo lỗi
+            thong_bao: Thông báo hiển thị khi bắt đầu
+        """
+        if self.tac_vu_nen.dang_chay(khoa):
+            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao("Bước này đang chạy, vui lòng chờ...")
+            return
+        
+        self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(thong_bao)
+        self.tac_vu_nen.gui(
+            khoa, ham, khi_xong=khi_xong,
+            khi_loi=lambda e: messagebox.showerror("Lỗi", f"{tieu_de_loi}: {str(e)}"),
+            khi_tien_do=self.gui.hien_thi_ket_qua.cap_nhat_thong_bao,
+            khi_huy=lambda: self.gui.hien_thi_ket_qua.cap_nhat_thong_bao("Đã hủy xử lý.")
+        )
+    
+    def _huy_tac_vu_anh(self, so_anh):
+        """Hủy các bước đang chạy của một ảnh (khi chọn ảnh mới) và so khớp đang chạy"""
+        for buoc in ('tien_xu_ly', 'nhi_phan_hoa', 'lam_manh', 'trich_dac_trung'):
+            self.tac_vu_nen.huy((buoc, so_anh))
+        self.tac_vu_nen.huy('so_khop_tat_ca')
+    
+    def huy_tac_vu(self):
+        """Hủy mọi bước xử lý đang chạy nền"""
+        self.tac_vu_nen.huy_tat_ca()
+    
     def _tao_thu_muc_luu_tru(self):
         """Tạo các thư mục lưu trữ nếu chưa tồn tại"""
         thu_muc_can_tao = [
@@ -155,6 +226,7 @@ class XuLySuKien:
         
         if duong_dan:
             try:
+                self._huy_tac_vu_anh(1)
                 self.anh_goc, self.anh_xam = chuyen_nh_xam(duong_dan)
                 self.duong_dan_anh_1 = duong_dan
                 
@@ -191,6 +263,7 @@ class XuLySuKien:
         
         if duong_dan:
             try:
+                self._huy_tac_vu_anh(2)
                 self.anh_goc_2, self.anh_xam_2 = chuyen_nh_xam(duong_dan)
                 self.duong_dan_anh_2 = duong_dan
                 
@@ -219,9 +292,11 @@ class XuLySuKien:
                 messagebox.showerror("Lỗi", f"Không thể tải ảnh: {str(e)}")
     
     def tien_xu_ly_anh(self):
-        """Thực hiện tiền xử lý ảnh"""
+        """Thực hiện tiền xử lý ảnh (chạy nền)"""
+        so_anh = self.anh_hien_tai
+        
         # Kiểm tra ảnh hiện tại
-        if self.anh_hien_tai == 1:
+        if so_anh == 1:
             if self.anh_xam is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng chọn ảnh 1 trước!")
                 return
@@ -234,132 +309,135 @@ class XuLySuKien:
             anh_xam_temp = self.anh_xam_2
             duong_dan_temp = self.duong_dan_anh_2
         
-        try:
-            # Chuẩn hóa
-            anh_chuan_hoa_temp = chuan_hoa_anh(anh_xam_temp)
+        def xu_ly(tac_vu):
+            # Chuẩn hóa → lọc nhiễu → tăng cường (Gabor filter)
+            kq = self.pipeline.run(anh_xam_temp, ('chuan_hoa', 'tang_cuong'),
+                                   check=tac_vu.kiem_tra_huy)
+            anh_chuan_hoa_temp = kq['anh_chuan_hoa']
+            anh_tang_cuong_temp = kq['anh_tang_cuong']
             
-            # Lọc nhiễu
-            anh_loc = loc_nhieu_bilateral(anh_chuan_hoa_temp)
+            # Lưu ảnh xám
+            self._luu_anh(anh_xam_temp, 'anh_xam', duong_dan_temp)
             
-            # Tăng cường (Gabor filter)
-            anh_tang_cuong_temp = ap_dung_gabor_filter(anh_loc, kernel_size=21, num_orientations=6)
+            # Lưu ảnh tăng cường
+            self._luu_anh(anh_tang_cuong_temp, 'anh_tang_cuong', duong_dan_temp)
+            return anh_chuan_hoa_temp, anh_tang_cuong_temp
+        
+        def khi_xong(ket_qua):
+            anh_chuan_hoa_temp, anh_tang_cuong_temp = ket_qua
             
             # Gán cho ảnh tương ứng
-            if self.anh_hien_tai == 1:
+            if so_anh == 1:
                 self.anh_chuan_hoa = anh_chuan_hoa_temp
                 self.anh_tang_cuong = anh_tang_cuong_temp
             else:
                 self.anh_chuan_hoa_2 = anh_chuan_hoa_temp
                 self.anh_tang_cuong_2 = anh_tang_cuong_temp
             
-            # Lưu ảnh xám
-            self._luu_anh(anh_xam_temp, 'anh_xam', duong_dan_temp)
-            
-            # Lưu ảnh tăng cường
-            self._luu_anh(anh_tang_cuong_temp, 'anh_tang_cuong', duong_dan_temp)
-            
             # Hiển thị cả 2 ảnh
             self.gui.hien_thi_ket_qua.hien_thi_anh_sau_xu_ly(self.anh_tang_cuong, self.anh_tang_cuong_2)
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Tiền xử lý ảnh {self.anh_hien_tai} hoàn tất!")
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi trong tiền xử lý: {str(e)}")
+            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Tiền xử lý ảnh {so_anh} hoàn tất!")
+        
+        self._chay_nen(('tien_xu_ly', so_anh), xu_ly, khi_xong, "Lỗi trong tiền xử lý",
+                       f"Đang tiền xử lý ảnh {so_anh}, vui lòng chờ...")
     
     def nhi_phan_hoa_anh(self):
-        """Nhị phân hóa ảnh"""
+        """Nhị phân hóa ảnh (chạy nền)"""
+        so_anh = self.anh_hien_tai
+        
         # Kiểm tra ảnh hiện tại
-        if self.anh_hien_tai == 1:
+        if so_anh == 1:
             if self.anh_tang_cuong is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng thực hiện tiền xử lý ảnh 1 trước!")
                 return
-            anh_tang_cuong_temp = self.anh_tang_cuong
+            anh_xam_temp = self.anh_xam
             duong_dan_temp = self.duong_dan_anh_1
         else:  # anh_hien_tai == 2
             if self.anh_tang_cuong_2 is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng thực hiện tiền xử lý ảnh 2 trước!")
                 return
-            anh_tang_cuong_temp = self.anh_tang_cuong_2
+            anh_xam_temp = self.anh_xam_2
             duong_dan_temp = self.duong_dan_anh_2
         
-        try:
-            # Nhị phân hóa
-            anh_nhi_phan_temp, ngung = nhi_phan_hoa_otsu(anh_tang_cuong_temp)
+        def xu_ly(tac_vu):
+            # Nhị phân hóa (Otsu) + làm sạch, các bước trước lấy từ pipeline
+            kq = self.pipeline.run(anh_xam_temp, 'nhi_phan_hoa', check=tac_vu.kiem_tra_huy)
+            anh_nhi_phan_temp, ngung = kq['anh_nhi_phan'], kq['nguong']
             
-            # Làm sạch
-            from phan_doan.nhi_phan_hoa import lam_sach_anh_nhi_phan
-            anh_nhi_phan_temp = lam_sach_anh_nhi_phan(anh_nhi_phan_temp)
+            # Lưu ảnh nhị phân
+            self._luu_anh(anh_nhi_phan_temp, 'anh_nhi_phan', duong_dan_temp)
+            return anh_nhi_phan_temp, ngung
+        
+        def khi_xong(ket_qua):
+            anh_nhi_phan_temp, ngung = ket_qua
             
             # Gán cho ảnh tương ứng
-            if self.anh_hien_tai == 1:
+            if so_anh == 1:
                 self.anh_nhi_phan = anh_nhi_phan_temp
                 self.anh_xu_ly = anh_nhi_phan_temp.copy()  # Lưu ảnh tiền xử lý (chưa làm mảnh)
             else:
                 self.anh_nhi_phan_2 = anh_nhi_phan_temp
                 self.anh_xu_ly_2 = anh_nhi_phan_temp.copy()  # Lưu ảnh tiền xử lý (chưa làm mảnh)
             
-            # Lưu ảnh nhị phân
-            self._luu_anh(anh_nhi_phan_temp, 'anh_nhi_phan', duong_dan_temp)
-            
             # Hiển thị cả 2 ảnh
             self.gui.hien_thi_ket_qua.hien_thi_anh_sau_xu_ly(self.anh_nhi_phan, self.anh_nhi_phan_2)
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Nhị phân hóa ảnh {self.anh_hien_tai} hoàn tất! (Ngưỡng: {ngung})")
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi trong nhị phân hóa: {str(e)}")
+            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Nhị phân hóa ảnh {so_anh} hoàn tất! (Ngưỡng: {ngung})")
+        
+        self._chay_nen(('nhi_phan_hoa', so_anh), xu_ly, khi_xong, "Lỗi trong nhị phân hóa",
+                       f"Đang nhị phân hóa ảnh {so_anh}...")
     
     def lam_manh_anh(self):
-        """Làm mảnh ảnh"""
+        """Làm mảnh ảnh (chạy nền)"""
+        so_anh = self.anh_hien_tai
+        
         # Kiểm tra ảnh hiện tại
-        if self.anh_hien_tai == 1:
+        if so_anh == 1:
             if self.anh_nhi_phan is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng thực hiện nhị phân hóa ảnh 1 trước!")
                 return
-            anh_nhi_phan_temp = self.anh_nhi_phan
+            anh_xam_temp = self.anh_xam
             duong_dan_temp = self.duong_dan_anh_1
         else:  # anh_hien_tai == 2
             if self.anh_nhi_phan_2 is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng thực hiện nhị phân hóa ảnh 2 trước!")
                 return
-            anh_nhi_phan_temp = self.anh_nhi_phan_2
+            anh_xam_temp = self.anh_xam_2
             duong_dan_temp = self.duong_dan_anh_2
         
-        try:
-            # Hiển thị thông báo đang xử lý
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Đang làm mảnh ảnh {self.anh_hien_tai}, vui lòng chờ...")
-            self.gui.root.update()
-            
-            # Sử dụng scikit-image (nhanh hơn)
-            from lam_manh.lam_manh_anh import lam_manh_scikit_image
-            anh_manh_temp = lam_manh_scikit_image(anh_nhi_phan_temp)
-            
-            # Lọc nhiễu
-            anh_manh_temp = loc_nhieu_sau_lam_manh(anh_manh_temp, min_length=3)
+        def xu_ly(tac_vu):
+            # Làm mảnh bằng scikit-image + lọc đường ngắn
+            kq = self.pipeline.run(anh_xam_temp, 'lam_manh', check=tac_vu.kiem_tra_huy)
+            anh_manh_temp = kq['anh_manh']
             
+            # Lưu ảnh làm mảnh
+            self._luu_anh(anh_manh_temp, 'anh_lam_manh', duong_dan_temp)
+            return anh_manh_temp
+        
+        def khi_xong(anh_manh_temp):
             # Gán cho ảnh tương ứng
-            if self.anh_hien_tai == 1:
+            if so_anh == 1:
                 self.anh_manh = anh_manh_temp
             else:
                 self.anh_manh_2 = anh_manh_temp
             
-            # Lưu ảnh làm mảnh
-            self._luu_anh(anh_manh_temp, 'anh_lam_manh', duong_dan_temp)
-            
             # Hiển thị cả 2 ảnh
             self.gui.hien_thi_ket_qua.hien_thi_anh_sau_xu_ly(self.anh_manh, self.anh_manh_2)
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Làm mảnh ảnh {self.anh_hien_tai} hoàn tất!")
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi trong làm mảnh: {str(e)}")
+            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(f"Làm mảnh ảnh {so_anh} hoàn tất!")
+        
+        self._chay_nen(('lam_manh', so_anh), xu_ly, khi_xong, "Lỗi trong làm mảnh",
+                       f"Đang làm mảnh ảnh {so_anh}, vui lòng chờ...")
     
     def trich_dac_trung(self):
-        """Trích tất cả các loại đặc trưng: Minutiae, LBP, Ridge, Frequency"""
+        """Trích tất cả các loại đặc trưng: Minutiae, LBP, Ridge, Frequency (chạy nền)"""
+        so_anh = self.anh_hien_tai
+        
         # Kiểm tra ảnh hiện tại
-        if self.anh_hien_tai == 1:
+        if so_anh == 1:
             if self.anh_manh is None:
                 messagebox.showwarning("Cảnh báo", "Vui lòng làm mảnh ảnh 1 trước!")
                 return
             anh_goc_temp = self.anh_goc
-            anh_manh_temp = self.anh_manh
+            anh_xam_temp = self.anh_xam
             anh_xu_ly_temp = self.anh_xu_ly
             duong_dan_temp = self.duong_dan_anh_1
         else:  # anh_hien_tai == 2
@@ -367,51 +445,35 @@ class XuLySuKien:
                 messagebox.showwarning("Cảnh báo", "Vui lòng làm mảnh ảnh 2 trước!")
                 return
             anh_goc_temp = self.anh_goc_2
-            anh_manh_temp = self.anh_manh_2
+            anh_xam_temp = self.anh_xam_2
             anh_xu_ly_temp = self.anh_xu_ly_2
             duong_dan_temp = self.duong_dan_anh_2
         
-        try:
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao("Đang trích tất cả các loại đặc trưng...")
-            self.gui.root.update()
+        def xu_ly(tac_vu):
+            thông_báo = "Trích đặc trưng ảnh " + str(so_anh) + ":\n\n"
+            minutiae_temp = None
+            anh_ve = None
             
-            thông_báo = "Trích đặc trưng ảnh " + str(self.anh_hien_tai) + ":\n\n"
-            
-            # 1. Trích Minutiae
+            # 1. Trích Minutiae (đã lọc nhiễu trong pipeline)
             try:
-                minutiae_temp = trich_minutiae_chi_tiet(anh_manh_temp)
-                
-                # Lọc nhiễu
-                endings = [m['position'] for m in minutiae_temp['endings']]
-                bifurcations = [m['position'] for m in minutiae_temp['bifurcations']]
-                
-                if endings or bifurcations:
-                    endings, bifurcations = loc_nhieu_minutiae(endings, bifurcations, min_distance=2)
-                
-                minutiae_temp['endings'] = [m for m in minutiae_temp['endings'] 
-                                           if m['position'] in endings]
-                minutiae_temp['bifurcations'] = [m for m in minutiae_temp['bifurcations'] 
-                                                if m['position'] in bifurcations]
-                
+                minutiae_temp = self.pipeline.run(anh_xam_temp, 'minutiae')['minutiae']
+            
                 num_endings = len(minutiae_temp['endings'])
                 num_bifurcations = len(minutiae_temp['bifurcations'])
                 total_minutiae = num_endings + num_bifurcations
-                
-                # Gán kết quả
-                if self.anh_hien_tai == 1:
-                    self.minutiae = minutiae_temp
-                    self.minutiae_ve = ve_minutiae_chi_tiet(anh_goc_temp, minutiae_temp)
-                else:
-                    self.minutiae_2 = minutiae_temp
-                    self.minutiae_ve_2 = ve_minutiae_chi_tiet(anh_goc_temp, minutiae_temp)
-                
+            
+                # Vẽ minutiae (gán vào ảnh tương ứng khi xong)
+                anh_ve = ve_minutiae_chi_tiet(anh_goc_temp, minutiae_temp)
+            
                 thông_báo += f"🔎 Minutiae: {num_endings} ending + {num_bifurcations} bifurcation = {total_minutiae}\n"
             except Exception as e:
                 import traceback
                 thông_báo += f"Minutiae: Lỗi - {str(e)}\n"
                 print(f"Lỗi trích Minutiae: {e}")
                 traceback.print_exc()
-            
+                minutiae_temp = None
+            tac_vu.kiem_tra_huy()
+        
             # 2. Trích LBP Features
             try:
                 from skimage.feature import local_binary_pattern
@@ -421,7 +483,7 @@ class XuLySuKien:
             except Exception as e:
                 thông_báo += f"LBP: Lỗi - {str(e)}\n"
                 print(f"Lỗi trích LBP: {e}")
-            
+        
             # 3. Trích Ridge Orientation
             try:
                 # Ridge orientation được tính từ ảnh nhị phân
@@ -429,7 +491,7 @@ class XuLySuKien:
             except Exception as e:
                 thông_báo += f"Ridge: Lỗi - {str(e)}\n"
                 print(f"Lỗi trích Ridge: {e}")
-            
+        
             # 4. Trích Frequency Domain
             try:
                 from scipy.fftpack import fft2, fftshift
@@ -439,28 +501,36 @@ class XuLySuKien:
             except Exception as e:
                 thông_báo += f"Frequency: Lỗi - {str(e)}\n"
                 print(f"Lỗi trích Frequency: {e}")
+        
+            thông_báo += f"\nHoàn tất trích tất cả đặc trưng cho ảnh {so_anh}"
+            
+            # Lưu ảnh minutiae
+            if anh_ve is not None:
+                self._luu_anh(anh_ve, 'dac_trung', duong_dan_temp)
+            return minutiae_temp, anh_ve, thông_báo
+        
+        def khi_xong(ket_qua):
+            minutiae_temp, anh_ve, thông_báo = ket_qua
             
-            thông_báo += f"\nHoàn tất trích tất cả đặc trưng cho ảnh {self.anh_hien_tai}"
+            # Gán kết quả
+            if minutiae_temp is not None:
+                if so_anh == 1:
+                    self.minutiae = minutiae_temp
+                    self.minutiae_ve = anh_ve
+                else:
+                    self.minutiae_2 = minutiae_temp
+                    self.minutiae_ve_2 = anh_ve
             
             self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(thông_báo)
             
             # Hiển thị cả 2 ảnh minutiae
-            anh_ve_1 = self.minutiae_ve if hasattr(self, 'minutiae_ve') else None
-            anh_ve_2 = self.minutiae_ve_2 if hasattr(self, 'minutiae_ve_2') else None
-            
-            if anh_ve_1 is not None or anh_ve_2 is not None:
-                self.gui.hien_thi_ket_qua.hien_thi_anh_after_xu_ly(anh_ve_1, anh_ve_2)
-                if self.anh_hien_tai == 1 and anh_ve_1 is not None:
-                    self._luu_anh(anh_ve_1, 'dac_trung', self.duong_dan_anh_1)
-                elif self.anh_hien_tai == 2 and anh_ve_2 is not None:
-                    self._luu_anh(anh_ve_2, 'dac_trung', self.duong_dan_anh_2)
+            if self.minutiae_ve is not None or self.minutiae_ve_2 is not None:
+                self.gui.hien_thi_ket_qua.hien_thi_anh_after_xu_ly(self.minutiae_ve, self.minutiae_ve_2)
             
             self.gui.hien_thi_ket_qua.cap_nhat_thong_tin(anh_goc_temp.shape, 0, 0)
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi trong trích đặc trưng: {str(e)}")
-            import traceback
-            traceback.print_exc()
+        
+        self._chay_nen(('trich_dac_trung', so_anh), xu_ly, khi_xong, "Lỗi trong trích đặc trưng",
+                       "Đang trích tất cả các loại đặc trưng...")
     
     def so_khop_anh(self):
         """So khớp hai ảnh vân tay"""
@@ -508,57 +578,44 @@ class XuLySuKien:
             messagebox.showerror("Lỗi", f"Lỗi trong so khớp: {str(e)}")
     
     def so_khop_tat_ca(self):
-        """So khớp tất cả các phương pháp để so sánh"""
+        """So khớp tất cả các phương pháp để so sánh (chạy nền)"""
         if self.anh_xu_ly is None or self.anh_xu_ly_2 is None:
             messagebox.showwarning("Cảnh báo", "Vui lòng làm mảnh ảnh cho cả hai ảnh!")
             return
         
-        try:
-            # Lưu phương pháp cũ
-            phương_pháp_cũ = self.gui.matching_method.get()
-            
-            # Danh sách các phương pháp cần so khớp
-            phương_pháp_list = ['minutiae', 'feature', 'lbp', 'ridge', 'frequency']
-            kết_quả_all = {}
-            
-            self.gui.hien_thi_ket_qua.cap_nhat_thong_bao("Đang so khớp tất cả các phương pháp...")
-            self.gui.root.update()
-            
-            # So khớp từng phương pháp
-            for phương_pháp in phương_pháp_list:
-                try:
-                    # Cập nhật dropdown
-                    self.gui.matching_method.set(phương_pháp)
-                    self.gui.root.update()
-                    
-                    if phương_pháp == 'minutiae':
-                        result = so_khop_minutiae(self.minutiae, self.minutiae_2, 
-                                                 max_distance=50, angle_tolerance=30)
-                        similarity_score = tinh_diem_tuong_dong_tien_tien(
-                            self.minutiae, self.minutiae_2
-                        )
-                    elif phương_pháp == 'feature':
-                        result = so_khop_feature_matching(self.anh_xu_ly, self.anh_xu_ly_2)
-                        similarity_score = result.get('similarity_score', 0)
-                    elif phương_pháp == 'lbp':
-                        result = so_khop_lbp_texture(self.anh_xu_ly, self.anh_xu_ly_2)
-                        similarity_score = result.get('similarity_score', 0)
-                    elif phương_pháp == 'ridge':
-                        result = so_khop_ridge_orientation(self.anh_xu_ly, self.anh_xu_ly_2)
-                        similarity_score = result.get('similarity_score', 0)
-                    elif phương_pháp == 'frequency':
-                        result = so_khop_frequency_domain(self.anh_xu_ly, self.anh_xu_ly_2)
-                        similarity_score = result.get('similarity_score', 0)
-                    
-                    kết_quả_all[phương_pháp] = similarity_score
-                    
-                except Exception as e:
-                    print(f"Lỗi so khớp {phương_pháp}: {e}")
-                    kết_quả_all[phương_pháp] = 0
-            
-            # Khôi phục phương pháp cũ
-            self.gui.matching_method.set(phương_pháp_cũ)
-            self.gui.root.update()
+        # Danh sách các phương pháp cần so khớp
+        phương_pháp_list = ['minutiae', 'feature', 'lbp', 'ridge', 'frequency']
+        
+        # Chụp dữ liệu hiện tại: chọn/xử lý lại ảnh trong lúc so khớp không ảnh hưởng
+        anh1, anh2 = self.anh_xu_ly, self.anh_xu_ly_2
+        minutiae1, minutiae2 = self.minutiae, self.minutiae_2
+        thoi_han = self.thoi_han_so_khop_tat_ca
+        
+        # Tạo sẵn mục descriptor của hai ảnh trước khi các luồng dùng chung
+        self._lay_muc_mo_ta(anh1)
+        self._lay_muc_mo_ta(anh2)
+        
+        def so_khop_mot_phuong_phap(phương_pháp):
+            try:
+                if phương_pháp == 'minutiae':
+                    return tinh_diem_tuong_dong_tien_tien(minutiae1, minutiae2)
+                # Mỗi ảnh dùng chung một gói đặc trưng cho mọi phương pháp
+                result, _, _ = self._so_khop_mo_ta(phương_pháp, anh1, anh2)
+                return result.get('similarity_score', 0)
+            except Exception as e:
+                print(f"Lỗi so khớp {phương_pháp}: {e}")
+                return 0
+        
+        def xu_ly(tac_vu):
+            # Các phương pháp chạy đồng thời, kết quả theo thứ tự phương_pháp_list
+            return chay_cac_phuong_phap(
+                [(phương_pháp, lambda phương_pháp=phương_pháp: so_khop_mot_phuong_phap(phương_pháp))
+                 for phương_pháp in phương_pháp_list],
+                song_song=True, thoi_han=thoi_han
+            )
+        
+        def khi_xong(ket_qua):
+            kết_quả_all, thời_gian, quá_hạn = ket_qua
             
             # Hiển thị kết quả tất cả phương pháp
             tên_phương_pháp = {
@@ -568,22 +625,26 @@ class XuLySuKien:
                 'ridge': 'Ridge Orientation',
                 'frequency': 'Frequency Domain'
             }
-            
-            # Sắp xếp theo điểm giảm dần
+        
+            # Sắp xếp theo điểm giảm dần (sorted ổn định: cùng điểm giữ thứ tự phương pháp)
             kết_quả_sắp_xếp = sorted(kết_quả_all.items(), key=lambda x: x[1], reverse=True)
-            
+        
             # Tạo thông báo chi tiết
             thông_báo = "KẾT QUẢ SO KHỚP TẤT CẢ PHƯƠNG PHÁP:\n\n"
             for i, (phương_pháp, điểm) in enumerate(kết_quả_sắp_xếp, 1):
-                thông_báo += f"{i}. {tên_phương_pháp[phương_pháp]}: {điểm:.2f}%\n"
-            
-            điểm_cao_nhất = kết_quả_sắp_xếp[0][1]
-            thông_báo += f"\nPhương pháp tốt nhất: {tên_phương_pháp[kết_quả_sắp_xếp[0][0]]} ({điểm_cao_nhất:.2f}%)"
-            
+                thông_báo += (f"{i}. {tên_phương_pháp[phương_pháp]}: {điểm:.2f}% "
+                              f"({thời_gian[phương_pháp] * 1000:.0f} ms)\n")
+            for phương_pháp in quá_hạn:
+                thông_báo += f"- {tên_phương_pháp[phương_pháp]}: quá thời hạn {thoi_han:.0f}s, bỏ qua\n"
+        
+            if kết_quả_sắp_xếp:
+                điểm_cao_nhất = kết_quả_sắp_xếp[0][1]
+                thông_báo += f"\nPhương pháp tốt nhất: {tên_phương_pháp[kết_quả_sắp_xếp[0][0]]} ({điểm_cao_nhất:.2f}%)"
+        
             self.gui.hien_thi_ket_qua.cap_nhat_thong_bao(thông_báo)
-            
-        except Exception as e:
-            messagebox.showerror("Lỗi", f"Lỗi so khớp tất cả: {str(e)}")
+        
+        self._chay_nen('so_khop_tat_ca', xu_ly, khi_xong, "Lỗi so khớp tất cả",
+                       "Đang so khớp tất cả các phương pháp...")
     
     def _so_khop_minutiae_default(self):
         """So khớp minutiae mặc định"""
@@ -653,7 +714,7 @@ class XuLySuKien:
         
         try:
             # Sử dụng ảnh tiền xử lý để trích features tốt hơn
-            result = so_khop_feature_matching(self.anh_xu_ly, self.anh_xu_ly_2)
+            result, _, _ = self._so_khop_mo_ta('feature')
             similarity_score = result['similarity_score']
             
             self.gui.hien_thi_ket_qua.cap_nhat_phuong_phap_so_khop('feature')
@@ -691,18 +752,8 @@ class XuLySuKien:
             return
         
         try:
-            # Trích LBP features từ cả hai ảnh
-            from trich_dac_trung.trich_dac_trung_chi_tiet import trich_lbp_features
-            import cv2
-            
-            anh1_gray = cv2.cvtColor(self.anh_xu_ly, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly.shape) == 3 else self.anh_xu_ly
-            anh2_gray = cv2.cvtColor(self.anh_xu_ly_2, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly_2.shape) == 3 else self.anh_xu_ly_2
-            
-            features1 = trich_lbp_features(anh1_gray)
-            features2 = trich_lbp_features(anh2_gray)
-            
-            # Sử dụng ảnh tiền xử lý để trích LBP texture tốt hơn
-            result = so_khop_lbp_texture(self.anh_xu_ly, self.anh_xu_ly_2)
+            # Trích LBP features từ cả hai ảnh tiền xử lý (mỗi ảnh một lần) rồi so khớp
+            result, features1, features2 = self._so_khop_mo_ta('lbp')
             similarity_score = result.get('similarity_score', 0)
             
             self.gui.hien_thi_ket_qua.cap_nhat_phuong_phap_so_khop('lbp')
@@ -710,8 +761,8 @@ class XuLySuKien:
             # Cập nhật thông tin chi tiết
             chi_square_distance = result.get('chi_square_distance', 0)
             # Lấy histogram size từ features
-            histogram_size1 = len(features1.get('lbp_histogram', [])) if 'lbp_histogram' in features1 else 0
-            histogram_size2 = len(features2.get('lbp_histogram', [])) if 'lbp_histogram' in features2 else 0
+            histogram_size1 = len(features1['lbp_histogram'])
+            histogram_size2 = len(features2['lbp_histogram'])
             self.gui.hien_thi_ket_qua.cap_nhat_chi_tiet_lbp(chi_square_distance, histogram_size1, histogram_size2)
             
             self.gui.hien_thi_ket_qua.cap_nhat_ket_qua_so_khop(0, similarity_score)
@@ -729,19 +780,8 @@ class XuLySuKien:
             return
         
         try:
-            # Trích Ridge features từ cả hai ảnh
-            from trich_dac_trung.trich_dac_trung_chi_tiet import trich_ridge_orientation_field
-            import cv2
-            import numpy as np
-            
-            anh1_gray = cv2.cvtColor(self.anh_xu_ly, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly.shape) == 3 else self.anh_xu_ly
-            anh2_gray = cv2.cvtColor(self.anh_xu_ly_2, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly_2.shape) == 3 else self.anh_xu_ly_2
-            
-            features1 = trich_ridge_orientation_field(anh1_gray)
-            features2 = trich_ridge_orientation_field(anh2_gray)
-            
-            # Sử dụng ảnh tiền xử lý để tính ridge orientation tốt hơn
-            result = so_khop_ridge_orientation(self.anh_xu_ly, self.anh_xu_ly_2)
+            # Trích Ridge features từ cả hai ảnh tiền xử lý (mỗi ảnh một lần) rồi so khớp
+            result, features1, features2 = self._so_khop_mo_ta('ridge')
             similarity_score = result.get('similarity_score', 0)
             
             self.gui.hien_thi_ket_qua.cap_nhat_phuong_phap_so_khop('ridge')
@@ -749,8 +789,8 @@ class XuLySuKien:
             # Cập nhật thông tin chi tiết
             mean_diff = result.get('mean_orientation_diff', 0)
             # Tính trung bình góc từ orientation fields
-            field1 = np.array(features1.get('orientation_field', []))
-            field2 = np.array(features2.get('orientation_field', []))
+            field1 = features1['orientation_field']
+            field2 = features2['orientation_field']
             avg_angle1 = float(np.mean(field1)) if field1.size > 0 else 0
             avg_angle2 = float(np.mean(field2)) if field2.size > 0 else 0
             self.gui.hien_thi_ket_qua.cap_nhat_chi_tiet_ridge(mean_diff, avg_angle1, avg_angle2)
@@ -770,18 +810,8 @@ class XuLySuKien:
             return
         
         try:
-            # Trích Frequency features từ cả hai ảnh
-            from trich_dac_trung.trich_dac_trung_chi_tiet import trich_frequency_domain_features
-            import cv2
-            
-            anh1_gray = cv2.cvtColor(self.anh_xu_ly, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly.shape) == 3 else self.anh_xu_ly
-            anh2_gray = cv2.cvtColor(self.anh_xu_ly_2, cv2.COLOR_BGR2GRAY) if len(self.anh_xu_ly_2.shape) == 3 else self.anh_xu_ly_2
-            
-            features1 = trich_frequency_domain_features(anh1_gray)
-            features2 = trich_frequency_domain_features(anh2_gray)
-            
-            # Sử dụng ảnh tiền xử lý để phân tích frequency domain tốt hơn
-            result = so_khop_frequency_domain(self.anh_xu_ly, self.anh_xu_ly_2)
+            # Trích Frequency features từ cả hai ảnh tiền xử lý (mỗi ảnh một lần) rồi so khớp
+            result, features1, features2 = self._so_khop_mo_ta('frequency')
             similarity_score = result.get('similarity_score', 0)
             
             self.gui.hien_thi_ket_qua.cap_nhat_phuong_phap_so_khop('frequency')
@@ -790,8 +820,8 @@ class XuLySuKien:
             freq_sim = result.get('frequency_similarity', 0)
             energy_sim = result.get('energy_similarity', 0)
             # Lấy FFT frequency info từ features
-            fft_info1 = f"{features1.get('dominant_frequency', 0):.1f} Hz" if 'dominant_frequency' in features1 else "-"
-            fft_info2 = f"{features2.get('dominant_frequency', 0):.1f} Hz" if 'dominant_frequency' in features2 else "-"
+            fft_info1 = f"{features1['dominant_frequency']:.1f} Hz"
+            fft_info2 = f"{features2['dominant_frequency']:.1f} Hz"
             self.gui.hien_thi_ket_qua.cap_nhat_chi_tiet_frequency(
                 freq_sim, energy_sim, similarity_score, fft_info1, fft_info2
             )
@@ -8,10 +8,107 @@ import numpy as np
 from scipy import ndimage
 
 
+# Thứ tự 8 lân cận P2..P9 theo vòng tròn, bit k của mã lân cận ứng với phần tử k
+_LAN_CAN_ZHANG_SUEN = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+
+def _tao_bang_tra_zhang_suen():
+    """
+    Tạo bảng tra 256 phần tử: True nếu pixel tiền cảnh có cấu hình lân cận này bị xóa
+    Cùng điều kiện với _zhang_suen_single_pass
+    """
+    ma = np.arange(256)
+    p2, p3, p4, p5, p6, p7, p8, p9 = ((ma[:, None] >> np.arange(8)) & 1).T
+    
+    bp = p2 + p3 + p4 + p5 + p6 + p7 + p8 + p9
+    vong = [p2, p3, p4, p5, p6, p7, p8, p9, p2]
+    
+    # Bản gốc cộng các np.bool_ với nhau (phép cộng bool là OR), nên sp == 1
+    # thực chất nghĩa là "có ít nhất một chuyển đổi 0->1"; giữ đúng hành vi đó
+    co_chuyen_doi = np.zeros(256, dtype=bool)
+    for k in range(8):
+        co_chuyen_doi |= (vong[k] == 0) & (vong[k + 1] == 1)
+    
+    bang_xoa = ((bp >= 2) & (bp <= 6) & co_chuyen_doi &
+                ~((p2 == 1) & (p4 == 1) & (p8 == 1)) &
+                ~((p2 == 1) & (p4 == 1) & (p6 == 1)) &
+                ~((p2 == 1) & (p6 == 1) & (p8 == 1)) &
+                ~((p4 == 1) & (p6 == 1) & (p8 == 1)))
+    return bang_xoa
+
+
+_BANG_XOA_ZHANG_SUEN = _tao_bang_tra_zhang_suen()
+
+
 def lam_manh_zhang_suen_optimize(anh_nhi_phan, max_iterations=100):
     """
     Làm mảnh ảnh bằng thuật toán Zhang-Suen (tối ưu hóa)
     Có giới hạn số lần lặp để tránh quay vô hạn
+    Mỗi pass tra bảng 256 cấu hình lân cận cho mọi điểm ứng viên cùng lúc,
+    pass sau chỉ xét lại lân cận của các điểm vừa bị xóa
+    
+    Args:
+        anh_nhi_phan (np.ndarray): Ảnh nhị phân đầu vào (255 và 0)
+        max_iterations (int): Số lần lặp tối đa
+        
+    Returns:
+        np.ndarray: Ảnh sau làm mảnh
+    """
+    # Chuẩn bị ảnh: chuyển thành 0 và 1
+    skeleton = anh_nhi_phan.copy()
+    skeleton[skeleton == 255] = 1
+    skeleton = skeleton.astype(np.uint8)
+    
+    # Bảng tra chỉ đúng cho ảnh thuần nhị phân, các giá trị khác dùng bản gốc
+    if skeleton.max(initial=0) > 1:
+        return lam_manh_zhang_suen_tung_pixel(anh_nhi_phan, max_iterations)
+    
+    h, w = skeleton.shape
+    anh = skeleton.astype(bool)
+    
+    if h < 3 or w < 3:
+        return anh.astype(np.uint8) * 255
+    
+    # Pass đầu tiên xét toàn bộ điểm tiền cảnh bên trong ảnh
+    hang, cot = np.nonzero(anh[1:h - 1, 1:w - 1])
+    hang += 1
+    cot += 1
+    
+    iteration = 0
+    while iteration < max_iterations and hang.size > 0:
+        iteration += 1
+        
+        # Mã lân cận tính trên trạng thái trước pass (xóa đồng thời)
+        ma = np.zeros(hang.size, dtype=np.uint8)
+        for k, (di, dj) in enumerate(_LAN_CAN_ZHANG_SUEN):
+            ma |= anh[hang + di, cot + dj].astype(np.uint8) << k
+        
+        xoa = _BANG_XOA_ZHANG_SUEN[ma]
+        hang_xoa, cot_xoa = hang[xoa], cot[xoa]
+        
+        # Kiểm tra hội tụ
+        if hang_xoa.size == 0:
+            break
+        
+        anh[hang_xoa, cot_xoa] = False
+        
+        # Chỉ những điểm kề điểm vừa xóa mới có thể đổi kết quả ở pass sau
+        ung_vien = np.zeros_like(anh)
+        for di in (-1, 0, 1):
+            for dj in (-1, 0, 1):
+                ung_vien[hang_xoa + di, cot_xoa + dj] = True
+        ung_vien[[0, h - 1], :] = False
+        ung_vien[:, [0, w - 1]] = False
+        hang, cot = np.nonzero(ung_vien & anh)
+    
+    # Chuyển lại sang 0 và 255
+    return anh.astype(np.uint8) * 255
+
+
+def lam_manh_zhang_suen_tung_pixel(anh_nhi_phan, max_iterations=100):
+    """
+    Làm mảnh Zhang-Suen bằng cách duyệt từng pixel (bản gốc, chậm)
+    Giữ lại làm chuẩn đối chiếu và cho ảnh không thuần nhị phân
     
     Args:
         anh_nhi_phan (np.ndarray): Ảnh nhị phân đầu vào (255 và 0)
@@ -127,9 +224,10 @@ def loc_nhieu_sau_lam_manh(anh_manh, min_length=5):
     
     anh_loc = anh_manh.copy()
     
-    for label_id in range(1, num_features + 1):
-        component = labeled_array == label_id
-        if np.sum(component) < min_length:
-            anh_loc[component] = 0
+    # Kích thước mọi thành phần trong một lần đếm, xóa bằng bảng tra theo nhãn
+    kich_thuoc = np.bincount(labeled_array.ravel(), minlength=num_features + 1)
+    qua_ngan = kich_thuoc < min_length
+    qua_ngan[0] = False  # Nền
+    anh_loc[qua_ngan[labeled_array]] = 0
     
     return anh_loc
@@ -0,0 +1,624 @@
+"""
+Module chuỗi xử lý vân tay dùng chung
+Chuẩn hóa → lọc nhiễu → Gabor → Otsu → làm mảnh → minutiae (→ descriptor)
+với cùng một cấu hình cho màn hình so sánh, đăng ký, tìm kiếm và xử lý hàng
+loạt, đo thời gian từng bước và nhớ kết quả từng bước theo (ảnh, cấu hình)
+trong RAM và (tuỳ chọn) trên đĩa
+"""
+
+import contextlib
+import hashlib
+import io
+import json
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import cv2
+import numpy as np
+
+from tien_xu_ly.chuan_hoa import chuan_hoa_anh
+from tien_xu_ly.loc_nhieu import loc_nhieu_bilateral
+from tien_xu_ly.tang_cuong import ap_dung_gabor_filter
+from phan_doan.nhi_phan_hoa import nhi_phan_hoa_otsu, nhi_phan_hoa_theo_dau, lam_sach_anh_nhi_phan
+from lam_manh.lam_manh_anh import lam_manh_scikit_image, loc_nhieu_sau_lam_manh
+from trich_dac_trung.trich_dac_trung_chi_tiet import (
+    trich_minutiae_chi_tiet, loc_nhieu_minutiae, GoiDacTrungAnh
+)
+from so_khop.so_khop_van_tay import MO_TA_THEO_PHUONG_PHAP
+
+
+# Cấu hình mặc định (giống các bước trên màn hình so sánh)
+DEFAULT_CONFIG = {
+    'denoise': True,                # Lọc nhiễu bilateral sau chuẩn hóa
+    'gabor_kernel_size': 21,
+    'gabor_orientations': 6,
+    'gabor_mode': 'toan_anh',       # ap_dung_gabor_filter(che_do=...): 'toan_anh' | 'theo_huong'
+    'clean_binary': True,           # lam_sach_anh_nhi_phan sau Otsu
+    'min_line_length': 3,           # Bỏ đường ngắn sau làm mảnh (0 = không lọc)
+    'minutiae_min_distance': 2,     # loc_nhieu_minutiae (0 = không lọc)
+}
+
+
+def _buoc_chuan_hoa(kq, cau_hinh):
+    return {'anh_chuan_hoa': chuan_hoa_anh(kq['anh_xam'])}
+
+
+def _buoc_loc_nhieu(kq, cau_hinh):
+    anh = kq['anh_chuan_hoa']
+    return {'anh_loc': loc_nhieu_bilateral(anh) if cau_hinh['denoise'] else anh}
+
+
+def _buoc_tang_cuong(kq, cau_hinh):
+    return {'anh_tang_cuong': ap_dung_gabor_filter(
+        kq['anh_loc'], kernel_size=cau_hinh['gabor_kernel_size'],
+        num_orientations=cau_hinh['gabor_orientations'], che_do=cau_hinh['gabor_mode']
+    )}
+
+
+def _buoc_nhi_phan_hoa(kq, cau_hinh):
+    # Chế độ theo_huong giữ dấu đáp ứng Gabor nên nhị phân hóa theo dấu thay cho Otsu
+    if cau_hinh['gabor_mode'] == 'theo_huong':
+        anh_nhi_phan, nguong = nhi_phan_hoa_theo_dau(kq['anh_tang_cuong'])
+    else:
+        anh_nhi_phan, nguong = nhi_phan_hoa_otsu(kq['anh_tang_cuong'])
+    if cau_hinh['clean_binary']:
+        anh_nhi_phan = lam_sach_anh_nhi_phan(anh_nhi_phan)
+    return {'anh_nhi_phan': anh_nhi_phan, 'nguong': nguong}
+
+
+def _buoc_lam_manh(kq, cau_hinh):
+    anh_manh = lam_manh_scikit_image(kq['anh_nhi_phan'])
+    if cau_hinh['min_line_length'] > 0:
+        anh_manh = loc_nhieu_sau_lam_manh(anh_manh, min_length=cau_hinh['min_line_length'])
+    return {'anh_manh': anh_manh}
+
+
+def _buoc_minutiae(kq, cau_hinh):
+    minutiae = trich_minutiae_chi_tiet(kq['anh_manh'])
+    khoang_cach = cau_hinh['minutiae_min_distance']
+    endings = [m['position'] for m in minutiae['endings']]
+    bifurcations = [m['position'] for m in minutiae['bifurcations']]
+    if khoang_cach > 0 and (endings or bifurcations):
+        endings, bifurcations = loc_nhieu_minutiae(endings, bifurcations, min_distance=khoang_cach)
+        endings, bifurcations = set(endings), set(bifurcations)
+        minutiae = dict(minutiae)
+        minutiae['endings'] = [m for m in minutiae['endings'] if m['position'] in endings]
+        minutiae['bifurcations'] = [m for m in minutiae['bifurcations']
+                                    if m['position'] in bifurcations]
+    return {'minutiae': minutiae}
+
+
+def _buoc_mo_ta(kq, cau_hinh):
+    # Các descriptor dùng chung ảnh xám/gradient/FFT của một gói
+    goi = GoiDacTrungAnh.tu(kq['anh_nhi_phan'])
+    return {'mo_ta': {pp: lop.extract(goi) for pp, lop in MO_TA_THEO_PHUONG_PHAP.items()}}
+
+
+# Các bước theo thứ tự: tên -> (bước đầu vào, hàm, khóa cấu hình dùng tới, tên đầu ra)
+STAGES = OrderedDict([
+    ('chuan_hoa', (None, _buoc_chuan_hoa, (), ('anh_chuan_hoa',))),
+    ('loc_nhieu', ('chuan_hoa', _buoc_loc_nhieu, ('denoise',), ('anh_loc',))),
+    ('tang_cuong', ('loc_nhieu', _buoc_tang_cuong,
+                    ('gabor_kernel_size', 'gabor_orientations', 'gabor_mode'), ('anh_tang_cuong',))),
+    ('nhi_phan_hoa', ('tang_cuong', _buoc_nhi_phan_hoa, ('gabor_mode', 'clean_binary'),
+                      ('anh_nhi_phan', 'nguong'))),
+    ('lam_manh', ('nhi_phan_hoa', _buoc_lam_manh, ('min_line_length',), ('anh_manh',))),
+    ('minutiae', ('lam_manh', _buoc_minutiae, ('minutiae_min_distance',), ('minutiae',))),
+    ('mo_ta', ('nhi_phan_hoa', _buoc_mo_ta, (), ('mo_ta',))),
+])
+
+# Các bước chạy khi không chỉ định
+DEFAULT_STAGES = ('minutiae',)
+
+
+def hash_image(anh):
+    """Mã băm nội dung ảnh (kèm kích thước, kiểu dữ liệu)"""
+    anh = np.ascontiguousarray(anh)
+    h = hashlib.sha1(f"{anh.shape}{anh.dtype}".encode())
+    h.update(anh.data)
+    return h.hexdigest()
+
+
+def _chi_doc(gia_tri):
+    """Đánh dấu mảng chỉ đọc để kết quả trong bộ nhớ đệm không bị sửa nhầm"""
+    if isinstance(gia_tri, np.ndarray):
+        gia_tri.flags.writeable = False
+    elif isinstance(gia_tri, dict):
+        for v in gia_tri.values():
+            _chi_doc(v)
+    return gia_tri
+
+
+class StageCache:
+    """
+    Bộ nhớ đệm LRU (trong RAM, an toàn đa luồng) cho đầu ra từng bước
+
+    Nếu có bộ nhớ đệm đĩa (disk), mục không có trong RAM được tìm tiếp trên
+    đĩa và mọi mục mới được ghi xuống đĩa.
+    """
+
+    def __init__(self, max_entries=64, disk=None):
+        """
+        Args:
+            max_entries (int): Số đầu ra tối đa được giữ trong RAM
+            disk (DiskStageCache): Bộ nhớ đệm trên đĩa (tuỳ chọn)
+        """
+        self.max_entries = max_entries
+        self.disk = disk
+        self._du_lieu = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _luu_ram(self, khoa, gia_tri):
+        with self._lock:
+            self._du_lieu[khoa] = gia_tri
+            self._du_lieu.move_to_end(khoa)
+            while len(self._du_lieu) > self.max_entries:
+                self._du_lieu.popitem(last=False)
+
+    def get(self, khoa):
+        """Lấy đầu ra đã lưu (None nếu chưa có)"""
+        with self._lock:
+            gia_tri = self._du_lieu.get(khoa)
+            if gia_tri is not None:
+                self._du_lieu.move_to_end(khoa)
+                return gia_tri
+        if self.disk is not None:
+            gia_tri = self.disk.get(khoa)
+            if gia_tri is not None:
+                self._luu_ram(khoa, _chi_doc(gia_tri))
+        return gia_tri
+
+    def put(self, khoa, gia_tri):
+        """Lưu đầu ra một bước, bỏ các mục dùng lâu nhất khi đầy"""
+        self._luu_ram(khoa, gia_tri)
+        if self.disk is not None:
+            self.disk.put(khoa, gia_tri)
+
+    def clear(self):
+        """Xóa các mục trong RAM (bộ nhớ đệm đĩa giữ nguyên)"""
+        with self._lock:
+            self._du_lieu.clear()
+
+    def __len__(self):
+        return len(self._du_lieu)
+
+
+class DiskStageCache:
+    """
+    Bộ nhớ đệm đầu ra từng bước trên đĩa, lưu không mất mát, giới hạn dung lượng theo LRU
+
+    Mỗi mục là thư mục <thu_muc>/<2 ký tự đầu khóa>/<khóa>/ gồm các mảng
+    dạng .npy (đọc lại bằng memory map), descriptor dạng .bin và các giá trị
+    còn lại trong meta.json. Khóa đã gồm mã băm ảnh nguồn và cấu hình các
+    bước nên một mục không bao giờ cũ, chỉ bị xóa khi vượt dung lượng. Mục
+    được ghi vào thư mục tạm rồi đổi tên, nên nhiều tiến trình dùng chung
+    một thư mục được.
+    """
+
+    def __init__(self, thu_muc, max_bytes=512 * 1024 * 1024, mmap=True):
+        """
+        Args:
+            thu_muc (str): Thư mục chứa bộ nhớ đệm
+            max_bytes (int): Dung lượng tối đa (None = không giới hạn, không xóa mục nào)
+            mmap (bool): Đọc mảng bằng memory map thay vì nạp hết vào RAM
+        """
+        self.thu_muc = thu_muc
+        self.max_bytes = max_bytes
+        self.mmap = mmap
+        # khóa -> [dung lượng, lần dùng cuối], quét thư mục ở lần ghi đầu tiên
+        self._muc = None
+        self._tong = 0
+        self._lock = threading.Lock()
+
+    def _duong_dan(self, khoa):
+        return os.path.join(self.thu_muc, khoa[:2], khoa)
+
+    @staticmethod
+    def _dung_luong(duong_dan):
+        return sum(f.stat().st_size for f in os.scandir(duong_dan) if f.is_file())
+
+    def _nap_chi_muc(self):
+        """Quét thư mục lấy dung lượng và lần dùng cuối (mtime) của các mục (gọi khi giữ lock)"""
+        if self._muc is not None:
+            return
+        self._muc = {}
+        if os.path.isdir(self.thu_muc):
+            for nhom in os.scandir(self.thu_muc):
+                if not nhom.is_dir():
+                    continue
+                for muc in os.scandir(nhom.path):
+                    if muc.is_dir() and '.tmp' not in muc.name:
+                        self._muc[muc.name] = [self._dung_luong(muc.path), muc.stat().st_mtime]
+        self._tong = sum(kich_thuoc for kich_thuoc, _ in self._muc.values())
+
+    def _doc(self, duong_dan):
+        """Đọc một mục"""
+        with open(os.path.join(duong_dan, 'meta.json'), encoding='utf-8') as f:
+            meta = json.load(f)
+        dau_ra = dict(meta['gia_tri'])
+        if 'minutiae' in dau_ra:
+            # JSON không có tuple: trả lại tọa độ dạng (i, j) như khi vừa trích
+            for loai in ('endings', 'bifurcations'):
+                for m in dau_ra['minutiae'].get(loai, []):
+                    m['position'] = tuple(m['position'])
+        for ten in meta['mang']:
+            dau_ra[ten] = np.load(os.path.join(duong_dan, ten + '.npy'),
+                                  mmap_mode='r' if self.mmap else None)
+        if meta['mo_ta'] is not None:
+            dau_ra['mo_ta'] = {}
+            for pp in meta['mo_ta']:
+                with open(os.path.join(duong_dan, f"mo_ta.{pp}.bin"), 'rb') as f:
+                    dau_ra['mo_ta'][pp] = MO_TA_THEO_PHUONG_PHAP[pp].from_bytes(f.read())
+        return dau_ra
+
+    def _ghi(self, duong_dan, dau_ra):
+        """Ghi một mục vào thư mục duong_dan (chưa tồn tại)"""
+        meta = {'gia_tri': {}, 'mang': [], 'mo_ta': None}
+        os.makedirs(duong_dan)
+        for ten, gia_tri in dau_ra.items():
+            if isinstance(gia_tri, np.ndarray):
+                np.save(os.path.join(duong_dan, ten + '.npy'), gia_tri)
+                meta['mang'].append(ten)
+            elif ten == 'mo_ta':
+                meta['mo_ta'] = []
+                for pp, mo_ta in gia_tri.items():
+                    if mo_ta is None:
+                        continue
+                    with open(os.path.join(duong_dan, f"mo_ta.{pp}.bin"), 'wb') as f:
+                        f.write(mo_ta.to_bytes())
+                    meta['mo_ta'].append(pp)
+            else:
+                meta['gia_tri'][ten] = gia_tri
+        with open(os.path.join(duong_dan, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+
+    def get(self, khoa):
+        """Lấy đầu ra đã lưu (None nếu chưa có)"""
+        duong_dan = self._duong_dan(khoa)
+        if not os.path.isdir(duong_dan):
+            return None
+        try:
+            dau_ra = self._doc(duong_dan)
+        except Exception as e:
+            print(f"Lỗi đọc bộ nhớ đệm {khoa}: {e}")
+            self._xoa(khoa)
+            return None
+
+        # Cập nhật lần dùng cuối (mtime giữ thứ tự LRU giữa các lần chạy)
+        bay_gio = time.time()
+        try:
+            os.utime(duong_dan, (bay_gio, bay_gio))
+        except OSError:
+            pass
+        with self._lock:
+            if self._muc is not None and khoa in self._muc:
+                self._muc[khoa][1] = bay_gio
+        return dau_ra
+
+    def put(self, khoa, dau_ra):
+        """Ghi đầu ra một bước (bỏ qua nếu đã có), xóa các mục dùng lâu nhất khi vượt dung lượng"""
+        duong_dan = self._duong_dan(khoa)
+        if not os.path.isdir(duong_dan):
+            tam = f"{duong_dan}.tmp-{os.getpid()}-{threading.get_ident()}"
+            try:
+                self._ghi(tam, dau_ra)
+                os.rename(tam, duong_dan)
+            except Exception as e:
+                shutil.rmtree(tam, ignore_errors=True)
+                # Tiến trình khác đã ghi cùng khóa thì không phải lỗi
+                if not os.path.isdir(duong_dan):
+                    print(f"Lỗi ghi bộ nhớ đệm {khoa}: {e}")
+                    return
+
+        with self._lock:
+            self._nap_chi_muc()
+            if khoa in self._muc:
+                self._muc[khoa][1] = time.time()
+            else:
+                kich_thuoc = self._dung_luong(duong_dan)
+                self._muc[khoa] = [kich_thuoc, time.time()]
+                self._tong += kich_thuoc
+            self._don_dep()
+
+    def _don_dep(self):
+        """Xóa các mục dùng lâu nhất tới khi còn 90% dung lượng tối đa (gọi khi giữ lock)"""
+        if self.max_bytes is None or self._tong <= self.max_bytes:
+            return
+        muc_tieu = self.max_bytes * 0.9
+        for khoa, (kich_thuoc, _) in sorted(self._muc.items(), key=lambda muc: muc[1][1]):
+            if self._tong <= muc_tieu:
+                break
+            shutil.rmtree(self._duong_dan(khoa), ignore_errors=True)
+            del self._muc[khoa]
+            self._tong -= kich_thuoc
+
+    def _xoa(self, khoa):
+        """Xóa một mục (hỏng)"""
+        shutil.rmtree(self._duong_dan(khoa), ignore_errors=True)
+        with self._lock:
+            if self._muc is not None and khoa in self._muc:
+                self._tong -= self._muc.pop(khoa)[0]
+
+    def size(self):
+        """Tổng dung lượng (byte) các mục"""
+        with self._lock:
+            self._nap_chi_muc()
+            return self._tong
+
+    def clear(self):
+        """Xóa toàn bộ bộ nhớ đệm trên đĩa"""
+        with self._lock:
+            shutil.rmtree(self.thu_muc, ignore_errors=True)
+            self._muc = {}
+            self._tong = 0
+
+    def __len__(self):
+        with self._lock:
+            self._nap_chi_muc()
+            return len(self._muc)
+
+
+# Pipeline trong tiến trình con của process_many (theo cấu hình)
+_PIPELINE_WORKER = {}
+
+
+def _chay_trong_tien_trinh(cau_hinh, thu_muc_dem, anh, cac_buoc, quiet):
+    """
+    Hàm chạy trong tiến trình con: tạo (một lần) pipeline rồi chạy
+
+    Tiến trình con chỉ dùng chung bộ nhớ đệm đĩa (nếu có) với tiến trình
+    chính và không xóa mục nào; tiến trình chính giữ giới hạn dung lượng.
+    """
+    khoa = (tuple(sorted(cau_hinh.items())), thu_muc_dem)
+    if khoa not in _PIPELINE_WORKER:
+        cache = False
+        if thu_muc_dem is not None:
+            cache = StageCache(max_entries=8, disk=DiskStageCache(thu_muc_dem, max_bytes=None))
+        _PIPELINE_WORKER[khoa] = FingerprintPipeline(cau_hinh, cache=cache)
+    return _PIPELINE_WORKER[khoa]._chay_an_toan(anh, cac_buoc, quiet)
+
+
+class FingerprintPipeline:
+    """
+    Chuỗi xử lý ảnh vân tay có tên từng bước
+
+    run() trả về dict gồm đầu ra của các bước đã chạy ('anh_chuan_hoa',
+    'anh_loc', 'anh_tang_cuong', 'anh_nhi_phan', 'nguong', 'anh_manh',
+    'minutiae', 'mo_ta'), 'thoi_gian' (bước -> giây, chỉ các bước thực sự
+    tính) và 'tu_bo_nho' (các bước lấy từ bộ nhớ đệm). Đầu ra mỗi bước được
+    nhớ theo mã băm ảnh xám + cấu hình của bước đó và các bước trước, nên
+    chạy tiếp một bước sau (ví dụ 'lam_manh' sau 'tang_cuong') không tính lại
+    các bước đầu; bước được yêu cầu đã có trong bộ nhớ đệm thì không cần đọc
+    đầu ra các bước trước nó. Mảng trả về là chỉ đọc, cần .copy() trước khi sửa.
+    """
+
+    def __init__(self, config=None, cache=None, cache_dir=None, cache_max_bytes=512 * 1024 * 1024):
+        """
+        Khởi tạo pipeline
+
+        Args:
+            config (dict): Ghi đè DEFAULT_CONFIG
+            cache: Bộ nhớ đệm có get/put (mặc định StageCache()), False = không nhớ
+            cache_dir (str): Thư mục bộ nhớ đệm đĩa (khi không truyền cache)
+            cache_max_bytes (int): Dung lượng tối đa của bộ nhớ đệm đĩa
+        """
+        unknown = set(config or {}) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError(f"Cấu hình không hợp lệ: {', '.join(sorted(unknown))}")
+        self.config = dict(DEFAULT_CONFIG, **(config or {}))
+        if cache is None:
+            disk = DiskStageCache(cache_dir, cache_max_bytes) if cache_dir else None
+            cache = StageCache(disk=disk)
+        self.cache = None if cache is False else cache
+
+        # Thống kê: bước -> [số lần tính, tổng giây, số lần lấy từ bộ nhớ đệm]
+        self._thong_ke = {ten: [0, 0.0, 0] for ten in STAGES}
+        self._lock = threading.Lock()
+
+    def _cac_buoc_yeu_cau(self, stages):
+        """Chuẩn hóa danh sách bước được yêu cầu (theo thứ tự STAGES)"""
+        if stages is None:
+            stages = DEFAULT_STAGES
+        elif isinstance(stages, str):
+            stages = (stages,)
+        for ten in stages:
+            if ten not in STAGES:
+                raise ValueError(f"Bước không hợp lệ: {ten}")
+        return [ten for ten in STAGES if ten in stages]
+
+    def _khoa_buoc(self, khoa_vao, ten):
+        """Khóa bộ nhớ đệm của một bước: khóa bước đầu vào + tên + cấu hình của bước"""
+        tham_so = tuple((k, self.config[k]) for k in STAGES[ten][2])
+        return hashlib.sha1(f"{khoa_vao}|{ten}|{tham_so}".encode()).hexdigest()
+
+    def _tinh_khoa(self, anh_xam, yeu_cau):
+        """Khóa của các bước được yêu cầu và mọi bước trước chúng"""
+        khoa = {None: hash_image(anh_xam)}
+
+        def tinh(ten):
+            if ten not in khoa:
+                buoc_vao = STAGES[ten][0]
+                tinh(buoc_vao)
+                khoa[ten] = self._khoa_buoc(khoa[buoc_vao], ten)
+
+        for ten in yeu_cau:
+            tinh(ten)
+        return khoa
+
+    def _da_nho(self, anh_xam, stages):
+        """Mọi bước được yêu cầu cho ảnh này đã có trong bộ nhớ đệm chưa"""
+        if self.cache is None:
+            return False
+        yeu_cau = self._cac_buoc_yeu_cau(stages)
+        khoa = self._tinh_khoa(anh_xam, yeu_cau)
+        return all(self.cache.get(khoa[ten]) is not None for ten in yeu_cau)
+
+    def run(self, anh_xam, stages=None, check=None):
+        """
+        Chạy các bước cần thiết cho một ảnh xám
+
+        Args:
+            anh_xam (np.ndarray): Ảnh xám
+            stages (str | iterable): Bước cần kết quả (mặc định ('minutiae',));
+                chắc chắn có đầu ra của các bước này, bước trước chỉ có khi
+                phải tính lại
+            check: Hàm không tham số gọi trước mỗi bước phải tính (ví dụ
+                TacVu.kiem_tra_huy để hủy giữa chừng)
+
+        Returns:
+            dict: Đầu ra các bước, 'thoi_gian', 'tu_bo_nho'
+        """
+        kq = {'anh_xam': anh_xam, 'thoi_gian': {}, 'tu_bo_nho': []}
+        yeu_cau = self._cac_buoc_yeu_cau(stages)
+        khoa = self._tinh_khoa(anh_xam, yeu_cau)
+        da_co = set()
+
+        def lay(ten):
+            if ten is None or ten in da_co:
+                return
+            buoc_vao, ham, _, _ = STAGES[ten]
+            dau_ra = self.cache.get(khoa[ten]) if self.cache is not None else None
+            if dau_ra is not None:
+                kq['tu_bo_nho'].append(ten)
+                with self._lock:
+                    self._thong_ke[ten][2] += 1
+            else:
+                lay(buoc_vao)
+                if check is not None:
+                    check()
+                bat_dau = time.perf_counter()
+                dau_ra = _chi_doc(ham(kq, self.config))
+                giay = time.perf_counter() - bat_dau
+                kq['thoi_gian'][ten] = giay
+                with self._lock:
+                    self._thong_ke[ten][0] += 1
+                    self._thong_ke[ten][1] += giay
+                if self.cache is not None:
+                    self.cache.put(khoa[ten], dau_ra)
+            kq.update(dau_ra)
+            da_co.add(ten)
+
+        for ten in yeu_cau:
+            lay(ten)
+        kq['khoa'] = khoa
+        return kq
+
+    def _chay_an_toan(self, anh, stages, quiet=False):
+        """Đọc ảnh (nếu là đường dẫn) rồi chạy; lỗi được trả về trong 'loi' thay vì ném ra"""
+        if quiet:
+            with contextlib.redirect_stdout(io.StringIO()):
+                return self._chay_an_toan(anh, stages)
+        bat_dau = time.perf_counter()
+        try:
+            if isinstance(anh, str):
+                anh_xam = cv2.imread(anh, cv2.IMREAD_GRAYSCALE)
+                if anh_xam is None:
+                    raise ValueError("Không thể đọc ảnh")
+                thoi_gian_doc = time.perf_counter() - bat_dau
+                kq = self.run(anh_xam, stages)
+                kq['thoi_gian']['doc_anh'] = thoi_gian_doc
+                kq['duong_dan'] = anh
+            else:
+                kq = self.run(anh, stages)
+            kq['loi'] = None
+        except Exception as e:
+            kq = {'loi': str(e), 'thoi_gian': {}, 'tu_bo_nho': []}
+            if isinstance(anh, str):
+                kq['duong_dan'] = anh
+        return kq
+
+    def _nhan_ket_qua_tien_trinh(self, kq):
+        """Ghi thời gian và lưu đầu ra từ tiến trình con vào bộ nhớ đệm của pipeline này"""
+        with self._lock:
+            for ten, giay in kq['thoi_gian'].items():
+                if ten in self._thong_ke:
+                    self._thong_ke[ten][0] += 1
+                    self._thong_ke[ten][1] += giay
+        if self.cache is None or kq['loi']:
+            return
+        # Chỉ các bước tiến trình con đã tính (bước lấy từ đĩa đã có sẵn)
+        for ten, (_, _, _, ten_dau_ra) in STAGES.items():
+            if ten in kq['thoi_gian']:
+                dau_ra = {k: kq[k] for k in ten_dau_ra}
+                self.cache.put(kq['khoa'][ten], _chi_doc(dau_ra))
+
+    def process_many(self, images, stages=None, workers=1, ordered=True, max_pending=None, quiet=False):
+        """
+        Chạy pipeline cho nhiều ảnh (mảng ảnh xám hoặc đường dẫn)
+
+        Chỉ giữ tối đa max_pending ảnh đang chờ/đang chạy nên dùng được với
+        danh sách rất dài (generator).
+
+        Args:
+            images (iterable): Ảnh xám hoặc đường dẫn ảnh
+            stages: Như run()
+            workers (int): Số tiến trình, 0 = theo số CPU, 1 = chạy trong tiến trình này
+            ordered (bool): Trả kết quả theo thứ tự vào (False = theo thứ tự xong)
+            max_pending (int): Số ảnh tối đa đang chờ (mặc định 4 lần số tiến trình)
+            quiet (bool): Ẩn log (print) của các hàm xử lý
+
+        Yields:
+            tuple: (chỉ số ảnh, kết quả như run() kèm 'loi' - None nếu thành công)
+        """
+        workers = workers if workers > 0 else (os.cpu_count() or 1)
+        if workers == 1:
+            for i, anh in enumerate(images):
+                yield i, self._chay_an_toan(anh, stages, quiet)
+            return
+
+        max_pending = max_pending or 4 * workers
+        disk = getattr(self.cache, 'disk', None)
+        thu_muc_dem = disk.thu_muc if disk is not None else None
+        images = enumerate(images)
+        cho_tra = {}
+        tiep_theo = 0
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            dang_chay = {}
+            het_anh = False
+            while dang_chay or not het_anh:
+                while not het_anh and len(dang_chay) + len(cho_tra) < max_pending:
+                    muc = next(images, None)
+                    if muc is None:
+                        het_anh = True
+                    elif isinstance(muc[1], np.ndarray) and self._da_nho(muc[1], stages):
+                        # Đã có sẵn kết quả, không cần gửi sang tiến trình con
+                        cho_tra[muc[0]] = self._chay_an_toan(muc[1], stages, quiet)
+                    else:
+                        future = executor.submit(_chay_trong_tien_trinh, self.config, thu_muc_dem,
+                                                 muc[1], stages, quiet)
+                        dang_chay[future] = muc[0]
+                xong = wait(dang_chay, return_when=FIRST_COMPLETED)[0] if dang_chay else ()
+                for future in xong:
+                    i = dang_chay.pop(future)
+                    kq = future.result()
+                    self._nhan_ket_qua_tien_trinh(kq)
+                    cho_tra[i] = kq
+                if not ordered:
+                    for i in list(cho_tra):
+                        yield i, cho_tra.pop(i)
+                while tiep_theo in cho_tra:
+                    yield tiep_theo, cho_tra.pop(tiep_theo)
+                    tiep_theo += 1
+
+    def stats(self):
+        """
+        Thống kê thời gian các bước
+
+        Returns:
+            dict: Bước -> {'so_lan', 'tong_giay', 'trung_binh_ms', 'tu_bo_nho'}
+        """
+        with self._lock:
+            return {
+                ten: {'so_lan': n, 'tong_giay': tong,
+                      'trung_binh_ms': tong * 1000 / n if n else 0.0, 'tu_bo_nho': hit}
+                for ten, (n, tong, hit) in self._thong_ke.items()
+            }
+
+    def clear_cache(self):
+        """Xóa bộ nhớ đệm kết quả"""
+        if self.cache is not None:
+            self.cache.clear()
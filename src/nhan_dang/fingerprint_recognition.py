@@ -2,19 +2,31 @@
 Module nhận dạng người dùng từ vân tay
 """
 
-import numpy as np
+import heapq
+import threading
 import os
 from database.database_manager import DatabaseManager
-from so_khop.so_khop_van_tay import (
-    so_khop_minutiae, so_khop_feature_matching,
-    so_khop_lbp_texture, so_khop_ridge_orientation,
-    so_khop_frequency_domain
-)
+from database.matching_history_writer import MatchingHistoryWriter
+from database.ma_hoa_anh import MA_DINH_DANG, giai_ma_anh_nhi_phan, ma_hoa_anh_nhi_phan
+from nhan_dang.parallel_matcher import ParallelMatcher
+from nhan_dang.template_gallery import TemplateGallery
+from so_khop.chi_muc_flann import ChiMucFlann
+from so_khop.so_khop_van_tay import MoTaSiftOrb, MoTaLBP, MoTaRidge, MoTaTanSo
 
 
 class FingerprintRecognition:
     """Nhận dạng người dùng từ vân tay"""
     
+    # Các phương pháp so khớp dựa trên ảnh nhị phân (còn lại dùng minutiae):
+    # phương pháp -> (cột descriptor, lớp descriptor có extract/compare)
+    DESCRIPTORS = {
+        'feature': ('feature_data', MoTaSiftOrb),
+        'lbp': ('lbp_data', MoTaLBP),
+        'ridge': ('ridge_data', MoTaRidge),
+        'frequency': ('frequency_data', MoTaTanSo)
+    }
+    IMAGE_METHODS = tuple(DESCRIPTORS)
+    
     def __init__(self, db_manager):
         """
         Khởi tạo hệ thống nhận dạng
@@ -24,11 +36,82 @@ class FingerprintRecognition:
         """
         self.db = db_manager
         self.threshold = 70.0  # Ngưỡng mặc định
+        self.minutiae_assignment = 'tham_lam'  # Ghép cặp minutiae: 'tham_lam' hoặc 'toi_uu'
+        
+        # Minutiae của mọi vân tay giữ sẵn trong bộ nhớ (tải ở lần tìm đầu tiên)
+        self.gallery = TemplateGallery(db_manager)
+        
+        # So khớp minutiae 1:N trên nhiều tiến trình (1 = chạy tuần tự)
+        self.matcher = ParallelMatcher(so_tien_trinh=1)
+        
+        # Chỉ mục FLANN trên descriptor SIFT/ORB của mọi vân tay (phương pháp
+        # 'feature'), tạo ở lần tìm đầu tiên và bỏ đi khi database thay đổi
+        self.feature_search = 'flann'  # 'flann' hoặc 'exhaustive' (so khớp từng vân tay)
+        self._feature_index = None
+        self._feature_index_version = 0
+        self._feature_index_lock = threading.Lock()
+        self.db.add_fingerprint_listener(self._on_db_change)
+        
+        # Ghi lịch sử so khớp ở luồng nền (None = ghi ngay khi gọi save_match_record)
+        self.history_writer = None
     
     def set_threshold(self, threshold):
         """Thiết lập ngưỡng so khớp"""
         self.threshold = threshold
     
+    def set_minutiae_assignment(self, phuong_phap):
+        """Thiết lập cách ghép cặp minutiae ('tham_lam' hoặc 'toi_uu')"""
+        if phuong_phap not in ('tham_lam', 'toi_uu'):
+            raise ValueError(f"Phương pháp ghép cặp không hợp lệ: {phuong_phap}")
+        self.minutiae_assignment = phuong_phap
+    
+    def set_worker_count(self, so_tien_trinh):
+        """
+        Thiết lập số tiến trình so khớp minutiae song song
+        
+        Args:
+            so_tien_trinh (int): Số tiến trình, 0 = theo số CPU, 1 = tuần tự
+        """
+        so_tien_trinh = so_tien_trinh if so_tien_trinh > 0 else (os.cpu_count() or 1)
+        if so_tien_trinh != self.matcher.so_tien_trinh:
+            self.matcher.close()
+            self.matcher = ParallelMatcher(so_tien_trinh)
+    
+    def set_feature_search(self, che_do):
+        """Thiết lập cách tìm cho phương pháp 'feature' ('flann' hoặc 'exhaustive')"""
+        if che_do not in ('flann', 'exhaustive'):
+            raise ValueError(f"Cách tìm không hợp lệ: {che_do}")
+        self.feature_search = che_do
+    
+    def enable_async_history(self, **kwargs):
+        """
+        Ghi lịch sử so khớp ở luồng nền theo lô (kwargs truyền cho MatchingHistoryWriter)
+        
+        Sau khi bật, save_match_record chỉ đưa bản ghi vào hàng đợi và trả về
+        True/False thay vì ID bản ghi.
+        """
+        if self.history_writer is None:
+            self.history_writer = MatchingHistoryWriter(self.db, **kwargs)
+        return self.history_writer
+    
+    def flush_history(self, timeout=None):
+        """Đợi các bản ghi lịch sử so khớp đang chờ được ghi xong"""
+        if self.history_writer is not None:
+            return self.history_writer.flush(timeout)
+        return True
+    
+    def close(self):
+        """Dừng các tiến trình so khớp song song và ghi hết lịch sử so khớp đang chờ"""
+        self.matcher.close()
+        if self.history_writer is not None:
+            self.history_writer.close()
+            self.history_writer = None
+    
+    def _on_db_change(self, event, key):
+        """Vân tay/người dùng thay đổi: chỉ mục FLANN sẽ được tạo lại ở lần tìm sau"""
+        self._feature_index_version += 1
+        self._feature_index = None
+    
     def _get_threshold_for_method(self, method):
         """
         Lấy ngưỡng phù hợp cho từng phương pháp so khớp
@@ -51,66 +134,57 @@ class FingerprintRecognition:
         
         return method_thresholds.get(method, self.threshold)
     
-    def identify_user_from_minutiae(self, minutiae, max_results=5):
+    def identify_user_from_minutiae(self, minutiae, max_results=5, stop_score=None):
         """
         Nhận dạng người dùng từ minutiae
         
         Args:
             minutiae: Dữ liệu minutiae từ ảnh vân tay
             max_results: Số lượng kết quả tối đa
+            stop_score: Dừng tìm khi gặp vân tay có điểm >= stop_score (tuỳ chọn)
             
         Returns:
             Danh sách những người dùng khớp nhất
         """
         results = []
         
-        # Lấy tất cả vân tay từ database
-        db_fingerprints = self.db.get_fingerprints_for_matching()
+        # So khớp với toàn bộ thư viện mẫu trong bộ nhớ, chỉ giữ top max_results
+        for result in self._identify_from_gallery(minutiae, 'minutiae_matching', max_results,
+                                                  stop_score):
+            if result['similarity_score'] > self.threshold:
+                results.append(result)
         
-        if not db_fingerprints:
-            return results
+        return results
+    
+    def _identify_from_gallery(self, minutiae, method, max_results, stop_score=None):
+        """
+        Lấy max_results mẫu có điểm minutiae cao nhất trong thư viện
         
-        # So khớp với từng vân tay trong database
-        for db_fp in db_fingerprints:
-            fingerprint_id = db_fp['fingerprint_id']
-            user_id = db_fp['user_id']
-            username = db_fp['username']
-            full_name = db_fp['full_name']
-            finger_name = db_fp['finger_name']
-            
-            # Lấy dữ liệu minutiae từ database
-            try:
-                import json
-                db_minutiae = json.loads(db_fp['minutiae_data']) if db_fp['minutiae_data'] else None
-                
-                if not db_minutiae:
-                    continue
-                
-                # So khớp minutiae
-                match_result = so_khop_minutiae(minutiae, db_minutiae)
-                similarity_score = match_result.get('similarity_score', 0)
-                
-                if similarity_score > self.threshold:
-                    results.append({
-                        'user_id': user_id,
-                        'username': username,
-                        'full_name': full_name,
-                        'fingerprint_id': fingerprint_id,
-                        'finger_name': finger_name,
-                        'similarity_score': similarity_score,
-                        'method': 'minutiae_matching'
-                    })
+        Args:
+            minutiae: Dữ liệu minutiae truy vấn
+            method: Tên phương pháp ghi vào kết quả
+            max_results: Số lượng kết quả tối đa
+            stop_score: Dừng tìm khi gặp mẫu có điểm >= stop_score (tuỳ chọn)
             
-            except Exception as e:
-                print(f"Lỗi so khớp minutiae với fingerprint {fingerprint_id}: {e}")
-                continue
-        
-        # Sắp xếp theo điểm tương đồng giảm dần
-        results.sort(key=lambda x: x['similarity_score'], reverse=True)
+        Returns:
+            Danh sách kết quả theo điểm giảm dần
+        """
+        if not minutiae:
+            return []
         
-        return results[:max_results]
+        templates = self.gallery.snapshot()
+        results = []
+        for similarity_score, k in self.matcher.top_k(templates, minutiae, max_results,
+                                                     diem_dung=stop_score,
+                                                     phuong_phap=self.minutiae_assignment):
+            result = templates.lay_thong_tin(k)
+            result['similarity_score'] = similarity_score
+            result['method'] = method
+            results.append(result)
+        return results
     
-    def identify_user_from_image(self, image, minutiae, matching_method='minutiae', max_results=5, anh_xu_ly=None):
+    def identify_user_from_image(self, image, minutiae, matching_method='minutiae', max_results=5, anh_xu_ly=None,
+                                 stop_score=None):
         """
         Nhận dạng người dùng từ ảnh vân tay
         So sánh các features đã trích và lưu trong database
@@ -121,24 +195,44 @@ class FingerprintRecognition:
             matching_method: Phương pháp so khớp ('minutiae', 'feature', 'lbp', 'ridge', 'frequency')
             max_results: Số lượng kết quả tối đa
             anh_xu_ly: Ảnh nhị phân (cho trích features từ query)
+            stop_score: Dừng tìm khi gặp vân tay có điểm >= stop_score, dùng cho
+                tra cứu kiểu xác thực (tuỳ chọn)
             
         Returns:
             Danh sách những người dùng khớp nhất
         """
         results = []
+        
+        # Chỉ giữ max_results kết quả tốt nhất: min-heap (điểm, -thứ tự, kết quả)
         best_matches = []
         
         # Lấy ngưỡng phù hợp cho phương pháp
         method_threshold = self._get_threshold_for_method(matching_method)
         
-        # Lấy tất cả vân tay từ database
-        db_fingerprints = self.db.get_fingerprints_for_matching()
+        if matching_method not in self.IMAGE_METHODS:
+            # Minutiae so khớp với thư viện trong bộ nhớ, không truy vấn database.
+            # Có kết quả vượt ngưỡng thì chỉ trả về chúng, nếu không trả về
+            # các kết quả tốt nhất
+            best_matches = self._identify_from_gallery(minutiae, matching_method, max_results,
+                                                       stop_score)
+            results = [m for m in best_matches if m['similarity_score'] > method_threshold]
+            return results or best_matches
+        
+        if matching_method == 'feature' and self.feature_search == 'flann':
+            best_matches = self._identify_feature_flann(anh_xu_ly, max_results)
+            results = [m for m in best_matches if m['similarity_score'] > method_threshold]
+            return results or best_matches
+        
+        # Phương pháp dựa trên ảnh: đọc dần từ database, chỉ lấy descriptor của
+        # phương pháp (ảnh nhị phân chỉ khi vân tay cũ chưa có descriptor)
+        db_fingerprints = self.db.iter_fingerprints_for_matching(matching_method)
         
-        if not db_fingerprints:
-            return results
+        # Trích descriptor của ảnh truy vấn một lần cho mọi vân tay
+        column, lop_mo_ta = self.DESCRIPTORS[matching_method]
+        query_descriptor = lop_mo_ta.extract(anh_xu_ly) if anh_xu_ly is not None else None
         
         # So khớp với từng vân tay trong database
-        for db_fp in db_fingerprints:
+        for thu_tu, db_fp in enumerate(db_fingerprints):
             fingerprint_id = db_fp['fingerprint_id']
             user_id = db_fp['user_id']
             username = db_fp['username']
@@ -146,56 +240,15 @@ class FingerprintRecognition:
             finger_name = db_fp['finger_name']
             
             try:
-                import json
-                import cv2
-                
                 similarity_score = 0
                 
-                # Decode ảnh nhị phân từ database
-                binary_image_data = db_fp.get('binary_image_data')
-                db_binary_image = None
-                
-                if isinstance(binary_image_data, bytes):
-                    nparr = np.frombuffer(binary_image_data, np.uint8)
-                    db_binary_image = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+                # Dùng descriptor đã lưu, vân tay cũ chưa có thì trích từ ảnh nhị phân
+                db_descriptor = self._load_descriptor(db_fp, column, lop_mo_ta)
                 
                 # Áp dụng phương pháp so khớp
-                if matching_method == 'minutiae':
-                    db_minutiae = json.loads(db_fp['minutiae_data']) if db_fp['minutiae_data'] else None
-                    if db_minutiae and minutiae:
-                        match_result = so_khop_minutiae(minutiae, db_minutiae)
-                        similarity_score = match_result.get('similarity_score', 0)
-                
-                elif matching_method == 'feature':
-                    # Dùng hàm so khớp có sẵn
-                    if anh_xu_ly is not None and db_binary_image is not None:
-                        match_result = so_khop_feature_matching(anh_xu_ly, db_binary_image)
-                        similarity_score = match_result.get('similarity_score', 0)
-                
-                elif matching_method == 'lbp':
-                    # Dùng hàm so khớp có sẵn
-                    if anh_xu_ly is not None and db_binary_image is not None:
-                        match_result = so_khop_lbp_texture(anh_xu_ly, db_binary_image)
-                        similarity_score = match_result.get('similarity_score', 0)
-                
-                elif matching_method == 'ridge':
-                    # Dùng hàm so khớp có sẵn
-                    if anh_xu_ly is not None and db_binary_image is not None:
-                        match_result = so_khop_ridge_orientation(anh_xu_ly, db_binary_image)
-                        similarity_score = match_result.get('similarity_score', 0)
-                
-                elif matching_method == 'frequency':
-                    # Dùng hàm so khớp có sẵn
-                    if anh_xu_ly is not None and db_binary_image is not None:
-                        match_result = so_khop_frequency_domain(anh_xu_ly, db_binary_image)
-                        similarity_score = match_result.get('similarity_score', 0)
-                
-                else:
-                    # Mặc định là minutiae
-                    db_minutiae = json.loads(db_fp['minutiae_data']) if db_fp['minutiae_data'] else None
-                    if db_minutiae and minutiae:
-                        match_result = so_khop_minutiae(minutiae, db_minutiae)
-                        similarity_score = match_result.get('similarity_score', 0)
+                if query_descriptor is not None and db_descriptor is not None:
+                    match_result = lop_mo_ta.compare(query_descriptor, db_descriptor)
+                    similarity_score = match_result.get('similarity_score', 0)
                 
                 match_result = {
                     'user_id': user_id,
@@ -207,29 +260,174 @@ class FingerprintRecognition:
                     'method': matching_method
                 }
                 
-                # Lưu vào danh sách kết quả tốt nhất
-                best_matches.append(match_result)
+                # Lưu vào danh sách kết quả tốt nhất (cùng điểm thì ưu tiên vân tay đứng trước)
+                phan_tu = (similarity_score, -thu_tu, match_result)
+                if len(best_matches) < max_results:
+                    heapq.heappush(best_matches, phan_tu)
+                elif best_matches and phan_tu[:2] > best_matches[0][:2]:
+                    heapq.heapreplace(best_matches, phan_tu)
                 
-                # Nếu vượt qua threshold, thêm vào kết quả chính thức
-                if similarity_score > method_threshold:
-                    results.append(match_result)
+                # Đủ tốt cho tra cứu kiểu xác thực thì dừng sớm
+                if stop_score is not None and similarity_score >= stop_score:
+                    break
             
             except Exception as e:
                 print(f"Lỗi so khớp với fingerprint {fingerprint_id}: {e}")
                 continue
+        # Dừng sớm thì bỏ phần còn lại để giải phóng kết nối
+        db_fingerprints.close()
         
         # Sắp xếp danh sách kết quả tốt nhất theo điểm giảm dần
-        best_matches.sort(key=lambda x: x['similarity_score'], reverse=True)
+        best_matches = [m for _, _, m in sorted(best_matches, key=lambda x: x[:2], reverse=True)]
         
-        # Nếu không tìm thấy kết quả vượt qua threshold, trả về kết quả tốt nhất
-        if not results and best_matches:
-            results = best_matches[:max_results]
-        elif results:
-            results.sort(key=lambda x: x['similarity_score'], reverse=True)
-            results = results[:max_results]
+        # Có kết quả vượt threshold thì chỉ trả về chúng, nếu không trả về kết quả tốt nhất
+        results = [m for m in best_matches if m['similarity_score'] > method_threshold]
+        return results or best_matches
+    
+    def _load_descriptor(self, db_fp, column, lop_mo_ta):
+        """Descriptor đã lưu của một vân tay, chưa có thì trích từ ảnh nhị phân"""
+        db_descriptor = lop_mo_ta.from_bytes(db_fp.get(column))
+        if db_descriptor is None:
+            db_binary_image = self._decode_binary_image(db_fp.get('binary_image_data'))
+            if db_binary_image is not None:
+                db_descriptor = lop_mo_ta.extract(db_binary_image)
+        return db_descriptor
+    
+    def _get_feature_index(self, use_sift):
+        """
+        Chỉ mục FLANN trên descriptor SIFT (use_sift=True) hoặc ORB của mọi vân tay
         
+        Returns:
+            tuple: (ChiMucFlann, danh sách thông tin vân tay theo thứ tự trong chỉ mục)
+        """
+        with self._feature_index_lock:
+            cached = self._feature_index
+            if cached is not None and cached[0].use_sift == use_sift:
+                return cached
+            
+            version = self._feature_index_version
+            column, lop_mo_ta = self.DESCRIPTORS['feature']
+            thong_tin, mo_ta = [], []
+            for db_fp in self.db.iter_fingerprints_for_matching('feature'):
+                try:
+                    mo_ta.append(self._load_descriptor(db_fp, column, lop_mo_ta))
+                except Exception as e:
+                    print(f"Lỗi đọc descriptor của fingerprint {db_fp['fingerprint_id']}: {e}")
+                    mo_ta.append(None)
+                thong_tin.append({key: db_fp[key] for key in
+                                  ('user_id', 'username', 'full_name', 'fingerprint_id', 'finger_name')})
+            
+            index = (ChiMucFlann(use_sift).xay_dung(mo_ta), thong_tin)
+            # Database thay đổi trong lúc tạo thì chỉ dùng cho lần tìm này
+            if version == self._feature_index_version:
+                self._feature_index = index
+            return index
+    
+    def _identify_feature_flann(self, anh_xu_ly, max_results):
+        """
+        Nhận dạng bằng SIFT/ORB qua chỉ mục FLANN: một lần knnSearch cho mọi vân tay
+        
+        Args:
+            anh_xu_ly: Ảnh nhị phân truy vấn
+            max_results: Số lượng kết quả tối đa
+            
+        Returns:
+            Danh sách kết quả theo điểm giảm dần
+        """
+        if anh_xu_ly is None:
+            return []
+        
+        query_descriptor = MoTaSiftOrb.extract(anh_xu_ly)
+        chi_muc, thong_tin = self._get_feature_index(query_descriptor['use_sift'])
+        if not thong_tin:
+            return []
+        
+        diem = chi_muc.so_khop(query_descriptor)['similarity_score']
+        results = []
+        # Cùng điểm thì ưu tiên vân tay đứng trước, như khi so khớp từng vân tay
+        for similarity_score, am_thu_tu in heapq.nlargest(
+                max_results, zip(diem.tolist(), range(0, -len(thong_tin), -1))):
+            result = dict(thong_tin[-am_thu_tu])
+            result['similarity_score'] = similarity_score
+            result['method'] = 'feature'
+            results.append(result)
         return results
     
+    @staticmethod
+    def _decode_binary_image(binary_image_data):
+        """Giải mã ảnh nhị phân lưu trong database (packbits hoặc PNG cũ, None nếu không có)"""
+        return giai_ma_anh_nhi_phan(binary_image_data)
+    
+    def extract_descriptors(self, anh_xu_ly, mo_ta=None):
+        """
+        Trích và mã hóa descriptor của mọi phương pháp dựa trên ảnh để lưu database
+        
+        Args:
+            anh_xu_ly: Ảnh nhị phân
+            mo_ta (dict): Descriptor đã trích sẵn theo phương pháp (ví dụ đầu ra
+                bước 'mo_ta' của FingerprintPipeline), chỉ cần mã hóa
+            
+        Returns:
+            dict: Tên cột -> bytes (truyền thẳng vào add_fingerprint/update_fingerprint)
+        """
+        descriptors = {}
+        if anh_xu_ly is None:
+            return descriptors
+        
+        mo_ta = mo_ta or {}
+        for method, (column, lop_mo_ta) in self.DESCRIPTORS.items():
+            try:
+                mo_ta_anh = mo_ta.get(method)
+                if mo_ta_anh is None:
+                    mo_ta_anh = lop_mo_ta.extract(anh_xu_ly)
+                descriptors[column] = mo_ta_anh.to_bytes()
+            except Exception as e:
+                print(f"Lỗi trích {column}: {e}")
+        return descriptors
+    
+    def backfill_descriptors(self):
+        """
+        Trích descriptor cho các vân tay đã lưu trước khi có cột descriptor
+        
+        Returns:
+            int: Số vân tay đã cập nhật
+        """
+        count = 0
+        for db_fp in self.db.get_fingerprints_without_descriptors() or []:
+            db_binary_image = self._decode_binary_image(db_fp.get('binary_image_data'))
+            descriptors = self.extract_descriptors(db_binary_image)
+            if descriptors and self.db.update_fingerprint(db_fp['fingerprint_id'], **descriptors):
+                count += 1
+        return count
+    
+    def migrate_binary_images(self, batch_size=200):
+        """
+        Chuyển ảnh nhị phân lưu dạng PNG (trước khi có định dạng packbits) sang định dạng mới
+        
+        Args:
+            batch_size: Số vân tay đọc mỗi lần
+            
+        Returns:
+            int: Số vân tay đã chuyển
+        """
+        count = 0
+        last_id = 0
+        while True:
+            rows = self.db.get_fingerprints_with_legacy_binary_image(MA_DINH_DANG, last_id, batch_size)
+            if not rows:
+                break
+            for db_fp in rows:
+                last_id = db_fp['fingerprint_id']
+                try:
+                    db_binary_image = self._decode_binary_image(db_fp['binary_image_data'])
+                    if db_binary_image is None:
+                        continue
+                    if self.db.update_fingerprint(last_id, binary_image_data=ma_hoa_anh_nhi_phan(db_binary_image)):
+                        count += 1
+                except Exception as e:
+                    print(f"Lỗi chuyển ảnh nhị phân của fingerprint {last_id}: {e}")
+        return count
+    
     def get_user_info(self, user_id):
         """Lấy thông tin chi tiết của người dùng"""
         user = self.db.get_user_by_id(user_id)
@@ -239,7 +437,12 @@ class FingerprintRecognition:
     
     def save_match_record(self, user_id, fingerprint_id, query_image_path,
                          matching_method, similarity_score, is_match):
-        """Lưu bản ghi so khớp vào database"""
+        """Lưu bản ghi so khớp vào database (đưa vào hàng đợi nếu đã bật enable_async_history)"""
+        if self.history_writer is not None:
+            return self.history_writer.record(
+                user_id, fingerprint_id, query_image_path,
+                matching_method, similarity_score, is_match
+            )
         return self.db.add_matching_record(
             user_id, fingerprint_id, query_image_path,
             matching_method, similarity_score, is_match
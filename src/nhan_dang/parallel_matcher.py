@@ -0,0 +1,220 @@
+"""
+Module nhận dạng 1:N song song trên nhiều tiến trình
+Thư viện mẫu được chép một lần vào bộ nhớ dùng chung, mỗi tiến trình con so
+khớp một phân đoạn mẫu và trả về top-k của phân đoạn, tiến trình chính gộp lại
+"""
+
+import heapq
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from so_khop.so_khop_van_tay import so_khop_minutiae_mot_nhieu
+
+
+# Thư viện nhỏ hơn mức này so khớp ngay trong tiến trình chính sẽ nhanh hơn
+SO_MAU_TOI_THIEU_SONG_SONG = 256
+
+# Số mẫu mỗi lượt khi so khớp tuần tự có điều kiện dừng sớm
+SO_MAU_MOI_LUOT = 256
+
+# Các mảng của PackedTemplates cần cho so khớp minutiae
+_TEN_MANG = ('offsets', 'positions', 'angles')
+
+# Bộ nhớ dùng chung đã gắn trong tiến trình con: tên -> (SharedMemory, ndarray)
+_BO_NHO_WORKER = {}
+
+
+def _gan_bo_nho(ten, shape, dtype):
+    """Gắn (một lần) vùng nhớ dùng chung trong tiến trình con"""
+    if ten not in _BO_NHO_WORKER:
+        # Tiến trình con dùng chung resource tracker với tiến trình chính nên
+        # chỉ đóng (close) khi không dùng nữa, việc xóa do tiến trình chính làm
+        shm = shared_memory.SharedMemory(name=ten)
+        _BO_NHO_WORKER[ten] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return _BO_NHO_WORKER[ten][1]
+
+
+def _so_khop_phan_doan(mo_ta, k0, k1, minutiae, top_k, tham_so):
+    """
+    Hàm chạy trong tiến trình con: so khớp minutiae với các mẫu [k0, k1)
+
+    Args:
+        mo_ta (dict): Tên mảng -> (tên vùng nhớ, shape, dtype)
+        k0, k1 (int): Phân đoạn mẫu cần so khớp
+        minutiae (dict): Minutiae truy vấn
+        top_k (int): Số kết quả tốt nhất trả về
+        tham_so (dict): Tham số thêm cho so_khop_minutiae_mot_nhieu
+
+    Returns:
+        list: Tối đa top_k cặp (điểm, -chỉ số mẫu)
+    """
+    # Bỏ các vùng nhớ của phiên bản thư viện cũ
+    ten_hien_tai = {ten for ten, _, _ in mo_ta.values()}
+    for ten in list(_BO_NHO_WORKER):
+        if ten not in ten_hien_tai:
+            shm, _ = _BO_NHO_WORKER.pop(ten)
+            shm.close()
+
+    mang = {khoa: _gan_bo_nho(*gia_tri) for khoa, gia_tri in mo_ta.items()}
+    return _top_k_trong_doan(mang['offsets'], mang['positions'], mang['angles'],
+                             k0, k1, minutiae, top_k, tham_so)
+
+
+def _top_k_trong_doan(offsets, positions, angles, k0, k1, minutiae, top_k, tham_so):
+    """
+    So khớp minutiae với các mẫu [k0, k1), trả về tối đa top_k cặp
+    (điểm, -chỉ số mẫu) theo điểm giảm dần
+    """
+    offsets = offsets[k0:k1 + 1]
+    dau, cuoi = offsets[0], offsets[-1]
+
+    ket_qua = so_khop_minutiae_mot_nhieu(
+        minutiae, positions[dau:cuoi], angles[dau:cuoi], offsets - dau, **tham_so
+    )
+    diem = ket_qua['similarity_score']
+    return heapq.nlargest(top_k, zip(diem.tolist(), range(-k0, -k1, -1)))
+
+
+def _gop_top_k(heap, ung_vien, top_k):
+    """Đưa các ứng viên vào min-heap giới hạn top_k phần tử"""
+    for cap in ung_vien:
+        if len(heap) < top_k:
+            heapq.heappush(heap, cap)
+        elif cap > heap[0]:
+            heapq.heapreplace(heap, cap)
+
+
+class _BanChiaSe:
+    """Các mảng của một bản chụp thư viện đặt trong bộ nhớ dùng chung"""
+
+    def __init__(self, templates):
+        self.templates = templates
+        self._vung_nho = []
+        self.mo_ta = {}
+        try:
+            for khoa in _TEN_MANG:
+                mang = np.ascontiguousarray(getattr(templates, khoa))
+                shm = shared_memory.SharedMemory(create=True, size=max(1, mang.nbytes))
+                self._vung_nho.append(shm)
+                np.ndarray(mang.shape, dtype=mang.dtype, buffer=shm.buf)[...] = mang
+                self.mo_ta[khoa] = (shm.name, mang.shape, mang.dtype.str)
+        except Exception:
+            self.dong()
+            raise
+
+    def dong(self):
+        """Giải phóng bộ nhớ dùng chung"""
+        for shm in self._vung_nho:
+            try:
+                shm.close()
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        self._vung_nho = []
+
+
+class ParallelMatcher:
+    """
+    So khớp minutiae 1:N song song bằng ProcessPoolExecutor
+
+    Bản chụp PackedTemplates được chép vào bộ nhớ dùng chung khi thư viện thay
+    đổi; mỗi lần tìm chỉ gửi minutiae truy vấn và khoảng chỉ số mẫu cho từng
+    tiến trình con.
+    """
+
+    def __init__(self, so_tien_trinh=None):
+        """
+        Khởi tạo bộ so khớp song song
+
+        Args:
+            so_tien_trinh (int): Số tiến trình con (None hoặc <= 0: theo số CPU)
+        """
+        if not so_tien_trinh or so_tien_trinh <= 0:
+            so_tien_trinh = os.cpu_count() or 1
+        self.so_tien_trinh = so_tien_trinh
+        self._executor = None
+        self._ban_chia_se = None
+        self._lock = threading.Lock()
+
+    def _chuan_bi(self, templates):
+        """Tạo pool và chép bản chụp vào bộ nhớ dùng chung nếu cần"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.so_tien_trinh)
+        if self._ban_chia_se is None or self._ban_chia_se.templates is not templates:
+            if self._ban_chia_se is not None:
+                self._ban_chia_se.dong()
+                self._ban_chia_se = None
+            self._ban_chia_se = _BanChiaSe(templates)
+        return self._ban_chia_se
+
+    def _chia_phan_doan(self, offsets):
+        """Chia các mẫu thành các đoạn liên tiếp có số minutiae xấp xỉ nhau"""
+        so_mau = len(offsets) - 1
+        so_doan = min(so_mau, self.so_tien_trinh * 2)
+        moc = np.linspace(0, offsets[-1], so_doan + 1)
+        bien = np.unique(np.searchsorted(offsets, moc, side='left').clip(0, so_mau))
+        bien[0], bien[-1] = 0, so_mau
+        return [(int(a), int(b)) for a, b in zip(bien[:-1], bien[1:]) if b > a]
+
+    def top_k(self, templates, minutiae, top_k=5, diem_dung=None, **tham_so):
+        """
+        Tìm top_k mẫu có điểm minutiae cao nhất
+
+        Args:
+            templates (PackedTemplates): Bản chụp thư viện mẫu
+            minutiae (dict): Minutiae truy vấn
+            top_k (int): Số kết quả
+            diem_dung (float): Dừng sớm khi đã gặp mẫu có điểm >= diem_dung
+                (None: xét toàn bộ thư viện). Khi dừng sớm, kết quả là top_k
+                trong phần thư viện đã xét
+            **tham_so: Tham số thêm cho so_khop_minutiae_mot_nhieu
+
+        Returns:
+            list: Các cặp (điểm, chỉ số mẫu) theo điểm giảm dần; cùng điểm thì
+                  mẫu đứng trước trong thư viện xếp trước
+        """
+        if len(templates) == 0 or top_k <= 0:
+            return []
+
+        # Min-heap giữ top_k cặp (điểm, -chỉ số mẫu) tốt nhất đã gặp
+        heap = []
+        if self.so_tien_trinh <= 1 or len(templates) < SO_MAU_TOI_THIEU_SONG_SONG:
+            buoc = len(templates) if diem_dung is None else SO_MAU_MOI_LUOT
+            for k0 in range(0, len(templates), buoc):
+                k1 = min(len(templates), k0 + buoc)
+                _gop_top_k(heap, _top_k_trong_doan(templates.offsets, templates.positions,
+                                                   templates.angles, k0, k1, minutiae,
+                                                   top_k, tham_so), top_k)
+                if diem_dung is not None and max(heap)[0] >= diem_dung:
+                    break
+        else:
+            with self._lock:
+                ban = self._chuan_bi(templates)
+                futures = [
+                    self._executor.submit(_so_khop_phan_doan, ban.mo_ta, k0, k1,
+                                          minutiae, top_k, tham_so)
+                    for k0, k1 in self._chia_phan_doan(templates.offsets)
+                ]
+                # Gộp top-k của từng phân đoạn theo thứ tự hoàn thành
+                for future in as_completed(futures):
+                    _gop_top_k(heap, future.result(), top_k)
+                    if diem_dung is not None and heap and max(heap)[0] >= diem_dung:
+                        for con_lai in futures:
+                            con_lai.cancel()
+                        break
+
+        return [(diem, -am_k) for diem, am_k in sorted(heap, reverse=True)]
+
+    def close(self):
+        """Dừng các tiến trình con và giải phóng bộ nhớ dùng chung"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+            if self._ban_chia_se is not None:
+                self._ban_chia_se.dong()
+                self._ban_chia_se = None
@@ -0,0 +1,271 @@
+"""
+Module thư viện mẫu vân tay thường trú trong bộ nhớ
+Giữ minutiae của toàn bộ vân tay đã duyệt dưới dạng mảng NumPy liền mạch
+để nhận dạng 1:N không phải truy vấn MySQL và json.loads mỗi lần tìm kiếm
+"""
+
+import json
+import threading
+
+import numpy as np
+
+
+# Mã loại minutiae trong mảng types
+LOAI_ENDING = 0
+LOAI_BIFURCATION = 1
+
+
+class PackedTemplates:
+    """
+    Tập mẫu minutiae đóng gói (không thay đổi sau khi tạo)
+
+    Minutiae của mẫu k nằm trong đoạn offsets[k]:offsets[k + 1] của các mảng
+    positions (n, 2), angles (n,) và types (n,). Trong mỗi mẫu các ending đứng
+    trước bifurcation, đúng thứ tự so_khop_minutiae ghép hai danh sách.
+    """
+
+    __slots__ = ('fingerprint_ids', 'user_ids', 'usernames', 'full_names',
+                 'finger_names', 'offsets', 'positions', 'angles', 'types')
+
+    def __init__(self, fingerprint_ids, user_ids, usernames, full_names,
+                 finger_names, offsets, positions, angles, types):
+        self.fingerprint_ids = fingerprint_ids
+        self.user_ids = user_ids
+        self.usernames = usernames
+        self.full_names = full_names
+        self.finger_names = finger_names
+        self.offsets = offsets
+        self.positions = positions
+        self.angles = angles
+        self.types = types
+
+    @classmethod
+    def rong(cls):
+        """Tạo tập mẫu rỗng"""
+        return cls(np.zeros(0, np.int64), np.zeros(0, np.int64),
+                   np.zeros(0, object), np.zeros(0, object), np.zeros(0, object),
+                   np.zeros(1, np.int64), np.zeros((0, 2), np.float64),
+                   np.zeros(0, np.float64), np.zeros(0, np.int8))
+
+    @classmethod
+    def tu_ban_ghi(cls, records):
+        """
+        Đóng gói các bản ghi từ DatabaseManager.get_minutiae_templates
+
+        Args:
+            records: Danh sách bản ghi (minutiae_data là chuỗi JSON hoặc dict)
+
+        Returns:
+            PackedTemplates: Tập mẫu, bỏ qua bản ghi không có minutiae
+        """
+        meta = []
+        so_luong = []
+        vi_tri, huong, loai = [], [], []
+
+        for record in records or []:
+            minutiae = record.get('minutiae_data')
+            if isinstance(minutiae, (str, bytes, bytearray)):
+                try:
+                    minutiae = json.loads(minutiae)
+                except ValueError as e:
+                    print(f"Lỗi đọc minutiae của fingerprint {record.get('fingerprint_id')}: {e}")
+                    continue
+            if not minutiae:
+                continue
+
+            endings = minutiae.get('endings', [])
+            bifurcations = minutiae.get('bifurcations', [])
+            if not endings and not bifurcations:
+                continue
+
+            for ma_loai, danh_sach in ((LOAI_ENDING, endings), (LOAI_BIFURCATION, bifurcations)):
+                for m in danh_sach:
+                    vi_tri.append(m['position'])
+                    huong.append(m.get('orientation', 0))
+                    loai.append(ma_loai)
+
+            so_luong.append(len(endings) + len(bifurcations))
+            meta.append((record['fingerprint_id'], record['user_id'], record.get('username'),
+                         record.get('full_name'), record.get('finger_name')))
+
+        if not meta:
+            return cls.rong()
+
+        fingerprint_ids, user_ids, usernames, full_names, finger_names = zip(*meta)
+        offsets = np.zeros(len(so_luong) + 1, np.int64)
+        np.cumsum(so_luong, out=offsets[1:])
+
+        return cls(np.array(fingerprint_ids, np.int64), np.array(user_ids, np.int64),
+                   np.array(usernames, object), np.array(full_names, object),
+                   np.array(finger_names, object), offsets,
+                   np.asarray(vi_tri, np.float64).reshape(-1, 2),
+                   np.asarray(huong, np.float64), np.asarray(loai, np.int8))
+
+    def __len__(self):
+        return len(self.fingerprint_ids)
+
+    def noi(self, other):
+        """Trả về tập mẫu mới gồm các mẫu của self rồi tới other"""
+        if len(other) == 0:
+            return self
+        if len(self) == 0:
+            return other
+        return PackedTemplates(
+            np.concatenate([self.fingerprint_ids, other.fingerprint_ids]),
+            np.concatenate([self.user_ids, other.user_ids]),
+            np.concatenate([self.usernames, other.usernames]),
+            np.concatenate([self.full_names, other.full_names]),
+            np.concatenate([self.finger_names, other.finger_names]),
+            np.concatenate([self.offsets, other.offsets[1:] + self.offsets[-1]]),
+            np.concatenate([self.positions, other.positions]),
+            np.concatenate([self.angles, other.angles]),
+            np.concatenate([self.types, other.types])
+        )
+
+    def loc(self, giu_lai):
+        """
+        Trả về tập mẫu mới chỉ gồm các mẫu có giu_lai[k] = True
+
+        Args:
+            giu_lai (np.ndarray): Mặt nạ bool theo mẫu
+        """
+        if giu_lai.all():
+            return self
+        so_luong = np.diff(self.offsets)
+        giu_minutiae = np.repeat(giu_lai, so_luong)
+        offsets = np.zeros(int(giu_lai.sum()) + 1, np.int64)
+        np.cumsum(so_luong[giu_lai], out=offsets[1:])
+        return PackedTemplates(
+            self.fingerprint_ids[giu_lai], self.user_ids[giu_lai],
+            self.usernames[giu_lai], self.full_names[giu_lai], self.finger_names[giu_lai],
+            offsets, self.positions[giu_minutiae], self.angles[giu_minutiae],
+            self.types[giu_minutiae]
+        )
+
+    def lay_minutiae(self, k):
+        """
+        Dựng lại minutiae của mẫu k theo định dạng của trich_minutiae_chi_tiet
+
+        Returns:
+            dict: {'endings': [...], 'bifurcations': [...]}
+        """
+        dau, cuoi = self.offsets[k], self.offsets[k + 1]
+        minutiae = {'endings': [], 'bifurcations': []}
+        for vi_tri, huong, ma_loai in zip(self.positions[dau:cuoi].tolist(),
+                                          self.angles[dau:cuoi].tolist(),
+                                          self.types[dau:cuoi].tolist()):
+            if ma_loai == LOAI_ENDING:
+                minutiae['endings'].append({'position': tuple(vi_tri), 'orientation': huong,
+                                            'type': 'ending'})
+            else:
+                minutiae['bifurcations'].append({'position': tuple(vi_tri), 'orientation': huong,
+                                                 'type': 'bifurcation'})
+        return minutiae
+
+    def lay_thong_tin(self, k):
+        """Thông tin người dùng/vân tay của mẫu k theo khóa của kết quả nhận dạng"""
+        return {
+            'user_id': int(self.user_ids[k]),
+            'username': self.usernames[k],
+            'full_name': self.full_names[k],
+            'fingerprint_id': int(self.fingerprint_ids[k]),
+            'finger_name': self.finger_names[k]
+        }
+
+
+class TemplateGallery:
+    """
+    Thư viện mẫu minutiae thường trú, tự đồng bộ với DatabaseManager
+
+    Tải toàn bộ vân tay đã duyệt một lần (lần đầu gọi snapshot), sau đó cập
+    nhật theo thông báo từ add_fingerprint/update_fingerprint/delete_fingerprint
+    và update_user/delete_user. Mỗi thay đổi tạo một PackedTemplates mới nên
+    luồng đang nhận dạng luôn đọc được một bản chụp nhất quán mà không cần khóa.
+    """
+
+    def __init__(self, db_manager):
+        """
+        Khởi tạo thư viện mẫu
+
+        Args:
+            db_manager: Instance của DatabaseManager
+        """
+        self.db = db_manager
+        self._templates = None
+        self._lock = threading.Lock()
+        self.db.add_fingerprint_listener(self._on_db_change)
+
+    @property
+    def is_loaded(self):
+        """Thư viện đã được tải từ database chưa"""
+        return self._templates is not None
+
+    def load(self):
+        """
+        Tải (lại) toàn bộ mẫu từ database
+
+        Returns:
+            PackedTemplates: Bản chụp vừa tải
+        """
+        with self._lock:
+            records = self.db.get_minutiae_templates()
+            self._templates = PackedTemplates.tu_ban_ghi(records)
+            return self._templates
+
+    def snapshot(self):
+        """Bản chụp hiện tại của thư viện (tải nếu chưa tải)"""
+        templates = self._templates
+        if templates is None:
+            templates = self.load()
+        return templates
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    def _thay_the(self, giu_lai_theo, gia_tri, records=None):
+        """Bỏ các mẫu có giu_lai_theo == gia_tri rồi thêm các bản ghi mới"""
+        with self._lock:
+            if self._templates is None:
+                return
+            templates = self._templates
+            templates = templates.loc(getattr(templates, giu_lai_theo) != gia_tri)
+            if records:
+                templates = templates.noi(PackedTemplates.tu_ban_ghi(records))
+            self._templates = templates
+
+    def refresh_fingerprint(self, fingerprint_id):
+        """Nạp lại một vân tay (bị bỏ khỏi thư viện nếu không còn được duyệt)"""
+        if self._templates is None:
+            return
+        records = self.db.get_minutiae_templates(fingerprint_id=fingerprint_id)
+        self._thay_the('fingerprint_ids', fingerprint_id, records)
+
+    def remove_fingerprint(self, fingerprint_id):
+        """Bỏ một vân tay khỏi thư viện"""
+        self._thay_the('fingerprint_ids', fingerprint_id)
+
+    def refresh_user(self, user_id):
+        """Nạp lại toàn bộ vân tay của một người dùng"""
+        if self._templates is None:
+            return
+        records = self.db.get_minutiae_templates(user_id=user_id)
+        self._thay_the('user_ids', user_id, records)
+
+    def remove_user(self, user_id):
+        """Bỏ toàn bộ vân tay của một người dùng khỏi thư viện"""
+        self._thay_the('user_ids', user_id)
+
+    def _on_db_change(self, event, key):
+        """Nhận thông báo thay đổi từ DatabaseManager"""
+        if event in ('fingerprint_added', 'fingerprint_updated'):
+            self.refresh_fingerprint(key)
+        elif event == 'fingerprints_added':
+            # Thêm hàng loạt: tải lại một lần thay vì từng vân tay
+            if self._templates is not None:
+                self.load()
+        elif event == 'fingerprint_deleted':
+            self.remove_fingerprint(key)
+        elif event == 'user_updated':
+            self.refresh_user(key)
+        elif event == 'user_deleted':
+            self.remove_user(key)
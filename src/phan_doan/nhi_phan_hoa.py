@@ -23,6 +23,24 @@ def nhi_phan_hoa_otsu(anh_xam):
     return anh_nhi_phan, threshold_value
 
 
+def nhi_phan_hoa_theo_dau(anh_tang_cuong):
+    """
+    Nhị phân hóa đáp ứng Gabor có dấu theo dấu (ngưỡng 0)
+    Dùng cho ảnh của tang_cuong_gabor_theo_huong (đáp ứng 0 -> 128): vân
+    (đáp ứng âm) thành 0, rãnh và nền thành 255 như ảnh Otsu của chế độ
+    toan_anh
+    
+    Args:
+        anh_tang_cuong (np.ndarray): Ảnh tăng cường uint8 giữ dấu
+        
+    Returns:
+        tuple: (ảnh nhị phân, ngưỡng)
+    """
+    threshold_value, anh_nhi_phan = cv2.threshold(anh_tang_cuong, 127, 255, cv2.THRESH_BINARY)
+    
+    return anh_nhi_phan, threshold_value
+
+
 def nhi_phan_hoa_adaptive(anh_xam, block_size=11, constant=2):
     """
     Nhị phân hóa ảnh bằng Adaptive Threshold
@@ -0,0 +1,148 @@
+"""
+Module chỉ mục FLANN cho so khớp SIFT/ORB 1:N
+Gộp descriptor của mọi mẫu vào một chỉ mục (KD-tree cho SIFT, LSH cho ORB),
+mỗi truy vấn chỉ cần một lần knnSearch rồi đếm phiếu theo mẫu
+"""
+
+import cv2
+import numpy as np
+
+
+# Tham số FLANN
+_FLANN_KDTREE = 1
+_FLANN_LSH = 6
+
+
+class ChiMucFlann:
+    """
+    Chỉ mục FLANN trên descriptor SIFT/ORB của cả thư viện mẫu
+
+    Một descriptor truy vấn bỏ phiếu cho mẫu t khi láng giềng gần nhất thuộc
+    t vượt qua Lowe's ratio test với láng giềng gần thứ hai cũng thuộc t. Nếu
+    láng giềng thứ hai của t không nằm trong so_lang_gieng kết quả, dùng
+    khoảng cách của láng giềng cuối cùng (không lớn hơn khoảng cách thật) nên
+    phiếu luôn hợp lệ. Điểm tính như so_khop_feature_matching:
+    số phiếu / (số keypoint truy vấn + số keypoint mẫu) * 100.
+    """
+
+    def __init__(self, use_sift=True, so_lang_gieng=8, ty_le=0.7, so_cay=4, checks=64):
+        """
+        Khởi tạo chỉ mục
+
+        Args:
+            use_sift (bool): Descriptor SIFT (KD-tree) hay ORB (LSH)
+            so_lang_gieng (int): Số láng giềng lấy cho mỗi descriptor truy vấn
+            ty_le (float): Ngưỡng Lowe's ratio test
+            so_cay (int): Số cây KD-tree (SIFT)
+            checks (int): Số lần kiểm tra khi tìm kiếm (độ chính xác/tốc độ)
+        """
+        self.use_sift = use_sift
+        self.so_lang_gieng = so_lang_gieng
+        self.ty_le = ty_le
+        self.checks = checks
+        if use_sift:
+            self._tham_so = dict(algorithm=_FLANN_KDTREE, trees=so_cay)
+        else:
+            self._tham_so = dict(algorithm=_FLANN_LSH, table_number=6, key_size=12,
+                                 multi_probe_level=1)
+        self._index = None
+        self.offsets = np.zeros(1, np.int64)
+        self.so_keypoint = np.zeros(0, np.int64)
+
+    def __len__(self):
+        return len(self.so_keypoint)
+
+    def xay_dung(self, danh_sach_mo_ta):
+        """
+        Xây chỉ mục từ descriptor của các mẫu
+
+        Args:
+            danh_sach_mo_ta (list): MoTaSiftOrb của từng mẫu (None hoặc khác loại
+                SIFT/ORB được coi là mẫu không có descriptor)
+        """
+        kieu = np.float32 if self.use_sift else np.uint8
+        khoi = []
+        so_luong = []
+        so_keypoint = []
+        for mo_ta in danh_sach_mo_ta:
+            descriptors = None
+            if mo_ta is not None and mo_ta['use_sift'] == self.use_sift:
+                descriptors = mo_ta['descriptors']
+            if descriptors is None or len(descriptors) == 0:
+                so_luong.append(0)
+                so_keypoint.append(0 if mo_ta is None else mo_ta['so_keypoint'])
+                continue
+            khoi.append(np.asarray(descriptors, dtype=kieu))
+            so_luong.append(len(descriptors))
+            so_keypoint.append(mo_ta['so_keypoint'])
+
+        self.offsets = np.zeros(len(so_luong) + 1, np.int64)
+        np.cumsum(so_luong, out=self.offsets[1:])
+        self.so_keypoint = np.asarray(so_keypoint, dtype=np.int64)
+        self._mau_cua_descriptor = np.repeat(np.arange(len(so_luong)), so_luong)
+        self._index = None
+        if khoi:
+            self._du_lieu = np.ascontiguousarray(np.concatenate(khoi))
+            self._index = cv2.flann_Index(self._du_lieu, self._tham_so)
+        return self
+
+    def so_khop(self, mo_ta_truy_van):
+        """
+        So khớp descriptor truy vấn với mọi mẫu bằng một lần knnSearch
+
+        Args:
+            mo_ta_truy_van: MoTaSiftOrb của ảnh truy vấn
+
+        Returns:
+            dict: Các mảng theo mẫu: good_matches, similarity_score,
+                  feature_count2; và feature_count1 (int)
+        """
+        so_mau = len(self)
+        so_kp1 = mo_ta_truy_van['so_keypoint']
+        phieu = np.zeros(so_mau, np.int64)
+
+        descriptors = mo_ta_truy_van['descriptors']
+        if (self._index is not None and descriptors is not None and len(descriptors) > 0
+                and mo_ta_truy_van['use_sift'] == self.use_sift):
+            k = min(self.so_lang_gieng, len(self._du_lieu))
+            kieu = np.float32 if self.use_sift else np.uint8
+            chi_so, khoang_cach = self._index.knnSearch(np.asarray(descriptors, dtype=kieu), k,
+                                                        params=dict(checks=self.checks))
+            phieu = self._dem_phieu(chi_so, khoang_cach.astype(np.float64), so_mau)
+
+        tong_kp = so_kp1 + self.so_keypoint
+        similarity_score = np.divide(phieu * 100.0, tong_kp, out=np.zeros(so_mau),
+                                     where=tong_kp > 0)
+        return {
+            'good_matches': phieu,
+            'similarity_score': np.clip(similarity_score, 0, 100),
+            'feature_count1': so_kp1,
+            'feature_count2': self.so_keypoint
+        }
+
+    def _dem_phieu(self, chi_so, khoang_cach, so_mau):
+        """Đếm phiếu theo mẫu từ kết quả knnSearch (mỗi hàng một descriptor truy vấn)"""
+        k = chi_so.shape[1]
+        hop_le = chi_so >= 0
+        mau = np.where(hop_le, self._mau_cua_descriptor[np.clip(chi_so, 0, None)], -1)
+
+        # KD-tree trả về bình phương khoảng cách L2, LSH trả về khoảng cách Hamming
+        ty_le = self.ty_le ** 2 if self.use_sift else self.ty_le
+
+        # Khoảng cách láng giềng thứ hai cùng mẫu, mặc định là láng giềng cuối cùng
+        lan_dau = np.zeros_like(hop_le)
+        d2 = np.repeat(khoang_cach[:, -1:], k, axis=1)
+        da_co_thu_hai = np.zeros_like(hop_le)
+        for c in range(k):
+            cung_mau_truoc = (mau[:, :c] == mau[:, c:c + 1]) & hop_le[:, c:c + 1]
+            lan_dau[:, c] = hop_le[:, c] & ~cung_mau_truoc.any(axis=1)
+            # Cột c là lần xuất hiện thứ hai của mẫu ở cột lan_dau trước đó
+            for c0 in range(c):
+                la_thu_hai = (cung_mau_truoc[:, c0] & lan_dau[:, c0] & ~da_co_thu_hai[:, c0])
+                d2[la_thu_hai, c0] = khoang_cach[la_thu_hai, c]
+                da_co_thu_hai[:, c0] |= la_thu_hai
+
+        # Láng giềng cuối cùng không có thông tin về láng giềng thứ hai
+        dat = lan_dau & (khoang_cach < ty_le * d2)
+        dat[:, -1] &= da_co_thu_hai[:, -1]
+        return np.bincount(mau[dat], minlength=so_mau)
@@ -2,6 +2,10 @@
 Module so khớp ảnh vân tay
 """
 
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 import numpy as np
 from scipy.spatial.distance import euclidean
 from scipy.optimize import linear_sum_assignment
@@ -57,9 +61,249 @@ def tinh_khoang_cach_minutiae(minutiae1, minutiae2, max_distance=50, angle_toler
     return max(0, overall_score)
 
 
-def so_khop_minutiae(minutiae1, minutiae2, max_distance=50, angle_tolerance=30, min_matches=5):
+def minutiae_thanh_mang(minutiae):
+    """
+    Chuyển minutiae dạng dict sang mảng NumPy
+    Ending đứng trước bifurcation như thứ tự ghép trong so_khop_minutiae
+    
+    Args:
+        minutiae (dict): {'endings': [...], 'bifurcations': [...]}
+        
+    Returns:
+        tuple: (positions (n, 2) float64, angles (n,) float64, danh sách minutiae)
+    """
+    tat_ca = minutiae.get('endings', []) + minutiae.get('bifurcations', [])
+    positions = np.array([m['position'] for m in tat_ca], dtype=np.float64).reshape(-1, 2)
+    angles = np.array([m.get('orientation', 0) for m in tat_ca], dtype=np.float64)
+    return positions, angles, tat_ca
+
+
+def tinh_ma_tran_diem_minutiae(positions1, angles1, positions2, angles2,
+                               max_distance=50, angle_tolerance=30):
+    """
+    Tính điểm tương đồng của mọi cặp minutiae cùng lúc
+    Công thức giống hệt tinh_khoang_cach_minutiae
+    
+    Args:
+        positions1, angles1: Mảng vị trí (n1, 2) và hướng (n1,) của tập 1
+        positions2, angles2: Mảng vị trí (n2, 2) và hướng (n2,) của tập 2
+        max_distance (float): Khoảng cách tối đa để coi là match
+        angle_tolerance (float): Độ chịu nước cơn dành hướng (độ)
+        
+    Returns:
+        np.ndarray: Ma trận điểm (n1, n2), 0 ở các cặp không match
+    """
+    dx = positions1[:, 0, None] - positions2[None, :, 0]
+    dy = positions1[:, 1, None] - positions2[None, :, 1]
+    dist = np.sqrt(dx * dx + dy * dy)
+    
+    angle_diff = np.abs(angles1[:, None] - angles2[None, :])
+    angle_diff = np.where(angle_diff > 180, 360 - angle_diff, angle_diff)
+    
+    distance_score = (max_distance - dist) / max_distance * 100
+    angle_score = (angle_tolerance - angle_diff) / angle_tolerance * 100
+    diem = (distance_score + angle_score) / 2
+    
+    diem[(dist > max_distance) | (angle_diff > angle_tolerance)] = 0.0
+    return np.maximum(diem, 0.0, out=diem)
+
+
+def _ghep_cap_minutiae(diem, phuong_phap):
+    """
+    Ghép cặp minutiae từ ma trận điểm
+    
+    Args:
+        diem (np.ndarray): Ma trận điểm (n1, n2)
+        phuong_phap (str): 'tham_lam' - mỗi minutiae tập 1 lần lượt lấy minutiae
+            tập 2 chưa dùng có điểm cao nhất; 'toi_uu' - gán tối ưu tổng điểm
+            (linear_sum_assignment)
+            
+    Returns:
+        list: Các cặp (i, j) có điểm > 0, theo thứ tự i tăng dần
+    """
+    if phuong_phap == 'toi_uu':
+        hang, cot = linear_sum_assignment(diem, maximize=True)
+        return [(i, j) for i, j in zip(hang.tolist(), cot.tolist()) if diem[i, j] > 0]
+    if phuong_phap != 'tham_lam':
+        raise ValueError(f"Phương pháp ghép cặp không hợp lệ: {phuong_phap}")
+    
+    cap = []
+    con_lai = diem.copy()
+    # Chỉ những hàng có ít nhất một cặp > 0 mới có thể ghép được
+    for i in np.flatnonzero(diem.max(axis=1) > 0).tolist():
+        j = int(np.argmax(con_lai[i]))
+        if con_lai[i, j] > 0:
+            cap.append((i, j))
+            con_lai[:, j] = 0.0
+    return cap
+
+
+def so_khop_minutiae(minutiae1, minutiae2, max_distance=50, angle_tolerance=30, min_matches=5,
+                     phuong_phap='tham_lam'):
     """
     So khớp hai tập hợp minutiae
+    Điểm mọi cặp được tính một lần bằng ma trận, kết quả giống so_khop_minutiae_tung_cap
+    
+    Args:
+        minutiae1 (dict): {'endings': [...], 'bifurcations': [...]}
+        minutiae2 (dict): {'endings': [...], 'bifurcations': [...]}
+        max_distance (float): Khoảng cách tối đa
+        angle_tolerance (float): Độ chịu nước cơn về hướng
+        min_matches (int): Số match tối thiểu
+        phuong_phap (str): 'tham_lam' (mặc định) hoặc 'toi_uu' (gán tối ưu)
+        
+    Returns:
+        dict: Kết quả so khớp với chi tiết
+    """
+    positions1, angles1, all_minutiae1 = minutiae_thanh_mang(minutiae1)
+    positions2, angles2, all_minutiae2 = minutiae_thanh_mang(minutiae2)
+    
+    if not all_minutiae1 or not all_minutiae2:
+        return {
+            'match_count': 0,
+            'total_minutiae1': len(all_minutiae1),
+            'total_minutiae2': len(all_minutiae2),
+            'similarity_score': 0.0,
+            'matched_pairs': []
+        }
+    
+    diem = tinh_ma_tran_diem_minutiae(positions1, angles1, positions2, angles2,
+                                      max_distance, angle_tolerance)
+    matched_pairs = [{
+        'minutiae1': all_minutiae1[i],
+        'minutiae2': all_minutiae2[j],
+        'score': diem[i, j]
+    } for i, j in _ghep_cap_minutiae(diem, phuong_phap)]
+    
+    # Tính điểm tương đồng
+    if matched_pairs:
+        avg_score = np.mean([pair['score'] for pair in matched_pairs])
+    else:
+        avg_score = 0.0
+    
+    # Tính tỉ lệ so khớp
+    max_minutiae = max(len(all_minutiae1), len(all_minutiae2))
+    match_count = len(matched_pairs)
+    match_percentage = (match_count / max_minutiae * 100) if max_minutiae > 0 else 0
+    
+    return {
+        'match_count': match_count,
+        'total_minutiae1': len(all_minutiae1),
+        'total_minutiae2': len(all_minutiae2),
+        'similarity_score': avg_score,
+        'match_percentage': match_percentage,
+        'matched_pairs': matched_pairs,
+        'is_match': match_count >= min_matches and avg_score > 30
+    }
+
+
+def so_khop_minutiae_mot_nhieu(minutiae, positions, angles, offsets, max_distance=50,
+                               angle_tolerance=30, min_matches=5, phuong_phap='tham_lam',
+                               so_o_toi_da=1 << 22):
+    """
+    So khớp một tập minutiae với nhiều mẫu cùng lúc
+    Mẫu k gồm các minutiae offsets[k]:offsets[k + 1] của positions/angles
+    (định dạng của PackedTemplates). Với 'tham_lam', mỗi lượt xử lý một
+    minutiae truy vấn cho mọi mẫu bằng các phép toán theo đoạn (reduceat)
+    
+    Args:
+        minutiae (dict): Minutiae truy vấn {'endings': [...], 'bifurcations': [...]}
+        positions (np.ndarray): Vị trí (N, 2) của mọi mẫu ghép liền
+        angles (np.ndarray): Hướng (N,) của mọi mẫu ghép liền
+        offsets (np.ndarray): Chỉ số bắt đầu mỗi mẫu, dài số mẫu + 1
+        max_distance (float): Khoảng cách tối đa
+        angle_tolerance (float): Độ chịu nước cơn về hướng
+        min_matches (int): Số match tối thiểu
+        phuong_phap (str): 'tham_lam' (mặc định) hoặc 'toi_uu' (gán tối ưu)
+        so_o_toi_da (int): Số ô tối đa của ma trận điểm mỗi lần tính (giới hạn bộ nhớ)
+        
+    Returns:
+        dict: Các mảng theo mẫu: match_count, total_minutiae2, similarity_score,
+              match_percentage, is_match; và total_minutiae1 (int)
+    """
+    if phuong_phap not in ('tham_lam', 'toi_uu'):
+        raise ValueError(f"Phương pháp ghép cặp không hợp lệ: {phuong_phap}")
+    
+    positions1, angles1, _ = minutiae_thanh_mang(minutiae)
+    offsets = np.asarray(offsets, dtype=np.int64)
+    so_mau = len(offsets) - 1
+    so_luong = np.diff(offsets)
+    n1 = len(angles1)
+    
+    match_count = np.zeros(so_mau, dtype=np.int64)
+    tong_diem = np.zeros(so_mau, dtype=np.float64)
+    
+    # Chia các mẫu (không rỗng) thành từng nhóm sao cho ma trận điểm đủ nhỏ
+    mau_khong_rong = np.flatnonzero(so_luong > 0)
+    nhom_hien_tai = []
+    so_cot = 0
+    cac_nhom = []
+    for k in mau_khong_rong.tolist() if n1 else []:
+        if nhom_hien_tai and (so_cot + so_luong[k]) * n1 > so_o_toi_da:
+            cac_nhom.append(nhom_hien_tai)
+            nhom_hien_tai, so_cot = [], 0
+        nhom_hien_tai.append(k)
+        so_cot += so_luong[k]
+    if nhom_hien_tai:
+        cac_nhom.append(nhom_hien_tai)
+    
+    for nhom in cac_nhom:
+        k0, k1 = nhom[0], nhom[-1] + 1
+        dau, cuoi = offsets[k0], offsets[k1]
+        diem = tinh_ma_tran_diem_minutiae(positions1, angles1, positions[dau:cuoi],
+                                          angles[dau:cuoi], max_distance, angle_tolerance)
+        
+        if phuong_phap == 'toi_uu':
+            for k in range(k0, k1):
+                if so_luong[k] == 0:
+                    continue
+                khoi = diem[:, offsets[k] - dau:offsets[k + 1] - dau]
+                cap = _ghep_cap_minutiae(khoi, 'toi_uu')
+                match_count[k] = len(cap)
+                tong_diem[k] = sum(khoi[i, j] for i, j in cap)
+            continue
+        
+        # Bỏ các mẫu rỗng trong đoạn [k0, k1) để reduceat đúng
+        mau = np.arange(k0, k1)[so_luong[k0:k1] > 0]
+        bat_dau = offsets[mau] - dau
+        mau_cua_cot = np.repeat(np.arange(len(mau)), so_luong[mau])
+        
+        for i in np.flatnonzero(diem.max(axis=1) > 0).tolist():
+            hang = diem[i]
+            max_doan = np.maximum.reduceat(hang, bat_dau)
+            co_match = max_doan > 0
+            if not co_match.any():
+                continue
+            
+            # Cột đầu tiên đạt max trong mỗi đoạn (như so sánh '>' của bản gốc)
+            ung_vien = np.flatnonzero((hang == max_doan[mau_cua_cot]) & co_match[mau_cua_cot])
+            doan, vi_tri_dau = np.unique(mau_cua_cot[ung_vien], return_index=True)
+            cot = ung_vien[vi_tri_dau]
+            
+            match_count[mau[doan]] += 1
+            tong_diem[mau[doan]] += hang[cot]
+            # Cột đã ghép không được dùng lại
+            diem[:, cot] = 0.0
+    
+    max_minutiae = np.maximum(so_luong, n1)
+    similarity_score = np.divide(tong_diem, match_count, out=np.zeros(so_mau),
+                                 where=match_count > 0)
+    match_percentage = np.divide(match_count * 100.0, max_minutiae, out=np.zeros(so_mau),
+                                 where=max_minutiae > 0)
+    
+    return {
+        'match_count': match_count,
+        'total_minutiae1': n1,
+        'total_minutiae2': so_luong,
+        'similarity_score': similarity_score,
+        'match_percentage': match_percentage,
+        'is_match': (match_count >= min_matches) & (similarity_score > 30)
+    }
+
+
+def so_khop_minutiae_tung_cap(minutiae1, minutiae2, max_distance=50, angle_tolerance=30, min_matches=5):
+    """
+    So khớp hai tập hợp minutiae (bản gốc duyệt từng cặp, giữ lại để đối chiếu)
     
     Args:
         minutiae1 (dict): {'endings': [...], 'bifurcations': [...]}
@@ -142,8 +386,8 @@ def so_khop_anh_toan_phan(minutiae1, minutiae2, anh1=None, anh2=None,
     Args:
         minutiae1 (dict): Minutiae từ ảnh 1
         minutiae2 (dict): Minutiae từ ảnh 2
-        anh1 (np.ndarray): Ảnh làm mảnh 1 (tuỳ chọn)
-        anh2 (np.ndarray): Ảnh làm mảnh 2 (tuỳ chọn)
+        anh1 (np.ndarray | GoiDacTrungAnh): Ảnh làm mảnh 1 (tuỳ chọn)
+        anh2 (np.ndarray | GoiDacTrungAnh): Ảnh làm mảnh 2 (tuỳ chọn)
         max_distance (float): Khoảng cách tối đa
         angle_tolerance (float): Độ chịu nước cơn về hướng
         
@@ -214,62 +458,84 @@ def phan_loai_match(similarity_score, match_percentage):
         return 'non_match'
 
 
-def so_khop_feature_matching(anh1, anh2, use_sift=True):
+# Detector/matcher OpenCV dùng lại trong từng luồng (đối tượng cv2 không an
+# toàn khi dùng chung giữa các luồng, tạo mới mỗi lần gọi thì tốn thời gian)
+_BO_NHO_LUONG = threading.local()
+
+
+def _tao_detector(use_sift=True):
+    """Lấy detector SIFT (hoặc ORB nếu không có SIFT) của luồng hiện tại, trả về (detector, use_sift)"""
+    bo_nho = _BO_NHO_LUONG.__dict__
+    khoa = ('detector', use_sift)
+    if khoa not in bo_nho:
+        detector = None
+        if use_sift:
+            try:
+                detector = cv2.SIFT_create(), True
+            except:
+                # SIFT có thể không có sẵn, dùng ORB thay thế
+                pass
+        bo_nho[khoa] = detector or (cv2.ORB_create(nfeatures=500), False)
+    return bo_nho[khoa]
+
+
+def _lay_bf_matcher(use_sift=True):
+    """Lấy BFMatcher (L2 cho SIFT, Hamming cho ORB) của luồng hiện tại"""
+    bo_nho = _BO_NHO_LUONG.__dict__
+    khoa = ('bf_matcher', use_sift)
+    if khoa not in bo_nho:
+        bo_nho[khoa] = cv2.BFMatcher(cv2.NORM_L2 if use_sift else cv2.NORM_HAMMING,
+                                     crossCheck=False)
+    return bo_nho[khoa]
+
+
+def trich_mo_ta_sift_orb(anh, use_sift=True):
     """
-    Phương pháp 5: Feature Matching - So khớp dựa trên SIFT/ORB features
+    Trích descriptor SIFT/ORB của một ảnh để so khớp nhiều lần
     
     Args:
-        anh1 (np.ndarray): Ảnh vân tay 1
-        anh2 (np.ndarray): Ảnh vân tay 2
+        anh (np.ndarray | GoiDacTrungAnh): Ảnh vân tay
         use_sift (bool): Sử dụng SIFT (True) hay ORB (False)
         
     Returns:
-        dict: Kết quả so khớp dựa trên features
+        MoTaSiftOrb: use_sift, so_keypoint, descriptors (np.ndarray hoặc None)
     """
-    if anh1 is None or anh2 is None or anh1.size == 0 or anh2.size == 0:
-        return {
-            'method': 'feature_matching',
-            'similarity_score': 0.0,
-            'feature_count1': 0,
-            'feature_count2': 0,
-            'good_matches': 0,
-            'is_match': False
-        }
+    from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh
+    
+    if anh is None:
+        return MoTaSiftOrb(use_sift=use_sift, so_keypoint=0, descriptors=None)
+    goi = GoiDacTrungAnh.tu(anh)
+    if goi.anh.size == 0:
+        return MoTaSiftOrb(use_sift=use_sift, so_keypoint=0, descriptors=None)
     
+    detector, use_sift = _tao_detector(use_sift)
+    keypoints, descriptors = detector.detectAndCompute(goi.anh.astype(np.uint8), None)
+    return MoTaSiftOrb(use_sift=use_sift, so_keypoint=len(keypoints), descriptors=descriptors)
+
+
+def so_khop_sift_orb_mo_ta(mo_ta1, mo_ta2):
+    """
+    So khớp hai descriptor SIFT/ORB đã trích (trich_mo_ta_sift_orb)
+    
+    Returns:
+        dict: Kết quả giống so_khop_feature_matching
+    """
     try:
-        # Khởi tạo detector
-        if use_sift:
-            try:
-                sift = cv2.SIFT_create()
-                detector = sift
-            except:
-                # SIFT có thể không có sẵn, dùng ORB thay thế
-                orb = cv2.ORB_create(nfeatures=500)
-                detector = orb
-                use_sift = False
-        else:
-            orb = cv2.ORB_create(nfeatures=500)
-            detector = orb
+        so_kp1, so_kp2 = mo_ta1['so_keypoint'], mo_ta2['so_keypoint']
+        des1, des2 = mo_ta1['descriptors'], mo_ta2['descriptors']
         
-        # Phát hiện keypoints và descriptors
-        kp1, des1 = detector.detectAndCompute(anh1.astype(np.uint8), None)
-        kp2, des2 = detector.detectAndCompute(anh2.astype(np.uint8), None)
-        
-        if des1 is None or des2 is None or len(kp1) == 0 or len(kp2) == 0:
+        if des1 is None or des2 is None or so_kp1 == 0 or so_kp2 == 0:
             return {
                 'method': 'feature_matching',
                 'similarity_score': 0.0,
-                'feature_count1': len(kp1),
-                'feature_count2': len(kp2),
+                'feature_count1': so_kp1,
+                'feature_count2': so_kp2,
                 'good_matches': 0,
                 'is_match': False
             }
         
-        # Sử dụng BFMatcher hoặc FlannBasedMatcher
-        if use_sift:
-            bf = cv2.BFMatcher(cv2.NORM_L2, crossCheck=False)
-        else:
-            bf = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=False)
+        # Sử dụng BFMatcher (dùng lại trong luồng)
+        bf = _lay_bf_matcher(mo_ta1['use_sift'])
         
         # KNN matching với Lowe's ratio test
         matches = bf.knnMatch(des1, des2, k=2)
@@ -285,7 +551,7 @@ def so_khop_feature_matching(anh1, anh2, use_sift=True):
         
         # Tính similarity score dựa trên số lượng good matches
         # Dùng tổng keypoints từ cả 2 ảnh làm căn cứ, không dùng min
-        total_kp = len(kp1) + len(kp2)
+        total_kp = so_kp1 + so_kp2
         if total_kp > 0:
             # Tỷ lệ match: số good matches chia cho tổng keypoints
             # Nếu 2 ảnh y chang, số good matches ≈ min(len(kp1), len(kp2))
@@ -300,8 +566,8 @@ def so_khop_feature_matching(anh1, anh2, use_sift=True):
         return {
             'method': 'feature_matching',
             'similarity_score': max(0, min(100, similarity_score)),
-            'feature_count1': len(kp1),
-            'feature_count2': len(kp2),
+            'feature_count1': so_kp1,
+            'feature_count2': so_kp2,
             'good_matches': len(good_matches),
             'match_ratio': match_ratio if total_kp > 0 else 0,
             'is_match': len(good_matches) >= 5 and similarity_score >= 30
@@ -315,30 +581,158 @@ def so_khop_feature_matching(anh1, anh2, use_sift=True):
         }
 
 
-def so_khop_thong_ke_toan_bo(minutiae1, minutiae2, anh1=None, anh2=None):
+def so_khop_feature_matching(anh1, anh2, use_sift=True):
+    """
+    Phương pháp 5: Feature Matching - So khớp dựa trên SIFT/ORB features
+    
+    Args:
+        anh1 (np.ndarray): Ảnh vân tay 1
+        anh2 (np.ndarray): Ảnh vân tay 2
+        use_sift (bool): Sử dụng SIFT (True) hay ORB (False)
+        
+    Returns:
+        dict: Kết quả so khớp dựa trên features
+    """
+    if anh1 is None or anh2 is None or anh1.size == 0 or anh2.size == 0:
+        return {
+            'method': 'feature_matching',
+            'similarity_score': 0.0,
+            'feature_count1': 0,
+            'feature_count2': 0,
+            'good_matches': 0,
+            'is_match': False
+        }
+    
+    try:
+        mo_ta1 = trich_mo_ta_sift_orb(anh1, use_sift)
+        mo_ta2 = trich_mo_ta_sift_orb(anh2, use_sift)
+    except Exception as e:
+        return {
+            'method': 'feature_matching',
+            'similarity_score': 0.0,
+            'error': str(e),
+            'is_match': False
+        }
+    return so_khop_sift_orb_mo_ta(mo_ta1, mo_ta2)
+
+
+def chay_cac_phuong_phap(cong_viec, song_song=True, thoi_han=None, so_luong=None):
+    """
+    Chạy các phương pháp so khớp (tuần tự hoặc trên thread pool), đo thời gian từng
+    phương pháp và bỏ các phương pháp chưa xong khi hết thời hạn
+    
+    OpenCV và FFT của NumPy nhả GIL khi tính nên các phương pháp chạy đồng thời
+    được trên nhiều luồng. Phương pháp quá hạn không bị dừng giữa chừng (luồng
+    vẫn chạy nốt ở nền) nhưng kết quả của nó bị bỏ.
+    
+    Args:
+        cong_viec (list): Các cặp (tên, hàm không đối số)
+        song_song (bool): Chạy đồng thời trên thread pool
+        thoi_han (float): Tổng thời gian tối đa (giây), None = không giới hạn
+        so_luong (int): Số luồng (mặc định bằng số phương pháp)
+        
+    Returns:
+        tuple: (kết quả theo tên, thời gian chạy theo tên (giây), danh sách tên
+               quá hạn); thứ tự luôn theo thứ tự trong cong_viec
+    """
+    def do_thoi_gian(ham):
+        bat_dau = time.perf_counter()
+        ket_qua = ham()
+        return ket_qua, time.perf_counter() - bat_dau
+    
+    ket_qua, thoi_gian, qua_han = {}, {}, []
+    bat_dau = time.perf_counter()
+    
+    if not song_song or len(cong_viec) <= 1:
+        for ten, ham in cong_viec:
+            if thoi_han is not None and time.perf_counter() - bat_dau >= thoi_han:
+                qua_han.append(ten)
+                continue
+            gia_tri, thoi_gian[ten] = do_thoi_gian(ham)
+            # Xong sau thời hạn cũng bị bỏ, giống khi chạy song song
+            if thoi_han is not None and time.perf_counter() - bat_dau > thoi_han:
+                qua_han.append(ten)
+            else:
+                ket_qua[ten] = gia_tri
+        return ket_qua, thoi_gian, qua_han
+    
+    executor = ThreadPoolExecutor(max_workers=so_luong or len(cong_viec))
+    try:
+        futures = [(ten, executor.submit(do_thoi_gian, ham)) for ten, ham in cong_viec]
+        wait([future for _, future in futures], timeout=thoi_han)
+        for ten, future in futures:
+            if future.done():
+                ket_qua[ten], thoi_gian[ten] = future.result()
+            else:
+                future.cancel()
+                qua_han.append(ten)
+    finally:
+        # Không chờ các phương pháp quá hạn
+        executor.shutdown(wait=False, cancel_futures=True)
+    return ket_qua, thoi_gian, qua_han
+
+
+# Khóa kết quả của từng phương pháp dựa trên ảnh trong so_khop_thong_ke_toan_bo
+KHOA_KET_QUA_THEO_PHUONG_PHAP = {
+    'feature': 'feature_matching',
+    'lbp': 'lbp_texture',
+    'ridge': 'ridge_orientation',
+    'frequency': 'frequency_domain'
+}
+
+
+def so_khop_thong_ke_toan_bo(minutiae1, minutiae2, anh1=None, anh2=None, mo_ta1=None, mo_ta2=None,
+                             song_song=False, thoi_han=None):
     """
     Phương pháp 6: Comprehensive Matching - So khớp toàn diện kết hợp nhiều phương pháp
     
     Args:
         minutiae1 (dict): Minutiae từ ảnh 1
         minutiae2 (dict): Minutiae từ ảnh 2
-        anh1 (np.ndarray): Ảnh làm mảnh 1 (tuỳ chọn)
-        anh2 (np.ndarray): Ảnh làm mảnh 2 (tuỳ chọn)
+        anh1 (np.ndarray | GoiDacTrungAnh): Ảnh làm mảnh 1 (tuỳ chọn)
+        anh2 (np.ndarray | GoiDacTrungAnh): Ảnh làm mảnh 2 (tuỳ chọn)
+        mo_ta1 (dict): Descriptor đã trích của ảnh 1 (trich_tat_ca_mo_ta, tuỳ chọn)
+        mo_ta2 (dict): Descriptor đã trích của ảnh 2 (tuỳ chọn)
+        song_song (bool): Chạy các phương pháp đồng thời trên thread pool
+        thoi_han (float): Tổng thời gian tối đa (giây); phương pháp chưa xong bị
+            bỏ khỏi overall_score (tuỳ chọn)
         
     Returns:
-        dict: Kết quả so khớp từ tất cả phương pháp
+        dict: Kết quả so khớp từ tất cả phương pháp (thứ tự cố định), thời gian
+              từng phương pháp ('method_times', giây) và các phương pháp quá hạn
+              ('timed_out')
     """
-    results = {
-        'minutiae_matching': so_khop_minutiae(minutiae1, minutiae2)
-    }
+    cong_viec = [('minutiae_matching', lambda: so_khop_minutiae(minutiae1, minutiae2))]
     
-    if anh1 is not None and anh2 is not None:
-        results['feature_matching'] = so_khop_feature_matching(anh1, anh2)
-        results['lbp_texture'] = so_khop_lbp_texture(anh1, anh2)
-        results['ridge_orientation'] = so_khop_ridge_orientation(anh1, anh2)
-        results['frequency_domain'] = so_khop_frequency_domain(anh1, anh2)
+    co_anh = anh1 is not None and anh2 is not None
+    if co_anh:
+        from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh
+        
+        # Mỗi ảnh chỉ chuẩn hóa/biến đổi một lần (gói dùng chung cho mọi
+        # phương pháp, kể cả khi chạy trên nhiều luồng) và chỉ trích descriptor còn thiếu
+        goi1, goi2 = GoiDacTrungAnh.tu(anh1), GoiDacTrungAnh.tu(anh2)
+        mo_ta1 = dict(mo_ta1 or {})
+        mo_ta2 = dict(mo_ta2 or {})
         
-        # Tính điểm trung bình từ tất cả phương pháp
+        def so_khop_phuong_phap(phuong_phap):
+            lop = MO_TA_THEO_PHUONG_PHAP[phuong_phap]
+            if phuong_phap not in mo_ta1:
+                mo_ta1[phuong_phap] = lop.extract(goi1)
+            if phuong_phap not in mo_ta2:
+                mo_ta2[phuong_phap] = lop.extract(goi2)
+            return lop.compare(mo_ta1[phuong_phap], mo_ta2[phuong_phap])
+        
+        for phuong_phap, khoa in KHOA_KET_QUA_THEO_PHUONG_PHAP.items():
+            cong_viec.append((khoa, lambda phuong_phap=phuong_phap: so_khop_phuong_phap(phuong_phap)))
+    
+    ket_qua, thoi_gian, qua_han = chay_cac_phuong_phap(cong_viec, song_song, thoi_han)
+    
+    results = {}
+    for khoa, _ in cong_viec:
+        results[khoa] = ket_qua.get(khoa, {'method': khoa, 'timed_out': True})
+    
+    if co_anh:
+        # Tính điểm trung bình từ các phương pháp xong trong thời hạn
         scores = []
         for method, result in results.items():
             if 'similarity_score' in result:
@@ -353,6 +747,8 @@ def so_khop_thong_ke_toan_bo(minutiae1, minutiae2, anh1=None, anh2=None):
             results['max_score'] = 0.0
             results['min_score'] = 0.0
     
+    results['method_times'] = thoi_gian
+    results['timed_out'] = qua_han
     return results
 
 
@@ -361,36 +757,36 @@ def so_khop_thong_ke_toan_bo(minutiae1, minutiae2, anh1=None, anh2=None):
 # ============================================================================
 
 
-def so_khop_lbp_texture(anh1, anh2):
+def trich_mo_ta_lbp(anh, method='default'):
     """
-    So khớp sử dụng Local Binary Pattern (LBP)
-    So sánh histogram LBP của hai ảnh
+    Trích descriptor LBP của một ảnh để so khớp nhiều lần
     
     Args:
-        anh1 (np.ndarray): Ảnh 1
-        anh2 (np.ndarray): Ảnh 2
+        anh (np.ndarray | GoiDacTrungAnh): Ảnh vân tay
+        method (str): Biến thể LBP ('default', 'ror', 'uniform', 'nri_uniform')
         
     Returns:
-        dict: Kết quả so khớp
+        MoTaLBP: lbp_histogram (np.float32), texture_uniformity, lbp_method
     """
-    from trich_dac_trung.trich_dac_trung_chi_tiet import trich_lbp_features
-    
-    # Convert to grayscale if needed
-    if len(anh1.shape) == 3:
-        anh1_gray = cv2.cvtColor(anh1, cv2.COLOR_BGR2GRAY)
-    else:
-        anh1_gray = anh1
+    from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh, trich_lbp_features
     
-    if len(anh2.shape) == 3:
-        anh2_gray = cv2.cvtColor(anh2, cv2.COLOR_BGR2GRAY)
-    else:
-        anh2_gray = anh2
-    
-    features1 = trich_lbp_features(anh1_gray)
-    features2 = trich_lbp_features(anh2_gray)
+    features = trich_lbp_features(GoiDacTrungAnh.tu(anh), method=method)
+    return MoTaLBP(
+        lbp_histogram=np.array(features['lbp_histogram'], dtype=np.float32),
+        texture_uniformity=float(features['texture_uniformity']),
+        lbp_method=method
+    )
+
+
+def so_khop_lbp_mo_ta(mo_ta1, mo_ta2):
+    """
+    So khớp hai descriptor LBP đã trích (trich_mo_ta_lbp)
     
-    hist1 = np.array(features1['lbp_histogram'], dtype=np.float32)
-    hist2 = np.array(features2['lbp_histogram'], dtype=np.float32)
+    Returns:
+        dict: Kết quả giống so_khop_lbp_texture
+    """
+    hist1 = np.asarray(mo_ta1['lbp_histogram'], dtype=np.float32)
+    hist2 = np.asarray(mo_ta2['lbp_histogram'], dtype=np.float32)
     
     # Chuẩn hóa histograms
     hist1_norm = hist1 / (np.sum(hist1) + 1e-10)
@@ -411,42 +807,53 @@ def so_khop_lbp_texture(anh1, anh2):
     return {
         'method': 'LBP Texture',
         'similarity_score': max(0, min(100, similarity)),
-        'texture_uniformity_1': features1['texture_uniformity'],
-        'texture_uniformity_2': features2['texture_uniformity'],
+        'texture_uniformity_1': mo_ta1['texture_uniformity'],
+        'texture_uniformity_2': mo_ta2['texture_uniformity'],
         'chi_square_distance': chi_square
     }
 
 
-def so_khop_ridge_orientation(anh1, anh2):
+def so_khop_lbp_texture(anh1, anh2, method='default'):
     """
-    So khớp sử dụng Ridge Orientation Field
-    So sánh hướng của các sọc vân tay
+    So khớp sử dụng Local Binary Pattern (LBP)
+    So sánh histogram LBP của hai ảnh
     
     Args:
         anh1 (np.ndarray): Ảnh 1
         anh2 (np.ndarray): Ảnh 2
+        method (str): Biến thể LBP ('default', 'ror', 'uniform', 'nri_uniform')
         
     Returns:
         dict: Kết quả so khớp
     """
-    from trich_dac_trung.trich_dac_trung_chi_tiet import trich_ridge_orientation_field
-    
-    # Convert to grayscale if needed
-    if len(anh1.shape) == 3:
-        anh1_gray = cv2.cvtColor(anh1, cv2.COLOR_BGR2GRAY)
-    else:
-        anh1_gray = anh1
+    return so_khop_lbp_mo_ta(trich_mo_ta_lbp(anh1, method), trich_mo_ta_lbp(anh2, method))
+
+
+def trich_mo_ta_ridge(anh):
+    """
+    Trích descriptor Ridge Orientation Field của một ảnh
     
-    if len(anh2.shape) == 3:
-        anh2_gray = cv2.cvtColor(anh2, cv2.COLOR_BGR2GRAY)
-    else:
-        anh2_gray = anh2
+    Args:
+        anh (np.ndarray | GoiDacTrungAnh): Ảnh vân tay
+        
+    Returns:
+        MoTaRidge: orientation_field (np.ndarray theo khối)
+    """
+    from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh, trich_ridge_orientation_field
     
-    features1 = trich_ridge_orientation_field(anh1_gray)
-    features2 = trich_ridge_orientation_field(anh2_gray)
+    features = trich_ridge_orientation_field(GoiDacTrungAnh.tu(anh))
+    return MoTaRidge(orientation_field=np.asarray(features['orientation_field']))
+
+
+def so_khop_ridge_mo_ta(mo_ta1, mo_ta2):
+    """
+    So khớp hai descriptor Ridge Orientation đã trích (trich_mo_ta_ridge)
     
-    field1 = np.array(features1['orientation_field'])
-    field2 = np.array(features2['orientation_field'])
+    Returns:
+        dict: Kết quả giống so_khop_ridge_orientation
+    """
+    field1 = mo_ta1['orientation_field']
+    field2 = mo_ta2['orientation_field']
     
     # Đảm bảo cùng kích thước
     min_h = min(field1.shape[0], field2.shape[0])
@@ -455,6 +862,14 @@ def so_khop_ridge_orientation(anh1, anh2):
     field1 = field1[:min_h, :min_w]
     field2 = field2[:min_h, :min_w]
     
+    # Ảnh nhỏ hơn một khối không có hướng nào để so
+    if field1.size == 0:
+        return {
+            'method': 'Ridge Orientation',
+            'similarity_score': 0.0,
+            'mean_orientation_diff': 90.0
+        }
+    
     # Tính sự khác biệt góc (0-90 độ)
     angle_diff = np.abs(field1 - field2)
     angle_diff = np.minimum(angle_diff, 180 - angle_diff)
@@ -479,10 +894,10 @@ def so_khop_ridge_orientation(anh1, anh2):
     }
 
 
-def so_khop_frequency_domain(anh1, anh2):
+def so_khop_ridge_orientation(anh1, anh2):
     """
-    So khớp sử dụng Frequency Domain Analysis
-    So sánh các đặc trưng tần số
+    So khớp sử dụng Ridge Orientation Field
+    So sánh hướng của các sọc vân tay
     
     Args:
         anh1 (np.ndarray): Ảnh 1
@@ -491,22 +906,36 @@ def so_khop_frequency_domain(anh1, anh2):
     Returns:
         dict: Kết quả so khớp
     """
-    from trich_dac_trung.trich_dac_trung_chi_tiet import trich_frequency_domain_features
-    
-    # Convert to grayscale if needed
-    if len(anh1.shape) == 3:
-        anh1_gray = cv2.cvtColor(anh1, cv2.COLOR_BGR2GRAY)
-    else:
-        anh1_gray = anh1
+    return so_khop_ridge_mo_ta(trich_mo_ta_ridge(anh1), trich_mo_ta_ridge(anh2))
+
+
+def trich_mo_ta_tan_so(anh):
+    """
+    Trích descriptor tần số của một ảnh
     
-    if len(anh2.shape) == 3:
-        anh2_gray = cv2.cvtColor(anh2, cv2.COLOR_BGR2GRAY)
-    else:
-        anh2_gray = anh2
+    Args:
+        anh (np.ndarray | GoiDacTrungAnh): Ảnh vân tay
+        
+    Returns:
+        MoTaTanSo: dominant_frequency, energy_concentration, ridge_frequency
+    """
+    from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh, trich_frequency_domain_features
     
-    features1 = trich_frequency_domain_features(anh1_gray)
-    features2 = trich_frequency_domain_features(anh2_gray)
+    features = trich_frequency_domain_features(GoiDacTrungAnh.tu(anh))
+    return MoTaTanSo(
+        dominant_frequency=features['dominant_frequency'],
+        energy_concentration=features['energy_concentration'],
+        ridge_frequency=features['ridge_frequency']
+    )
+
+
+def so_khop_tan_so_mo_ta(features1, features2):
+    """
+    So khớp hai descriptor tần số đã trích (trich_mo_ta_tan_so)
     
+    Returns:
+        dict: Kết quả giống so_khop_frequency_domain
+    """
     # So sánh các đặc trưng tần số
     freq_diff = abs(features1['dominant_frequency'] - features2['dominant_frequency'])
     energy_diff = abs(features1['energy_concentration'] - features2['energy_concentration'])
@@ -535,4 +964,213 @@ def so_khop_frequency_domain(anh1, anh2):
         'ridge_similarity': ridge_similarity,
         'dominant_freq_1': features1['dominant_frequency'],
         'dominant_freq_2': features2['dominant_frequency']
-    }
\ No newline at end of file
+    }
+
+
+def so_khop_frequency_domain(anh1, anh2):
+    """
+    So khớp sử dụng Frequency Domain Analysis
+    So sánh các đặc trưng tần số
+    
+    Args:
+        anh1 (np.ndarray): Ảnh 1
+        anh2 (np.ndarray): Ảnh 2
+        
+    Returns:
+        dict: Kết quả so khớp
+    """
+    return so_khop_tan_so_mo_ta(trich_mo_ta_tan_so(anh1), trich_mo_ta_tan_so(anh2))
+
+
+# ============================================================================
+# LƯU TRỮ DESCRIPTOR
+# ============================================================================
+
+
+def ma_hoa_mo_ta(mo_ta):
+    """
+    Mã hóa descriptor (dict gồm số, chuỗi và mảng NumPy) thành bytes để lưu database
+    Định dạng: 4 byte độ dài header + header JSON + dữ liệu thô của các mảng
+    
+    Args:
+        mo_ta: Descriptor từ các hàm trich_mo_ta_* (hoặc dict tương ứng)
+        
+    Returns:
+        bytes: Dữ liệu đã mã hóa
+    """
+    header = {'gia_tri': {}, 'mang': {}}
+    du_lieu = []
+    vi_tri = 0
+    for khoa, gia_tri in mo_ta.items():
+        if isinstance(gia_tri, np.ndarray):
+            mang = np.ascontiguousarray(gia_tri)
+            # Descriptor SIFT là số nguyên 0-255 lưu ở float32: lưu uint8 không mất mát
+            kieu_goc = None
+            if (mang.dtype == np.float32 and mang.size and mang.min() >= 0 and
+                    mang.max() <= 255 and np.array_equal(mang, np.round(mang))):
+                kieu_goc, mang = mang.dtype.str, mang.astype(np.uint8)
+            header['mang'][khoa] = [mang.dtype.str, list(mang.shape), vi_tri, kieu_goc]
+            du_lieu.append(mang.tobytes())
+            vi_tri += mang.nbytes
+        else:
+            if isinstance(gia_tri, np.generic):
+                gia_tri = gia_tri.item()
+            header['gia_tri'][khoa] = gia_tri
+    
+    header_bytes = json.dumps(header).encode('utf-8')
+    return len(header_bytes).to_bytes(4, 'little') + header_bytes + b''.join(du_lieu)
+
+
+def giai_ma_mo_ta(du_lieu):
+    """
+    Giải mã descriptor đã mã hóa bằng ma_hoa_mo_ta
+    Mảng được đọc trực tiếp từ bộ đệm bằng np.frombuffer (không sao chép)
+    
+    Args:
+        du_lieu (bytes): Dữ liệu đã mã hóa
+        
+    Returns:
+        dict: Descriptor, None nếu không có dữ liệu
+    """
+    if not du_lieu:
+        return None
+    
+    du_lieu = memoryview(du_lieu)
+    do_dai = int.from_bytes(du_lieu[:4], 'little')
+    header = json.loads(bytes(du_lieu[4:4 + do_dai]).decode('utf-8'))
+    bat_dau = 4 + do_dai
+    
+    mo_ta = dict(header['gia_tri'])
+    for khoa, (kieu, shape, vi_tri, kieu_goc) in header['mang'].items():
+        dtype = np.dtype(kieu)
+        so_phan_tu = int(np.prod(shape))
+        mang = np.frombuffer(du_lieu, dtype=dtype, count=so_phan_tu,
+                             offset=bat_dau + vi_tri).reshape(shape)
+        mo_ta[khoa] = mang.astype(kieu_goc) if kieu_goc else mang
+    return mo_ta
+
+
+# ============================================================================
+# DESCRIPTOR HAI GIAI ĐOẠN: extract(anh) -> descriptor, compare(d1, d2) -> kết quả
+# ============================================================================
+
+
+class _MoTa:
+    """
+    Lớp cơ sở của descriptor: giữ vài mảng NumPy/số, đọc được như dict chỉ đọc
+    (mo_ta['khoa']) nên các hàm so_khop_*_mo_ta nhận cả descriptor lẫn dict
+    """
+
+    __slots__ = ()
+
+    def __init__(self, **gia_tri):
+        for khoa in self.__slots__:
+            setattr(self, khoa, gia_tri[khoa])
+
+    def __getitem__(self, khoa):
+        return getattr(self, khoa)
+
+    def items(self):
+        return [(khoa, getattr(self, khoa)) for khoa in self.__slots__]
+
+    @property
+    def nbytes(self):
+        """Tổng dung lượng các mảng NumPy của descriptor"""
+        return sum(gia_tri.nbytes for _, gia_tri in self.items() if isinstance(gia_tri, np.ndarray))
+
+    def to_bytes(self):
+        """Mã hóa descriptor để lưu database"""
+        return ma_hoa_mo_ta(self)
+
+    @classmethod
+    def from_bytes(cls, du_lieu):
+        """Giải mã descriptor đã lưu (None nếu không có dữ liệu)"""
+        mo_ta = giai_ma_mo_ta(du_lieu)
+        return cls(**mo_ta) if mo_ta is not None else None
+
+    @classmethod
+    def from_dict(cls, mo_ta):
+        """Tạo descriptor từ dict có đủ khóa"""
+        return cls(**{khoa: mo_ta[khoa] for khoa in cls.__slots__})
+
+
+class MoTaLBP(_MoTa):
+    """Descriptor LBP: histogram float32 và độ đồng nhất kết cấu"""
+
+    __slots__ = ('lbp_histogram', 'texture_uniformity', 'lbp_method')
+
+    @staticmethod
+    def extract(anh, method='default'):
+        return trich_mo_ta_lbp(anh, method)
+
+    @staticmethod
+    def compare(mo_ta1, mo_ta2):
+        return so_khop_lbp_mo_ta(mo_ta1, mo_ta2)
+
+
+class MoTaRidge(_MoTa):
+    """Descriptor Ridge Orientation: trường hướng theo khối"""
+
+    __slots__ = ('orientation_field',)
+
+    @staticmethod
+    def extract(anh):
+        return trich_mo_ta_ridge(anh)
+
+    @staticmethod
+    def compare(mo_ta1, mo_ta2):
+        return so_khop_ridge_mo_ta(mo_ta1, mo_ta2)
+
+
+class MoTaTanSo(_MoTa):
+    """Descriptor tần số: ba đặc trưng phổ toàn cục"""
+
+    __slots__ = ('dominant_frequency', 'energy_concentration', 'ridge_frequency')
+
+    @staticmethod
+    def extract(anh):
+        return trich_mo_ta_tan_so(anh)
+
+    @staticmethod
+    def compare(mo_ta1, mo_ta2):
+        return so_khop_tan_so_mo_ta(mo_ta1, mo_ta2)
+
+
+class MoTaSiftOrb(_MoTa):
+    """Descriptor SIFT/ORB: số keypoint và ma trận descriptor"""
+
+    __slots__ = ('use_sift', 'so_keypoint', 'descriptors')
+
+    @staticmethod
+    def extract(anh, use_sift=True):
+        return trich_mo_ta_sift_orb(anh, use_sift)
+
+    @staticmethod
+    def compare(mo_ta1, mo_ta2):
+        return so_khop_sift_orb_mo_ta(mo_ta1, mo_ta2)
+
+
+# Phương pháp so khớp dựa trên ảnh -> lớp descriptor
+MO_TA_THEO_PHUONG_PHAP = {
+    'feature': MoTaSiftOrb,
+    'lbp': MoTaLBP,
+    'ridge': MoTaRidge,
+    'frequency': MoTaTanSo
+}
+
+
+def trich_tat_ca_mo_ta(anh):
+    """
+    Trích descriptor của mọi phương pháp dựa trên ảnh
+
+    Args:
+        anh (np.ndarray | GoiDacTrungAnh): Ảnh vân tay
+
+    Returns:
+        dict: Phương pháp ('feature', 'lbp', 'ridge', 'frequency') -> descriptor
+    """
+    from trich_dac_trung.trich_dac_trung_chi_tiet import GoiDacTrungAnh
+    
+    # Các phương pháp dùng chung ảnh xám/chuẩn hóa/gradient/FFT của một gói
+    goi = GoiDacTrungAnh.tu(anh)
+    return {phuong_phap: lop.extract(goi) for phuong_phap, lop in MO_TA_THEO_PHUONG_PHAP.items()}
@@ -4,6 +4,8 @@ Module tăng cường ảnh bằng Gabor Filter
 
 import cv2
 import numpy as np
+from functools import lru_cache
+from scipy import fft as sp_fft
 
 
 def tao_gabor_kernel(kernel_size=21, lambda_=10, gamma=0.5, psi=0, sigma=3, theta=0):
@@ -21,22 +23,18 @@ def tao_gabor_kernel(kernel_size=21, lambda_=10, gamma=0.5, psi=0, sigma=3, thet
     Returns:
         np.ndarray: Kernel Gabor
     """
-    kernel = np.zeros((kernel_size, kernel_size))
+    # Tọa độ tâm: px theo cột (x), py theo hàng (y)
+    toa_do = np.arange(kernel_size) - kernel_size // 2
+    px, py = np.meshgrid(toa_do, toa_do)
     
-    for x in range(kernel_size):
-        for y in range(kernel_size):
-            # Chuyển đổi sang tọa độ tâm
-            px = x - kernel_size // 2
-            py = y - kernel_size // 2
-            
-            # Xoay tọa độ
-            x_prime = px * np.cos(theta) + py * np.sin(theta)
-            y_prime = -px * np.sin(theta) + py * np.cos(theta)
-            
-            # Gabor function
-            gauss = np.exp(-(x_prime**2 + gamma**2 * y_prime**2) / (2 * sigma**2))
-            sinusoid = np.cos(2 * np.pi * x_prime / lambda_ + psi)
-            kernel[y, x] = gauss * sinusoid
+    # Xoay tọa độ
+    x_prime = px * np.cos(theta) + py * np.sin(theta)
+    y_prime = -px * np.sin(theta) + py * np.cos(theta)
+    
+    # Gabor function
+    gauss = np.exp(-(x_prime**2 + gamma**2 * y_prime**2) / (2 * sigma**2))
+    sinusoid = np.cos(2 * np.pi * x_prime / lambda_ + psi)
+    kernel = gauss * sinusoid
     
     # Chuẩn hóa kernel
     kernel = kernel / np.sum(np.abs(kernel))
@@ -44,7 +42,69 @@ def tao_gabor_kernel(kernel_size=21, lambda_=10, gamma=0.5, psi=0, sigma=3, thet
     return kernel
 
 
-def ap_dung_gabor_filter(anh_xam, kernel_size=21, num_orientations=6):
+class BoLocGabor:
+    """
+    Bộ lọc Gabor nhiều hướng, kernel được tạo một lần khi khởi tạo
+    Dùng lay_bo_loc_gabor() để lấy bản dùng chung trong toàn tiến trình
+    """
+    
+    def __init__(self, kernel_size=21, lambda_=10, gamma=0.5, psi=0, sigma=3, num_orientations=6):
+        """
+        Khởi tạo bộ lọc
+        
+        Args:
+            kernel_size (int): Kích thước kernel
+            lambda_ (float): Bước sóng của sóng sin
+            gamma (float): Tỷ lệ co dãn không gian
+            psi (float): Độ dốc pha
+            sigma (float): Độ lệch chuẩn của Gaussian
+            num_orientations (int): Số hướng để lọc
+        """
+        self.kernel_size = kernel_size
+        self.num_orientations = num_orientations
+        self.kernels = []
+        
+        for i in range(num_orientations):
+            theta = (i * np.pi) / num_orientations
+            kernel = tao_gabor_kernel(kernel_size, lambda_, gamma, psi, sigma, theta)
+            kernel.setflags(write=False)
+            self.kernels.append(kernel)
+    
+    def ap_dung(self, anh_xam):
+        """
+        Lọc ảnh với tất cả các hướng và lấy max response
+        Dùng một bộ đệm float32 cho kết quả và một bộ đệm cho từng lần lọc
+        
+        Args:
+            anh_xam (np.ndarray): Ảnh xám đầu vào
+            
+        Returns:
+            np.ndarray: Max response (float32)
+        """
+        anh_float = anh_xam.astype(np.float32)
+        anh_tang_cuong = np.zeros_like(anh_float)
+        filtered = np.empty_like(anh_float)
+        
+        for kernel in self.kernels:
+            cv2.filter2D(anh_float, -1, kernel, dst=filtered)
+            np.abs(filtered, out=filtered)
+            np.maximum(anh_tang_cuong, filtered, out=anh_tang_cuong)
+        
+        return anh_tang_cuong
+
+
+@lru_cache(maxsize=64)
+def lay_bo_loc_gabor(kernel_size=21, lambda_=10, gamma=0.5, psi=0, sigma=3, num_orientations=6):
+    """
+    Lấy bộ lọc Gabor dùng chung, chỉ tạo kernel ở lần gọi đầu với mỗi bộ tham số
+    
+    Returns:
+        BoLocGabor: Bộ lọc đã tạo sẵn kernel
+    """
+    return BoLocGabor(kernel_size, lambda_, gamma, psi, sigma, num_orientations)
+
+
+def ap_dung_gabor_filter(anh_xam, kernel_size=21, num_orientations=6, che_do='toan_anh'):
     """
     Áp dụng Gabor filter với nhiều hướng khác nhau
     
@@ -52,22 +112,21 @@ def ap_dung_gabor_filter(anh_xam, kernel_size=21, num_orientations=6):
         anh_xam (np.ndarray): Ảnh xám đầu vào
         kernel_size (int): Kích thước kernel
         num_orientations (int): Số hướng để lọc
+        che_do (str): 'toan_anh' - lọc cả ảnh ở mọi hướng, lấy max response;
+            'theo_huong' - mỗi khối chỉ lọc bằng kernel theo hướng và tần số vân
+            cục bộ, bỏ qua khối nền (xem tang_cuong_gabor_theo_huong;
+            num_orientations không dùng)
         
     Returns:
         np.ndarray: Ảnh được tăng cường
     """
-    anh_tang_cuong = np.zeros_like(anh_xam, dtype=np.float32)
+    if che_do == 'theo_huong':
+        return tang_cuong_gabor_theo_huong(anh_xam, kernel_size=kernel_size)
+    if che_do != 'toan_anh':
+        raise ValueError(f"Chế độ Gabor không hợp lệ: {che_do}")
     
-    # Tạo Gabor filter cho các hướng khác nhau
-    for i in range(num_orientations):
-        theta = (i * np.pi) / num_orientations
-        kernel = tao_gabor_kernel(kernel_size=kernel_size, theta=theta)
-        
-        # Áp dụng filter
-        filtered = cv2.filter2D(anh_xam.astype(np.float32), -1, kernel)
-        
-        # Lấy max response
-        anh_tang_cuong = np.maximum(anh_tang_cuong, np.abs(filtered))
+    bo_loc = lay_bo_loc_gabor(kernel_size=kernel_size, num_orientations=num_orientations)
+    anh_tang_cuong = bo_loc.ap_dung(anh_xam)
     
     # Chuẩn hóa về [0, 255]
     anh_tang_cuong = np.uint8(255 * anh_tang_cuong / np.max(anh_tang_cuong + 1e-8))
@@ -75,6 +134,158 @@ def ap_dung_gabor_filter(anh_xam, kernel_size=21, num_orientations=6):
     return anh_tang_cuong
 
 
+@lru_cache(maxsize=8)
+def _pho_kernel_theo_huong(kernel_size, kich_thuoc_vung, num_orientations, buoc_song_min, buoc_song_max):
+    """
+    Phổ (liên hợp) của mọi kernel Gabor theo bước sóng nguyên và hướng, trên
+    vùng kich_thuoc_vung; tạo một lần cho mỗi bộ tham số
+    
+    Kernel được trừ trung bình (không phụ thuộc độ sáng) và đặt tâm tại gốc
+    nên tương quan vòng trên vùng cho đúng kết quả ở phần giữa.
+    
+    Returns:
+        np.ndarray: complex64, shape (số bước sóng, num_orientations, vùng, vùng // 2 + 1)
+    """
+    le = kernel_size // 2
+    pho = []
+    for lambda_ in range(buoc_song_min, buoc_song_max + 1):
+        bo_loc = lay_bo_loc_gabor(kernel_size=kernel_size, lambda_=lambda_,
+                                  num_orientations=num_orientations)
+        kernel_dem = np.zeros((num_orientations, kich_thuoc_vung, kich_thuoc_vung))
+        kernel_dem[:, :kernel_size, :kernel_size] = [k - k.mean() for k in bo_loc.kernels]
+        kernel_dem = np.roll(kernel_dem, (-le, -le), axis=(1, 2))
+        pho.append(np.conj(sp_fft.rfft2(kernel_dem)))
+    pho = np.asarray(pho, dtype=np.complex64)
+    pho.setflags(write=False)
+    return pho
+
+
+def tang_cuong_gabor_theo_huong(anh_xam, block_size=16, kernel_size=21,
+                                num_orientations=16, so_luong=4, nguong_nen=0.3,
+                                buoc_song_min=4, buoc_song_max=20, sigma_lam_tron=1.0):
+    """
+    Tăng cường Gabor theo ngữ cảnh: mỗi khối chỉ được lọc bằng một kernel
+    khớp với hướng và bước sóng vân cục bộ của khối đó, thay vì lọc cả ảnh ở
+    nhiều hướng (ap_dung_gabor_filter)
+    
+    Mỗi khối được lọc trên vùng có viền kernel_size // 2 bằng nhân phổ FFT,
+    tính theo lô cho nhiều khối một lúc. Hướng và bước sóng lấy từ chính phổ
+    đó nên mỗi khối chỉ cần một FFT thuận và một FFT ngược: hướng theo công
+    thức hiệp phương sai gradient của trich_ridge_orientation_field (Gxx, Gyy,
+    Gxy tính từ phổ công suất trong dải bước sóng vân, theo định lý Parseval),
+    bước sóng theo đỉnh phổ (buoc_song_tu_pho); cả hai được làm trơn giữa các
+    khối vân lân cận để kernel không đổi hướng đột ngột ở biên khối. Khối nền
+    (độ lệch chuẩn đã làm trơn nhỏ hơn nguong_nen x phân vị 99 của các khối)
+    không được lọc.
+    
+    Args:
+        anh_xam (np.ndarray): Ảnh xám đầu vào
+        block_size (int): Kích thước khối
+        kernel_size (int): Kích thước kernel
+        num_orientations (int): Số mức lượng tử hóa hướng
+        so_luong (int): Số luồng xử lý song song
+        nguong_nen (float): Ngưỡng độ tương phản của khối nền (0 = lọc mọi khối)
+        buoc_song_min (int): Bước sóng vân nhỏ nhất
+        buoc_song_max (int): Bước sóng vân lớn nhất
+        sigma_lam_tron (float): Độ lệch chuẩn (tính bằng khối) khi làm trơn
+            độ tương phản, hướng và bước sóng (0 = không làm trơn)
+        
+    Returns:
+        np.ndarray: Ảnh được tăng cường, uint8 giữ dấu đáp ứng: vân (đáp ứng âm)
+        < 128, rãnh và khối nền (đáp ứng >= 0) >= 128; nhị phân hóa bằng
+        nhi_phan_hoa_theo_dau thay cho Otsu
+    """
+    from trich_dac_trung.trich_dac_trung_chi_tiet import buoc_song_tu_pho
+    
+    h, w = anh_xam.shape
+    
+    # Mở rộng ảnh thành bội số của block_size để mọi pixel thuộc một khối
+    anh = cv2.copyMakeBorder(anh_xam, 0, (-h) % block_size, 0, (-w) % block_size,
+                             cv2.BORDER_REFLECT).astype(np.float32)
+    so_khoi_h, so_khoi_w = anh.shape[0] // block_size, anh.shape[1] // block_size
+    
+    if so_khoi_h == 0 or so_khoi_w == 0:
+        return ap_dung_gabor_filter(anh_xam, kernel_size=kernel_size)
+    
+    def lam_tron(x):
+        if sigma_lam_tron <= 0:
+            return x
+        return cv2.GaussianBlur(x, (0, 0), sigma_lam_tron, borderType=cv2.BORDER_REPLICATE)
+    
+    # Khối có vân: độ lệch chuẩn (làm trơn để vân giấy/bụi lẻ ở nền không bị
+    # tính) đủ lớn so với các khối tương phản cao nhất
+    do_lech = lam_tron(anh.reshape(so_khoi_h, block_size, so_khoi_w, block_size).std(axis=(1, 3)))
+    co_van = do_lech >= nguong_nen * np.percentile(do_lech, 99)
+    if not np.any(co_van):
+        co_van[:] = True
+    
+    le = kernel_size // 2
+    kich_thuoc_vung = block_size + 2 * le
+    pho_kernel = _pho_kernel_theo_huong(kernel_size, kich_thuoc_vung, num_orientations,
+                                        buoc_song_min, buoc_song_max)
+    
+    # Trọng số (fx², fy², fx·fy) của các điểm phổ trong dải bước sóng vân
+    fy, fx = np.meshgrid(np.fft.fftfreq(kich_thuoc_vung), np.fft.rfftfreq(kich_thuoc_vung),
+                         indexing='ij')
+    tan_so = np.hypot(fy, fx)
+    dai = ((tan_so >= 1.0 / buoc_song_max) & (tan_so <= 1.0 / buoc_song_min)).ravel()
+    trong_so = np.stack([(fx * fx).ravel()[dai], (fy * fy).ravel()[dai],
+                         (fx * fy).ravel()[dai]], axis=1).astype(np.float32)
+    
+    vung = np.lib.stride_tricks.sliding_window_view(
+        cv2.copyMakeBorder(anh, le, le, le, le, cv2.BORDER_REFLECT),
+        (kich_thuoc_vung, kich_thuoc_vung)
+    )[::block_size, ::block_size]
+    khoi_i, khoi_j = np.nonzero(co_van)
+    
+    # Lượt 1: phổ từng khối (theo nhóm để FFT theo lô chia cho so_luong luồng),
+    # hướng dạng góc kép (cos 2θ, sin 2θ) nhân độ nhất quán và bước sóng
+    nhom = [slice(dau, dau + 4096) for dau in range(0, len(khoi_i), 4096)]
+    pho_nhom = []
+    huong_kep = np.zeros((2, so_khoi_h, so_khoi_w), dtype=np.float32)
+    buoc_song = np.zeros((so_khoi_h, so_khoi_w), dtype=np.float32)
+    for s in nhom:
+        i, j = khoi_i[s], khoi_j[s]
+        pho = sp_fft.rfft2(vung[i, j], workers=so_luong)
+        pho_nhom.append(pho)
+        
+        cong_suat = np.abs(pho.reshape(len(i), -1)[:, dai]) ** 2
+        gxx, gyy, gxy = (cong_suat @ trong_so).T
+        tong = np.maximum(gxx + gyy, 1e-10)
+        huong_kep[0, i, j] = (gxx - gyy) / tong
+        huong_kep[1, i, j] = 2 * gxy / tong
+        buoc_song[i, j], _ = buoc_song_tu_pho(pho, kich_thuoc_vung, buoc_song_min, buoc_song_max)
+    
+    # Làm trơn giữa các khối vân (khối nền không tham gia)
+    if sigma_lam_tron > 0:
+        mat_na = co_van.astype(np.float32)
+        trong_so_khoi = np.maximum(lam_tron(mat_na), 1e-6)
+        huong_kep = np.stack([lam_tron(x * mat_na) for x in huong_kep])
+        buoc_song = lam_tron(buoc_song * mat_na) / trong_so_khoi
+    
+    huong = np.degrees(0.5 * np.arctan2(huong_kep[1], huong_kep[0])) % 180
+    chi_so_huong = np.rint(huong / 180.0 * num_orientations).astype(int) % num_orientations
+    chi_so_buoc_song = (np.clip(np.rint(buoc_song).astype(int), buoc_song_min, buoc_song_max)
+                        - buoc_song_min)
+    
+    # Lượt 2: nhân phổ kernel của khối, FFT ngược chỉ cho các hàng giữa vùng
+    # (phần viền bị bỏ)
+    ket_qua = np.zeros((so_khoi_h, so_khoi_w, block_size, block_size), dtype=np.float32)
+    for s, pho in zip(nhom, pho_nhom):
+        i, j = khoi_i[s], khoi_j[s]
+        pho *= pho_kernel[chi_so_buoc_song[i, j], chi_so_huong[i, j]]
+        loc = sp_fft.ifft(pho, axis=1, workers=so_luong)[:, le:le + block_size]
+        loc = sp_fft.irfft(loc, n=kich_thuoc_vung, axis=2, workers=so_luong)
+        ket_qua[i, j] = loc[:, :, le:le + block_size]
+    
+    ket_qua = ket_qua.transpose(0, 2, 1, 3).reshape(anh.shape)[:h, :w]
+    
+    # Chuẩn hóa về [0, 255] theo biên độ (phân vị 99 để đáp ứng rất mạnh ở mép
+    # vân tay không lấn át các vân), giữ dấu cho bước nhị phân hóa: 0 -> 128
+    bien_do = np.percentile(np.abs(ket_qua[ket_qua != 0]), 99) if np.any(ket_qua) else 1.0
+    return np.uint8(np.clip(np.rint(127.5 + 127.5 * ket_qua / bien_do), 0, 255))
+
+
 def tang_cuong_anh_histogram(anh_xam):
     """
     Tăng cường ảnh bằng histogram equalization
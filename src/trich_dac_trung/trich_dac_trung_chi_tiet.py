@@ -3,8 +3,11 @@ Module trích chọn đặc trưng chi tiết
 Bao gồm: Minutiae, LBP, Ridge Orientation, Frequency Domain
 """
 
+import threading
+
 import numpy as np
 import cv2
+from functools import lru_cache
 from scipy import ndimage
 
 
@@ -48,10 +51,116 @@ def tinh_crossing_number(anh_manh, i, j):
     return cn
 
 
+# Thứ tự 8 lân cận theo vòng tròn: P2 (trên), P3, P4 (phải), P5, P6 (dưới), P7, P8 (trái), P9
+# Mỗi phần tử là độ dời (di, dj) so với pixel trung tâm, bit k của mã lân cận ứng với phần tử k
+_LAN_CAN_VONG_TRON = [(-1, 0), (-1, 1), (0, 1), (1, 1), (1, 0), (1, -1), (0, -1), (-1, -1)]
+
+
+def _tao_bang_tra_crossing_number():
+    """
+    Tạo bảng tra 256 phần tử cho mọi cấu hình 8 lân cận
+
+    Returns:
+        tuple: (bảng Crossing Number, bảng số lân cận tiền cảnh)
+    """
+    ma = np.arange(256)
+    bits = (ma[:, None] >> np.arange(8)) & 1
+    bang_cn = np.sum(np.abs(np.roll(bits, -1, axis=1) - bits), axis=1) // 2
+    bang_so_lan_can = np.sum(bits, axis=1)
+    return bang_cn.astype(np.uint8), bang_so_lan_can.astype(np.uint8)
+
+
+_BANG_CN, _BANG_SO_LAN_CAN = _tao_bang_tra_crossing_number()
+
+
+def tinh_ma_lan_can(anh_manh):
+    """
+    Tính mã 8 bit của 8 lân cận cho toàn bộ pixel bên trong ảnh cùng lúc
+
+    Args:
+        anh_manh (np.ndarray): Ảnh làm mảnh nhị phân
+
+    Returns:
+        tuple: (mã lân cận (h-2, w-2) uint8, mặt nạ tiền cảnh (h-2, w-2))
+    """
+    tien_canh = anh_manh > 100
+    h, w = tien_canh.shape
+    ma = np.zeros((h - 2, w - 2), dtype=np.uint8)
+
+    for k, (di, dj) in enumerate(_LAN_CAN_VONG_TRON):
+        lan_can = tien_canh[1 + di:h - 1 + di, 1 + dj:w - 1 + dj]
+        ma |= lan_can.astype(np.uint8) << k
+
+    return ma, tien_canh[1:h - 1, 1:w - 1]
+
+
+def _lay_toa_do(mat_na):
+    """Chuyển mặt nạ vùng trong thành danh sách tọa độ (i, j) của ảnh gốc"""
+    hang, cot = np.nonzero(mat_na)
+    return list(zip((hang + 1).tolist(), (cot + 1).tolist()))
+
+
 def phan_loai_minutiae(anh_manh):
     """
     Phân loại các điểm minutiae thành ending và bifurcation
     Cải tiến: Crossing Number + Neighbor count method
+    Tính đồng thời cho toàn ảnh bằng bảng tra 256 cấu hình lân cận
+    
+    Args:
+        anh_manh (np.ndarray): Ảnh làm mảnh nhị phân
+        
+    Returns:
+        tuple: (danh sách ending, danh sách bifurcation)
+    """
+    endings = []
+    bifurcations = []
+    
+    h, w = anh_manh.shape
+    
+    # Debug: Đếm số điểm foreground
+    foreground_count = np.sum(anh_manh > 100)
+    print(f"[DEBUG] Tổng điểm foreground: {foreground_count}")
+    
+    if h < 3 or w < 3:
+        return endings, bifurcations
+    
+    ma, tien_canh = tinh_ma_lan_can(anh_manh)
+    
+    # Phương pháp 1: Crossing Number (CN)
+    print(f"[DEBUG] Đang phân tích bằng Crossing Number...")
+    cn = _BANG_CN[ma]
+    cn_endings = _lay_toa_do(tien_canh & (cn == 1))
+    cn_bifurcations = _lay_toa_do(tien_canh & ((cn == 3) | (cn == 5)))
+    
+    print(f"[DEBUG] CN: Ending={len(cn_endings)}, Bifurcation={len(cn_bifurcations)}")
+    
+    # Phương pháp 2: Đếm hàng xóm (Alternative)
+    print(f"[DEBUG] Đang phân tích bằng Neighbor Count...")
+    neighbor_count = _BANG_SO_LAN_CAN[ma]
+    neighbor_endings = _lay_toa_do(tien_canh & (neighbor_count == 1))
+    neighbor_bifurcations = _lay_toa_do(tien_canh & (neighbor_count >= 3) & (neighbor_count <= 4))
+    
+    print(f"[DEBUG] Neighbor: Ending={len(neighbor_endings)}, Bifurcation={len(neighbor_bifurcations)}")
+    
+    # Chọn phương pháp tốt hơn
+    if len(cn_endings) + len(cn_bifurcations) > 0:
+        endings = cn_endings
+        bifurcations = cn_bifurcations
+        print(f"[DEBUG] Sử dụng kết quả Crossing Number")
+    elif len(neighbor_endings) + len(neighbor_bifurcations) > 0:
+        endings = neighbor_endings
+        bifurcations = neighbor_bifurcations
+        print(f"[DEBUG] Sử dụng kết quả Neighbor Count (CN không có kết quả)")
+    
+    print(f"[DEBUG] Final: Ending={len(endings)}, Bifurcation={len(bifurcations)}")
+    
+    return endings, bifurcations
+
+
+def phan_loai_minutiae_tung_pixel(anh_manh):
+    """
+    Phân loại minutiae bằng cách duyệt từng pixel (bản gốc, chậm)
+    Giữ lại làm chuẩn đối chiếu cho phan_loai_minutiae
     
     Args:
         anh_manh (np.ndarray): Ảnh làm mảnh nhị phân
@@ -218,17 +327,23 @@ def loc_nhieu_minutiae(endings, bifurcations, min_distance=2):
             return []
         
         points = sorted(points)
-        filtered = [points[0]]
+        if min_dist <= 0:
+            return points
         
-        for point in points[1:]:
-            # Tính khoảng cách với tất cả điểm đã chọn
-            min_dist_to_selected = min(
-                np.sqrt((point[0] - p[0])**2 + (point[1] - p[1])**2)
-                for p in filtered
+        # Lưới ô cạnh min_dist: điểm đã chọn gần hơn min_dist chỉ có thể nằm
+        # trong 3x3 ô quanh điểm đang xét (thay vì so với mọi điểm đã chọn)
+        filtered = []
+        luoi = {}
+        for point in points:
+            o = (int(point[0] // min_dist), int(point[1] // min_dist))
+            qua_gan = any(
+                (point[0] - p[0])**2 + (point[1] - p[1])**2 < min_dist**2
+                for di in (-1, 0, 1) for dj in (-1, 0, 1)
+                for p in luoi.get((o[0] + di, o[1] + dj), ())
             )
-            
-            if min_dist_to_selected >= min_dist:
+            if not qua_gan:
                 filtered.append(point)
+                luoi.setdefault(o, []).append(point)
         
         return filtered
     
@@ -238,13 +353,225 @@ def loc_nhieu_minutiae(endings, bifurcations, min_distance=2):
     return endings_filtered, bifurcations_filtered
 
 
+class GoiDacTrungAnh:
+    """
+    Các đại lượng trung gian của một ảnh dùng chung cho mọi phương pháp trích
+    (ảnh xám, ảnh chuẩn hóa 0-255, gradient theo khối, phổ biên độ FFT)
+    
+    Mỗi đại lượng chỉ tính ở lần đầu được dùng. Các hàm trich_lbp_features,
+    trich_ridge_orientation_field, trich_frequency_domain_features nhận ảnh
+    hoặc GoiDacTrungAnh, nên so khớp nhiều phương pháp trên cùng một ảnh chỉ
+    chuẩn hóa/biến đổi ảnh đó một lần. Gói dùng được từ nhiều luồng cùng lúc.
+    """
+    
+    def __init__(self, anh):
+        """
+        Args:
+            anh (np.ndarray): Ảnh vân tay (xám hoặc BGR)
+        """
+        self.anh = anh
+        self._bo_nho = {}
+        # RLock vì một đại lượng có thể cần đại lượng khác (FFT cần ảnh chuẩn hóa)
+        self._khoa = threading.RLock()
+    
+    @classmethod
+    def tu(cls, anh):
+        """Trả về chính gói nếu đã là GoiDacTrungAnh, nếu không tạo gói mới"""
+        return anh if isinstance(anh, cls) else cls(anh)
+    
+    def _lay(self, khoa, ham):
+        if khoa not in self._bo_nho:
+            with self._khoa:
+                if khoa not in self._bo_nho:
+                    self._bo_nho[khoa] = ham()
+        return self._bo_nho[khoa]
+    
+    @property
+    def xam(self):
+        """Ảnh xám (ảnh xám giữ nguyên)"""
+        return self._lay('xam', lambda: cv2.cvtColor(self.anh, cv2.COLOR_BGR2GRAY)
+                         if self.anh.ndim == 3 else self.anh)
+    
+    @property
+    def chuan_hoa(self):
+        """Ảnh xám chuẩn hóa min-max về 0-255 (uint8)"""
+        return self._lay('chuan_hoa', lambda: cv2.normalize(
+            self.xam, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8))
+    
+    def gradient_khoi(self, block_size):
+        """
+        Gradient tính riêng trong từng khối block_size x block_size
+        
+        Returns:
+            tuple: (gy, gx) dạng (khối_hàng, hàng, khối_cột, cột)
+        """
+        def tinh():
+            h, w = self.chuan_hoa.shape
+            so_khoi_h, so_khoi_w = h // block_size, w // block_size
+            khoi = self.chuan_hoa[:so_khoi_h * block_size, :so_khoi_w * block_size].astype(float)
+            khoi = khoi.reshape(so_khoi_h, block_size, so_khoi_w, block_size)
+            return tuple(np.gradient(khoi, axis=(1, 3)))
+        return self._lay(('gradient_khoi', block_size), tinh)
+    
+    @property
+    def pho_bien_do(self):
+        """Phổ biên độ FFT đã dịch tâm (fftshift) của ảnh chuẩn hóa"""
+        return self._lay('pho_bien_do', lambda: np.abs(np.fft.fftshift(np.fft.fft2(self.chuan_hoa))))
+
+
+@lru_cache(maxsize=None)
+def _lay_do_doi_lbp(radius, n_points):
+    """
+    Độ dời (dx, dy) của n_points điểm lấy mẫu trên vòng tròn bán kính radius
+    Tính một lần cho mỗi cặp (radius, n_points), cùng công thức với bản gốc
+    """
+    dx = []
+    dy = []
+    for k in range(n_points):
+        angle = 2 * np.pi * k / n_points
+        dx.append(radius * np.cos(angle))
+        dy.append(radius * np.sin(angle))
+    return tuple(dx), tuple(dy)
+
+
+@lru_cache(maxsize=None)
+def _bang_anh_xa_lbp(n_points, method):
+    """
+    Bảng ánh xạ mã LBP -> chỉ số bin histogram cho từng biến thể
+    
+    Args:
+        n_points (int): Số điểm lấy mẫu
+        method (str): 'default' (2^n bin), 'ror' (bất biến xoay),
+            'uniform' (đồng nhất + bất biến xoay, n+2 bin),
+            'nri_uniform' (đồng nhất, không bất biến xoay, n(n-1)+3 bin)
+        
+    Returns:
+        tuple: (bảng ánh xạ, số bin)
+    """
+    so_ma = 2 ** n_points
+    ma = np.arange(so_ma, dtype=np.int64)
+    
+    if method == 'default':
+        return ma, so_ma
+    
+    bits = (ma[:, None] >> np.arange(n_points)) & 1
+    so_chuyen_doi = np.sum(bits != np.roll(bits, -1, axis=1), axis=1)
+    dong_nhat = so_chuyen_doi <= 2
+    
+    if method == 'ror':
+        mat_na = so_ma - 1
+        ma_nho_nhat = ma.copy()
+        for s in range(1, n_points):
+            xoay = ((ma >> s) | (ma << (n_points - s))) & mat_na
+            ma_nho_nhat = np.minimum(ma_nho_nhat, xoay)
+        lop, bang = np.unique(ma_nho_nhat, return_inverse=True)
+        return bang, len(lop)
+    
+    if method == 'uniform':
+        bang = np.where(dong_nhat, np.sum(bits, axis=1), n_points + 1)
+        return bang, n_points + 2
+    
+    if method == 'nri_uniform':
+        so_bin = n_points * (n_points - 1) + 3
+        bang = np.full(so_ma, so_bin - 1, dtype=np.int64)
+        bang[dong_nhat] = np.arange(np.count_nonzero(dong_nhat))
+        return bang, so_bin
+    
+    raise ValueError(f"Phương pháp LBP không hợp lệ: {method}")
+
+
+def tinh_anh_lbp(anh_uint8, radius=1, n_points=8):
+    """
+    Tính mã LBP cho toàn ảnh bằng phép so sánh trên các ảnh dịch chuyển
+    Cho kết quả giống hệt bản duyệt từng pixel (kể cả cách lấy trung bình 2 góc)
+    
+    Args:
+        anh_uint8 (np.ndarray): Ảnh xám uint8
+        radius (int): Bán kính để tính LBP
+        n_points (int): Số điểm xung quanh để tính LBP
+        
+    Returns:
+        np.ndarray: Ảnh mã LBP (viền ngoài bằng 0)
+    """
+    h, w = anh_uint8.shape
+    kieu = np.uint8 if n_points <= 8 else (np.uint16 if n_points <= 16 else np.uint32)
+    lbp_image = np.zeros((h, w), dtype=kieu)
+    
+    if h <= 2 * radius or w <= 2 * radius:
+        return lbp_image
+    
+    hang = np.arange(radius, h - radius)
+    cot = np.arange(radius, w - radius)
+    center = anh_uint8[radius:h - radius, radius:w - radius]
+    ma = np.zeros(center.shape, dtype=kieu)
+    
+    dx, dy = _lay_do_doi_lbp(radius, n_points)
+    
+    for k in range(n_points):
+        # Tọa độ lấy mẫu chỉ phụ thuộc cột (x) hoặc hàng (y) nên tính theo vector 1 chiều
+        x = cot + dx[k]
+        y = hang + dy[k]
+        x1, x2 = np.floor(x).astype(np.intp), np.ceil(x).astype(np.intp)
+        y1, y2 = np.floor(y).astype(np.intp), np.ceil(y).astype(np.intp)
+        
+        hop_le_x = (x1 >= 0) & (x1 < w) & (x2 >= 0) & (x2 < w)
+        hop_le_y = (y1 >= 0) & (y1 < h) & (y2 >= 0) & (y2 < h)
+        x1, x2 = np.clip(x1, 0, w - 1), np.clip(x2, 0, w - 1)
+        y1, y2 = np.clip(y1, 0, h - 1), np.clip(y2, 0, h - 1)
+        
+        # Cộng uint8 (tràn số giống bản gốc) rồi chia 2
+        value = (anh_uint8[y1[:, None], x1[None, :]] + anh_uint8[y2[:, None], x2[None, :]]) / 2
+        bit = (value >= center) & hop_le_y[:, None] & hop_le_x[None, :]
+        ma |= bit.astype(kieu) << k
+    
+    lbp_image[radius:h - radius, radius:w - radius] = ma
+    return lbp_image
 
 
-def trich_lbp_features(anh_input, radius=1, n_points=8):
+def trich_lbp_features(anh_input, radius=1, n_points=8, method='default'):
     """
     Trích chọn đặc trưng sử dụng Local Binary Pattern (LBP)
     Phân tích kết cấu cục bộ của vân tay
     
+    Args:
+        anh_input (np.ndarray | GoiDacTrungAnh): Ảnh vân tay đầu vào
+        radius (int): Bán kính để tính LBP
+        n_points (int): Số điểm xung quanh để tính LBP
+        method (str): Biến thể histogram: 'default', 'ror', 'uniform', 'nri_uniform'
+        
+    Returns:
+        dict: Dictionary chứa LBP histogram và thông tin
+    """
+    # Chuẩn hóa ảnh
+    anh_uint8 = GoiDacTrungAnh.tu(anh_input).chuan_hoa
+    
+    lbp_image = tinh_anh_lbp(anh_uint8, radius, n_points)
+    
+    # Ánh xạ sang bin của biến thể (default giữ nguyên mã)
+    bang, so_bin = _bang_anh_xa_lbp(n_points, method)
+    if method != 'default':
+        lbp_image = bang[lbp_image].astype(np.uint8 if so_bin <= 256 else np.uint32)
+    
+    # Tính histogram của LBP
+    hist = np.bincount(lbp_image.ravel(), minlength=so_bin)
+    hist = hist.astype(np.float32) / hist.sum()  # Normalize
+    
+    features = {
+        'lbp_histogram': hist.tolist(),
+        'lbp_image': lbp_image,
+        'lbp_method': method,
+        'texture_uniformity': np.std(hist),
+        'texture_energy': np.sum(hist**2)
+    }
+    
+    return features
+
+
+def trich_lbp_features_tung_pixel(anh_input, radius=1, n_points=8):
+    """
+    Trích LBP bằng cách duyệt từng pixel (bản gốc, chậm)
+    Giữ lại làm chuẩn đối chiếu cho trich_lbp_features
+    
     Args:
         anh_input (np.ndarray): Ảnh vân tay đầu vào
         radius (int): Bán kính để tính LBP
@@ -300,6 +627,57 @@ def trich_ridge_orientation_field(anh_input, block_size=16):
     """
     Trích chọn đặc trưng sử dụng Ridge Orientation Field
     Phân tích hướng của các sọc vân tay trong từng khối
+    Ảnh được xếp thành mảng 4 chiều (khối_hàng, hàng, khối_cột, cột) để tính
+    gradient của mọi khối trong một lần gọi và cộng Gxx/Gyy/Gxy theo trục
+    
+    Args:
+        anh_input (np.ndarray | GoiDacTrungAnh): Ảnh vân tay đầu vào
+        block_size (int): Kích thước khối để tính hướng
+        
+    Returns:
+        dict: Dictionary chứa orientation field (np.ndarray) và các thống kê
+    """
+    # Chuẩn hóa ảnh
+    goi = GoiDacTrungAnh.tu(anh_input)
+    
+    h, w = goi.chuan_hoa.shape
+    so_khoi_h, so_khoi_w = h // block_size, w // block_size
+    
+    if so_khoi_h == 0 or so_khoi_w == 0:
+        orientation_field = np.zeros((so_khoi_h, so_khoi_w))
+        consistency_values = np.zeros(0)
+    else:
+        # Gradient tính riêng trong từng khối (biên khối dùng sai phân một phía như bản gốc)
+        gy, gx = goi.gradient_khoi(block_size)
+        
+        # Tính hướng từ gradient covariance
+        gxx = np.sum(gx * gx, axis=(1, 3))
+        gyy = np.sum(gy * gy, axis=(1, 3))
+        gxy = np.sum(gx * gy, axis=(1, 3))
+        
+        # Tính hướng
+        orientation_field = np.degrees(0.5 * np.arctan2(2 * gxy, gxx - gyy)) % 180
+        orientation_field[gxx + gyy == 0] = 0
+        
+        consistency_values = (gxy**2 / ((gxx + gyy + 1e-10)**2)).ravel()
+    
+    # Ảnh nhỏ hơn một khối: trường hướng rỗng, các thống kê bằng 0 (không lấy mean của mảng rỗng)
+    co_khoi = orientation_field.size > 0
+    features = {
+        'orientation_field': orientation_field,
+        'field_shape': orientation_field.shape,
+        'mean_orientation': float(np.mean(orientation_field)) if co_khoi else 0.0,
+        'orientation_consistency': float(np.mean(consistency_values)) if co_khoi else 0.0,
+        'consistency_values': consistency_values
+    }
+    
+    return features
+
+
+def trich_ridge_orientation_field_tung_khoi(anh_input, block_size=16):
+    """
+    Trích Ridge Orientation Field bằng cách duyệt từng khối (bản gốc, chậm)
+    Giữ lại làm chuẩn đối chiếu cho trich_ridge_orientation_field
     
     Args:
         anh_input (np.ndarray): Ảnh vân tay đầu vào
@@ -356,22 +734,16 @@ def trich_frequency_domain_features(anh_input):
     Phân tích tần số của vân tay để phát hiện các đặc trưng toàn cục
     
     Args:
-        anh_input (np.ndarray): Ảnh vân tay đầu vào
+        anh_input (np.ndarray | GoiDacTrungAnh): Ảnh vân tay đầu vào
         
     Returns:
         dict: Dictionary chứa đặc trưng tần số
     """
-    # Chuẩn hóa ảnh
-    anh_uint8 = cv2.normalize(anh_input, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-    
-    # Áp dụng FFT
-    f_transform = np.fft.fft2(anh_uint8)
-    f_shift = np.fft.fftshift(f_transform)
-    magnitude_spectrum = np.abs(f_shift)
-    phase_spectrum = np.angle(f_shift)
+    # Áp dụng FFT lên ảnh chuẩn hóa
+    magnitude_spectrum = GoiDacTrungAnh.tu(anh_input).pho_bien_do
     
     # Tính các thống kê
-    h, w = anh_uint8.shape
+    h, w = magnitude_spectrum.shape
     center_h, center_w = h // 2, w // 2
     
     # Tính dominant frequency
@@ -398,3 +770,29 @@ def trich_frequency_domain_features(anh_input):
     }
     
     return features
+
+
+def buoc_song_tu_pho(pho, window_size, buoc_song_min=4, buoc_song_max=20):
+    """
+    Bước sóng vân theo đỉnh phổ (trong dải bước sóng hợp lệ) của các cửa sổ
+    
+    Args:
+        pho (np.ndarray): Phổ rfft2 của các cửa sổ, shape (..., window_size, window_size // 2 + 1)
+        window_size (int): Kích thước cửa sổ
+        buoc_song_min (float): Bước sóng nhỏ nhất được chấp nhận
+        buoc_song_max (float): Bước sóng lớn nhất được chấp nhận
+        
+    Returns:
+        tuple: (bước sóng, biên độ đỉnh phổ) của từng cửa sổ, shape pho.shape[:-2]
+    """
+    # Tần số (chu kỳ/pixel) của từng điểm phổ, chỉ xét dải bước sóng hợp lệ
+    fy = np.fft.fftfreq(window_size)
+    fx = np.fft.rfftfreq(window_size)
+    tan_so = np.hypot(fy[:, None], fx[None, :]).ravel()
+    hop_le = np.flatnonzero((tan_so >= 1.0 / buoc_song_max) & (tan_so <= 1.0 / buoc_song_min))
+    
+    pho = np.abs(pho.reshape(pho.shape[:-2] + (-1,))[..., hop_le])
+    dinh = np.argmax(pho, axis=-1)
+    nang_luong = np.take_along_axis(pho, dinh[..., None], axis=-1)[..., 0]
+    
+    return 1.0 / np.maximum(tan_so[hop_le][dinh], 1e-10), nang_luong
@@ -0,0 +1,441 @@
+#!/usr/bin/env python3
+"""
+Xử lý hàng loạt không cần giao diện - đăng ký / nhận dạng cả thư mục ảnh
+
+Mỗi ảnh đi qua chuẩn hóa → lọc nhiễu → Gabor → Otsu → làm mảnh → minutiae
+(FingerprintPipeline, giống giao diện) trên nhiều tiến trình. Kết quả được in
+ra ngay khi từng ảnh xong, mẫu được ghi vào database theo lô, cuối cùng in
+thống kê tốc độ.
+
+Ví dụ:
+    python src/xu_ly_hang_loat.py dang-ky data/anh_goc --so-tien-trinh 4
+    python src/xu_ly_hang_loat.py dang-ky kho_anh --theo-thu-muc --lo-ghi 200
+    python src/xu_ly_hang_loat.py nhan-dang data/anh_goc --phuong-phap minutiae
+    python src/xu_ly_hang_loat.py dang-ky data/anh_goc --khong-ghi
+    python src/xu_ly_hang_loat.py dang-ky data/anh_goc --ghi-de
+    python src/xu_ly_hang_loat.py chuyen-doi
+    python src/xu_ly_hang_loat.py --sqlite data/xla_vantay.db dang-ky data/anh_goc
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+# Set encoding cho Windows console
+if sys.platform == 'win32':
+    os.system('chcp 65001 > nul')
+
+# Thêm đường dẫn để import các module
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from database.ma_hoa_anh import ma_hoa_anh_nhi_phan
+from nhan_dang.fingerprint_pipeline import FingerprintPipeline, STAGES
+
+
+# Phần mở rộng ảnh được xử lý
+DUOI_ANH = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+# Tên các bước (theo thứ tự) để thống kê thời gian
+CAC_BUOC = ('doc_anh',) + tuple(STAGES)
+
+
+def tim_anh(thu_muc):
+    """
+    Duyệt thư mục (kể cả thư mục con) lấy các file ảnh theo thứ tự tên
+
+    Args:
+        thu_muc (str): Thư mục gốc
+
+    Yields:
+        str: Đường dẫn ảnh
+    """
+    for goc, cac_thu_muc, cac_file in os.walk(thu_muc):
+        cac_thu_muc.sort()
+        for ten in sorted(cac_file):
+            if ten.lower().endswith(DUOI_ANH):
+                yield os.path.join(goc, ten)
+
+
+def xu_ly_thu_muc(cac_anh, so_tien_trinh=1, trich_mo_ta=True, bo_nho_dem=None, cau_hinh=None,
+                  cac_buoc=None):
+    """
+    Xử lý danh sách ảnh trên nhiều tiến trình, trả kết quả ngay khi từng ảnh xong
+
+    Args:
+        cac_anh (iterable): Đường dẫn các ảnh
+        so_tien_trinh (int): Số tiến trình, 0 = theo số CPU, 1 = chạy tuần tự
+        trich_mo_ta (bool): Có trích descriptor (feature/lbp/ridge/frequency) không
+        bo_nho_dem (str): Thư mục bộ nhớ đệm đĩa (None = không nhớ), chạy lại
+            trên cùng thư mục ảnh sẽ lấy kết quả từ đây
+        cau_hinh (dict): Ghi đè cấu hình FingerprintPipeline (DEFAULT_CONFIG)
+        cac_buoc (tuple): Các bước cần kết quả (mặc định theo trich_mo_ta), ví dụ
+            ('nhi_phan_hoa',) khi chỉ cần ảnh nhị phân
+
+    Yields:
+        dict: Kết quả FingerprintPipeline ('duong_dan', 'anh_nhi_phan', 'anh_manh',
+              'minutiae', 'mo_ta', 'thoi_gian', 'loi'), theo thứ tự xong
+    """
+    # Mỗi ảnh chỉ đi qua một lần nên chỉ nhớ khi có bộ nhớ đệm đĩa
+    pipeline = FingerprintPipeline(cau_hinh, cache=False) if bo_nho_dem is None else \
+        FingerprintPipeline(cau_hinh, cache_dir=bo_nho_dem)
+    if cac_buoc is None:
+        cac_buoc = ('nhi_phan_hoa', 'minutiae', 'mo_ta') if trich_mo_ta else \
+            ('nhi_phan_hoa', 'lam_manh', 'minutiae')
+    # Ẩn log của các hàm xử lý để không lẫn với dòng kết quả
+    for _, ket_qua in pipeline.process_many(cac_anh, cac_buoc, workers=so_tien_trinh,
+                                            ordered=False, quiet=True):
+        yield ket_qua
+
+
+class ThongKe:
+    """Đếm số ảnh và cộng dồn thời gian từng bước để in ở cuối"""
+
+    def __init__(self):
+        self.bat_dau = time.perf_counter()
+        self.so_anh = 0
+        self.so_loi = 0
+        self.thoi_gian_buoc = dict.fromkeys(CAC_BUOC, 0.0)
+
+    def them(self, ket_qua):
+        """Ghi nhận kết quả một ảnh"""
+        self.so_anh += 1
+        if ket_qua['loi']:
+            self.so_loi += 1
+        for ten, giay in ket_qua['thoi_gian'].items():
+            self.thoi_gian_buoc[ten] = self.thoi_gian_buoc.get(ten, 0.0) + giay
+
+    def in_ket_qua(self, so_tien_trinh, **dem_them):
+        """In thống kê tốc độ"""
+        tong = time.perf_counter() - self.bat_dau
+        print("=" * 60)
+        print(f"Số ảnh:          {self.so_anh} (lỗi: {self.so_loi})")
+        for ten, gia_tri in dem_them.items():
+            print(f"{ten + ':':<17}{gia_tri}")
+        print(f"Tổng thời gian:  {tong:.2f} s")
+        print(f"Tốc độ:          {self.so_anh / max(tong, 1e-9):.2f} ảnh/s "
+              f"({so_tien_trinh} tiến trình)")
+        so_anh_ok = max(self.so_anh - self.so_loi, 1)
+        print("Thời gian trung bình mỗi bước (ms/ảnh):")
+        for ten, giay in self.thoi_gian_buoc.items():
+            if giay > 0:
+                print(f"  {ten:<12} {giay * 1000 / so_anh_ok:9.2f}")
+
+
+def _ket_noi_database(args):
+    """Kết nối database (chỉ import mysql khi cần ghi/đọc database)"""
+    from database.database_manager import create_database_manager
+    db = create_database_manager(args.sqlite, host=args.host, user=args.user,
+                                 password=args.password, database=args.database)
+    if not db.connect():
+        raise SystemExit("Không thể kết nối database")
+    return db
+
+
+def _ten_nguoi_dung_va_ngon(duong_dan, args):
+    """Lấy (username, tên ngón) cho một ảnh theo cách đặt tên của thư mục"""
+    ten_file = os.path.splitext(os.path.basename(duong_dan))[0]
+    if args.theo_thu_muc:
+        # kho_anh/<username>/<ngón>.jpg
+        return os.path.basename(os.path.dirname(os.path.abspath(duong_dan))), ten_file
+    return ten_file, args.ngon
+
+
+def _ghi_lo(db, lo, args):
+    """
+    Ghi một lô mẫu vào database: người dùng chưa có và vân tay được thêm hàng
+    loạt (executemany) trong một giao dịch
+
+    Vân tay đã có (cùng người dùng, ngón, tay) được bỏ qua, hoặc ghi đè nếu
+    có --ghi-de. Không có --ghi-de thì ảnh đã đăng ký được bỏ từ trước khi xử
+    lý (_bo_anh_da_dang_ky), ở đây chỉ còn gặp vân tay được ghi sau lúc tra.
+
+    Returns:
+        dict: Số mẫu 'ghi' (thêm mới), 'cap_nhat', 'bo_qua' (đã có), 'loi' (ghi lỗi)
+    """
+    from nhan_dang.fingerprint_recognition import FingerprintRecognition
+
+    dem = dict.fromkeys(('ghi', 'cap_nhat', 'bo_qua', 'loi'), 0)
+    mau = [(ket_qua, *_ten_nguoi_dung_va_ngon(ket_qua['duong_dan'], args)) for ket_qua in lo]
+    cap_nhat = []
+    with db.transaction():
+        users = db.get_users_by_usernames(username for _, username, _ in mau)
+        moi = [username for username in dict.fromkeys(username for _, username, _ in mau)
+               if username not in users]
+        if moi:
+            user_ids = db.add_users_bulk([{'username': username, 'full_name': username}
+                                          for username in moi], args.lo_ghi)
+            users.update({username: {'user_id': user_id}
+                          for username, user_id in zip(moi, user_ids) if user_id})
+
+        # Vân tay đã đăng ký ở lần chạy trước (khóa duy nhất người dùng, ngón, tay)
+        da_co = db.get_fingerprint_ids_by_users(user['user_id'] for user in users.values())
+
+        fingerprints, nguon = [], []
+        for ket_qua, username, ngon in mau:
+            if username not in users:
+                print(f"  ✗ Lỗi ghi {ket_qua['duong_dan']}: không thêm được người dùng {username}")
+                dem['loi'] += 1
+                continue
+            user_id = users[username]['user_id']
+            fingerprint_id = da_co.get((user_id, ngon.lower(), args.tay.lower()))
+            if fingerprint_id and not args.ghi_de:
+                dem['bo_qua'] += 1
+                continue
+            fingerprint = {FingerprintRecognition.DESCRIPTORS[pp][0]: mo_ta.to_bytes()
+                           for pp, mo_ta in ket_qua['mo_ta'].items()}
+            fingerprint.update(minutiae_data=ket_qua['minutiae'],
+                               binary_image_data=ma_hoa_anh_nhi_phan(ket_qua['anh_nhi_phan']))
+            if fingerprint_id:
+                cap_nhat.append((ket_qua, fingerprint_id, fingerprint))
+                continue
+            fingerprint.update(user_id=user_id, finger_name=ngon, hand=args.tay)
+            fingerprints.append(fingerprint)
+            nguon.append(ket_qua)
+        fingerprint_ids = db.add_fingerprints_bulk(fingerprints, args.lo_ghi)
+
+    for ket_qua, fingerprint_id in zip(nguon, fingerprint_ids):
+        if fingerprint_id:
+            dem['ghi'] += 1
+        else:
+            print(f"  ✗ Lỗi ghi {ket_qua['duong_dan']}: không lưu được vân tay")
+            dem['loi'] += 1
+
+    # Ghi đè từng vân tay (ngoài giao dịch: một bản ghi lỗi không hủy cả lô)
+    for ket_qua, fingerprint_id, fingerprint in cap_nhat:
+        fingerprint['minutiae_data'] = json.dumps(fingerprint['minutiae_data'])
+        if db.update_fingerprint(fingerprint_id, **fingerprint):
+            dem['cap_nhat'] += 1
+        else:
+            print(f"  ✗ Lỗi ghi {ket_qua['duong_dan']}: không cập nhật được vân tay")
+            dem['loi'] += 1
+    return dem
+
+
+def _bo_anh_da_dang_ky(db, cac_anh, args, dem):
+    """
+    Bỏ các ảnh có vân tay đã đăng ký (cùng người dùng, ngón, tay) trước khi xử lý,
+    tra database theo từng nhóm args.lo_ghi ảnh
+
+    Args:
+        db: Database đang kết nối
+        cac_anh (iterable): Đường dẫn các ảnh
+        args: Tham số dòng lệnh (theo_thu_muc, ngon, tay, lo_ghi)
+        dem (dict): Số đếm của dang_ky, ảnh bị bỏ được cộng vào 'bo_qua'
+
+    Yields:
+        str: Đường dẫn ảnh chưa đăng ký
+    """
+    nhom = []
+    for duong_dan in cac_anh:
+        nhom.append(duong_dan)
+        if len(nhom) >= args.lo_ghi:
+            yield from _loc_nhom_da_dang_ky(db, nhom, args, dem)
+            nhom = []
+    if nhom:
+        yield from _loc_nhom_da_dang_ky(db, nhom, args, dem)
+
+
+def _loc_nhom_da_dang_ky(db, nhom, args, dem):
+    """Các ảnh trong nhóm chưa có vân tay trong database (xem _bo_anh_da_dang_ky)"""
+    mau = [(duong_dan, *_ten_nguoi_dung_va_ngon(duong_dan, args)) for duong_dan in nhom]
+    users = db.get_users_by_usernames(username for _, username, _ in mau)
+    da_co = db.get_fingerprint_ids_by_users(user['user_id'] for user in users.values())
+    con_lai = []
+    for duong_dan, username, ngon in mau:
+        user = users.get(username)
+        if user and (user['user_id'], ngon.lower(), args.tay.lower()) in da_co:
+            dem['bo_qua'] += 1
+        else:
+            con_lai.append(duong_dan)
+    return con_lai
+
+
+def _cong_dem(dem, dem_lo):
+    """Cộng số đếm của một lô ghi vào tổng"""
+    for khoa, gia_tri in dem_lo.items():
+        dem[khoa] += gia_tri
+
+
+def dang_ky(args):
+    """Đăng ký mọi ảnh trong thư mục vào database"""
+    db = None if args.khong_ghi else _ket_noi_database(args)
+    thong_ke = ThongKe()
+    lo = []
+    dem = dict.fromkeys(('ghi', 'cap_nhat', 'bo_qua', 'loi'), 0)
+    cac_anh = tim_anh(args.thu_muc)
+    if db is not None and not args.ghi_de:
+        # Ảnh đã đăng ký ở lần chạy trước không cần xử lý lại
+        cac_anh = _bo_anh_da_dang_ky(db, cac_anh, args, dem)
+    for ket_qua in xu_ly_thu_muc(cac_anh, args.so_tien_trinh,
+                                  bo_nho_dem=args.bo_nho_dem, cau_hinh={'gabor_mode': args.gabor}):
+        thong_ke.them(ket_qua)
+        ten = os.path.relpath(ket_qua['duong_dan'], args.thu_muc)
+        if ket_qua['loi']:
+            print(f"[{thong_ke.so_anh:6d}] ✗ {ten}: {ket_qua['loi']}")
+            continue
+
+        minutiae = ket_qua['minutiae']
+        so_minutiae = len(minutiae['endings']) + len(minutiae['bifurcations'])
+        print(f"[{thong_ke.so_anh:6d}] ✓ {ten}: {so_minutiae} minutiae, "
+              f"{sum(ket_qua['thoi_gian'].values()):.2f} s")
+
+        if db is not None:
+            # Chỉ giữ phần cần ghi để lô chờ ghi chiếm ít bộ nhớ
+            lo.append({khoa: ket_qua[khoa] for khoa in
+                       ('duong_dan', 'anh_nhi_phan', 'minutiae', 'mo_ta')})
+            if len(lo) >= args.lo_ghi:
+                _cong_dem(dem, _ghi_lo(db, lo, args))
+                lo = []
+
+    if lo:
+        _cong_dem(dem, _ghi_lo(db, lo, args))
+    dem_them = {}
+    if db is not None:
+        db.disconnect()
+        dem_them = {'Đã ghi': dem['ghi'], 'Đã có (bỏ qua)': dem['bo_qua'], 'Lỗi ghi': dem['loi']}
+        if args.ghi_de:
+            dem_them['Đã ghi đè'] = dem['cap_nhat']
+    thong_ke.in_ket_qua(args.so_tien_trinh, **dem_them)
+
+
+
+def nhan_dang(args):
+    """Nhận dạng mọi ảnh trong thư mục với các mẫu trong database"""
+    from nhan_dang.fingerprint_recognition import FingerprintRecognition
+
+    db = _ket_noi_database(args)
+    recognition = FingerprintRecognition(db)
+    threshold = db.get_setting('matching_threshold')
+    if threshold:
+        recognition.set_threshold(float(threshold))
+    if args.luu_lich_su:
+        # Ghi lịch sử theo lô ở luồng nền, không chờ từng INSERT
+        recognition.enable_async_history()
+
+    nguong = recognition._get_threshold_for_method(args.phuong_phap)
+
+    thong_ke = ThongKe()
+    so_khop_duoc = 0
+    can_anh_xu_ly = args.phuong_phap != 'minutiae'
+    # Phương pháp dựa trên ảnh chỉ cần ảnh nhị phân, không làm mảnh/trích minutiae
+    cac_buoc = ('nhi_phan_hoa',) if can_anh_xu_ly else None
+    for ket_qua in xu_ly_thu_muc(tim_anh(args.thu_muc), args.so_tien_trinh, trich_mo_ta=False,
+                                  bo_nho_dem=args.bo_nho_dem, cau_hinh={'gabor_mode': args.gabor},
+                                  cac_buoc=cac_buoc):
+        thong_ke.them(ket_qua)
+        ten = os.path.relpath(ket_qua['duong_dan'], args.thu_muc)
+        if ket_qua['loi']:
+            print(f"[{thong_ke.so_anh:6d}] ✗ {ten}: {ket_qua['loi']}")
+            continue
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = recognition.identify_user_from_image(
+                ket_qua.get('anh_manh'), ket_qua.get('minutiae'), args.phuong_phap,
+                anh_xu_ly=ket_qua['anh_nhi_phan'] if can_anh_xu_ly else None
+            )
+        if results:
+            # identify_user_from_image trả về các kết quả tốt nhất cả khi chưa
+            # vượt ngưỡng, chỉ tính là nhận dạng được khi điểm cao nhất vượt ngưỡng
+            tot_nhat = results[0]
+            diem = tot_nhat.get('similarity_score', 0)
+            is_match = diem > nguong
+            if is_match:
+                so_khop_duoc += 1
+                print(f"[{thong_ke.so_anh:6d}] ✓ {ten} -> {tot_nhat.get('username')} ({diem:.2f})")
+            else:
+                print(f"[{thong_ke.so_anh:6d}] - {ten}: không khớp "
+                      f"(gần nhất {tot_nhat.get('username')} {diem:.2f} <= {nguong:.2f})")
+            if args.luu_lich_su:
+                recognition.save_match_record(
+                    tot_nhat.get('user_id'), tot_nhat.get('fingerprint_id'),
+                    ket_qua['duong_dan'], args.phuong_phap, diem, is_match
+                )
+        else:
+            print(f"[{thong_ke.so_anh:6d}] - {ten}: không tìm thấy")
+
+    recognition.close()
+    db.disconnect()
+    thong_ke.in_ket_qua(args.so_tien_trinh, **{'Nhận dạng được': so_khop_duoc})
+
+
+def chuyen_doi(args):
+    """Chuyển ảnh nhị phân PNG cũ sang định dạng packbits và trích descriptor còn thiếu"""
+    from nhan_dang.fingerprint_recognition import FingerprintRecognition
+
+    db = _ket_noi_database(args)
+    recognition = FingerprintRecognition(db)
+    bat_dau = time.perf_counter()
+    so_anh = recognition.migrate_binary_images(args.lo_ghi)
+    so_mo_ta = recognition.backfill_descriptors()
+    recognition.close()
+    db.disconnect()
+
+    print("=" * 60)
+    print(f"Ảnh nhị phân đã chuyển đổi: {so_anh}")
+    print(f"Vân tay được bổ sung descriptor: {so_mo_ta}")
+    print(f"Tổng thời gian: {time.perf_counter() - bat_dau:.2f} s")
+
+
+def tao_parser():
+    """Tạo bộ phân tích tham số dòng lệnh"""
+    parser = argparse.ArgumentParser(description="Xử lý hàng loạt ảnh vân tay (không giao diện)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='123456')
+    parser.add_argument('--database', default='xla_vantay')
+    parser.add_argument('--sqlite', metavar='DUONG_DAN',
+                        help="Dùng database SQLite (file) thay cho MySQL")
+    lenh = parser.add_subparsers(dest='lenh', required=True)
+
+    def them_chung(p):
+        p.add_argument('thu_muc', nargs='?', default=os.path.join('data', 'anh_goc'),
+                       help="Thư mục ảnh (duyệt cả thư mục con)")
+        p.add_argument('--so-tien-trinh', type=int, default=0,
+                       help="Số tiến trình xử lý ảnh (0 = theo số CPU, 1 = tuần tự)")
+        p.add_argument('--bo-nho-dem', metavar='THU_MUC', default=None,
+                       help="Thư mục bộ nhớ đệm kết quả từng bước (chạy lại không xử lý lại ảnh)")
+        p.add_argument('--gabor', default='toan_anh', choices=('toan_anh', 'theo_huong'),
+                       help="Tăng cường Gabor: cả ảnh ở mọi hướng, hoặc mỗi khối theo hướng và "
+                            "bước sóng vân (nhị phân hóa theo dấu, so sánh bằng do_hieu_nang.py); "
+                            "đăng ký và nhận dạng nên dùng cùng chế độ")
+
+    p = lenh.add_parser('dang-ky', help="Đăng ký mẫu vân tay vào database")
+    them_chung(p)
+    p.add_argument('--lo-ghi', type=int, default=100, help="Số mẫu mỗi lô ghi database")
+    p.add_argument('--theo-thu-muc', action='store_true',
+                   help="Tên thư mục con là username, tên file là tên ngón")
+    p.add_argument('--ngon', default='Index', help="Tên ngón (khi username lấy theo tên file)")
+    p.add_argument('--tay', default='Right', choices=('Left', 'Right'))
+    p.add_argument('--khong-ghi', action='store_true',
+                   help="Chỉ xử lý và đo tốc độ, không ghi database")
+    p.add_argument('--ghi-de', action='store_true',
+                   help="Ghi đè vân tay đã đăng ký (mặc định bỏ qua)")
+    p.set_defaults(ham=dang_ky)
+
+    p = lenh.add_parser('nhan-dang', help="Nhận dạng từng ảnh với các mẫu trong database")
+    them_chung(p)
+    p.add_argument('--phuong-phap', default='minutiae',
+                   choices=('minutiae', 'feature', 'lbp', 'ridge', 'frequency'))
+    p.add_argument('--luu-lich-su', action='store_true',
+                   help="Lưu kết quả tốt nhất vào matching_history")
+    p.set_defaults(ham=nhan_dang)
+
+    p = lenh.add_parser('chuyen-doi', help="Chuyển dữ liệu database cũ sang định dạng mới")
+    p.add_argument('--lo-ghi', type=int, default=200, help="Số vân tay mỗi lô đọc/ghi")
+    p.set_defaults(ham=chuyen_doi, so_tien_trinh=1)
+    return parser
+
+
+def main(argv=None):
+    """Hàm main"""
+    args = tao_parser().parse_args(argv)
+    args.so_tien_trinh = args.so_tien_trinh if args.so_tien_trinh > 0 else (os.cpu_count() or 1)
+    args.ham(args)
+
+
+if __name__ == "__main__":
+    main()